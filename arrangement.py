@@ -0,0 +1,132 @@
+import heapq
+import threading
+import time
+from collections import namedtuple
+from concurrent.futures import ThreadPoolExecutor
+import numpy as np
+from midi_encoder import TICKS_PER_BEAT, TrackEvents, note_events, encode_track, encode_smf
+
+PartNotes = namedtuple('PartNotes', ['start', 'duration', 'pitch', 'velocity'])
+Part = namedtuple('Part', ['name', 'channel', 'program', 'generate'])
+
+
+def part_notes(notes):
+    start, duration, pitch, velocity = zip(*notes) if notes else ((), (), (), ())
+    return PartNotes(np.array(start, dtype=float), np.array(duration, dtype=float),
+                     np.array(pitch, dtype=np.int64), np.array(velocity, dtype=np.int64))
+
+
+def chord_part(voicings, beats_per_chord, velocity=90):
+    return part_notes([(i * beats_per_chord, beats_per_chord, note, velocity)
+                       for i, voicing in enumerate(voicings) if voicing is not None
+                       for note in voicing])
+
+
+def bass_part(voicings, beats_per_chord, velocity=100, lowest=36):
+    # The lowest voice, dropped into the bass octave
+    notes = []
+    for i, voicing in enumerate(voicings):
+        if voicing is not None:
+            notes.append((i * beats_per_chord, beats_per_chord, lowest + (min(voicing) - lowest) % 12, velocity))
+    return part_notes(notes)
+
+
+def arpeggiator(direction='up', step=0.5, octave=12, velocity=80):
+    """Part generator cycling through each voicing ('up', 'down' or 'updown') every ``step`` beats."""
+    def generate(voicings, beats_per_chord):
+        notes = []
+        steps = int(round(beats_per_chord / step))
+        for i, voicing in enumerate(voicings):
+            if voicing is None:
+                continue
+            order = sorted(set(voicing))
+            if direction == 'down':
+                order.reverse()
+            elif direction == 'updown':
+                order = order + order[-2:0:-1]
+            for j in range(steps):
+                notes.append((i * beats_per_chord + j * step, step, order[j % len(order)] + octave, velocity))
+        return part_notes(notes)
+    return generate
+
+
+# General MIDI programs: piano, fingered bass, square lead, harp
+DEFAULT_PARTS = (
+    Part('chord', 0, 0, chord_part),
+    Part('bass', 1, 33, bass_part),
+    Part('arp_a', 2, 80, arpeggiator('up', 0.5, 12)),
+    Part('arp_b', 3, 46, arpeggiator('updown', 0.25, 24, velocity=65)),
+)
+
+
+class Arrangement:
+    """Renders a voice-led progression as several parts, one MIDI channel each.
+
+    Every part generator takes the voicings (MIDI note tuples, or None for a
+    silent slot) and returns its own notes, so parts render independently
+    and batches render them concurrently. Render time is kept per part.
+    """
+
+    def __init__(self, parts=DEFAULT_PARTS, beats_per_chord=2, workers=4):
+        self.parts = parts
+        self.beats_per_chord = beats_per_chord
+        self.workers = workers
+        self.lock = threading.Lock()
+        self.timings = {part.name: {'renders': 0, 'last_ms': 0.0, 'total_ms': 0.0} for part in parts}
+
+    def render_part(self, part, voicings):
+        start = time.perf_counter()
+        notes = part.generate(voicings, self.beats_per_chord)
+        elapsed = (time.perf_counter() - start) * 1000
+        with self.lock:
+            timing = self.timings[part.name]
+            timing['renders'] += 1
+            timing['last_ms'] = elapsed
+            timing['total_ms'] += elapsed
+        return notes
+
+    def render(self, voicings):
+        return {part.name: self.render_part(part, voicings) for part in self.parts}
+
+    def render_batch(self, progressions):
+        """Render every part of every progression on a thread pool; returns one dict per progression."""
+        with ThreadPoolExecutor(max_workers=self.workers) as executor:
+            futures = [{part.name: executor.submit(self.render_part, part, voicings) for part in self.parts}
+                       for voicings in progressions]
+            return [{name: future.result() for name, future in parts.items()} for parts in futures]
+
+    def timing_summary(self):
+        with self.lock:
+            return {name: dict(timing, mean_ms=timing['total_ms'] / timing['renders'] if timing['renders'] else 0.0)
+                    for name, timing in self.timings.items()}
+
+    def length(self, voicings):
+        return self.beats_per_chord * len(voicings)
+
+    def track_events(self, part, notes, ticks_per_beat=TICKS_PER_BEAT):
+        events = note_events(notes.start, notes.duration, notes.pitch, notes.velocity, part.channel, ticks_per_beat)
+        if part.program is None:
+            return events
+        return TrackEvents(*(np.concatenate(([value], array)) for value, array in
+                             zip((0, 0xC0 | part.channel, part.program, 0), events)))
+
+    def to_smf(self, rendered, length, tempo, name, ticks_per_beat=TICKS_PER_BEAT):
+        """A format 1 file: a tempo track, then one track per part."""
+        tracks = [encode_track(name=name, tempo=tempo, end_tick=int(length * ticks_per_beat))]
+        for part in self.parts:
+            tracks.append(encode_track(self.track_events(part, rendered[part.name], ticks_per_beat), name=part.name,
+                                       end_tick=int(length * ticks_per_beat)))
+        return encode_smf(tracks, ticks_per_beat)
+
+    def sequencer_events(self, rendered):
+        """All parts as one (beat, priority, message) stream, k-way merged from the per-part streams."""
+        import mido
+        from midi_sequencer import NOTE_OFF_PRIORITY, NOTE_ON_PRIORITY
+
+        def stream(part):
+            events = note_events(*rendered[part.name], channel=part.channel)
+            for tick, status, data1, data2 in zip(*(array.tolist() for array in events)):
+                priority = NOTE_ON_PRIORITY if status & 0xF0 == 0x90 else NOTE_OFF_PRIORITY
+                yield tick / TICKS_PER_BEAT, priority, mido.Message.from_bytes([status, data1, data2])
+
+        return list(heapq.merge(*(stream(part) for part in self.parts), key=lambda event: event[:2]))
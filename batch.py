@@ -0,0 +1,209 @@
+"""Offline batch generation: render a whole library of progressions to MIDI files.
+
+Run from the repository root: python batch.py jobs.json [--workers N] [--llm-concurrency N]
+
+The job spec is a JSON object; every field is optional:
+
+    {
+        "output": "batch_output",
+        "source": "random",          # or "ollama"
+        "keys": ["C", "Am"],         # defaults to all 24 major and minor keys
+        "artists": [null, "The Beatles"],
+        "lengths": [4, 8],
+        "variants": 1,
+        "tempo": 90,
+        "arrange": false
+    }
+
+Each key x artist x length x variant combination is one job. Files go to
+sharded directories under the output directory and every finished job is
+appended to manifest.jsonl there; running the same spec again skips
+everything already in the manifest, so an interrupted run resumes. An
+"ollama" job that gets no answer from Ollama is left out of the manifest
+rather than rendered from a local fallback, so the next run retries it.
+"""
+import argparse
+import hashlib
+import json
+import logging
+import multiprocessing
+import os
+import random
+import re
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor, FIRST_COMPLETED, wait
+
+VALID_KEYS = ['C', 'C#', 'D', 'D#', 'E', 'F', 'F#', 'G', 'G#', 'A', 'A#', 'B']
+MANIFEST = "manifest.jsonl"
+
+player = None
+llm_slots = None
+
+
+def expand_jobs(spec):
+    keys = spec.get("keys") or VALID_KEYS + [key + 'm' for key in VALID_KEYS]
+    for key in keys:
+        if key.rstrip('m') not in VALID_KEYS:
+            raise ValueError(f"Invalid key in job spec: {key}")
+    jobs = []
+    for key in keys:
+        for artist in spec.get("artists") or [None]:
+            for length in spec.get("lengths") or [4]:
+                for variant in range(spec.get("variants", 1)):
+                    job = {'key': key, 'artist': artist, 'length': length, 'variant': variant,
+                           'source': spec.get("source", "random"), 'tempo': spec.get("tempo", 60),
+                           'arrange': spec.get("arrange", False)}
+                    job['id'] = hashlib.sha1(json.dumps(job, sort_keys=True).encode()).hexdigest()[:16]
+                    jobs.append(job)
+    return jobs
+
+
+def job_path(output, job):
+    # Two hex digits of the job id give 256 evenly filled shard directories
+    artist = re.sub(r'[^a-z0-9]+', '-', (job['artist'] or 'any').lower()).strip('-')
+    name = f"{job['key']}_{job['length']}_{artist}_{job['variant']}_{job['id']}.mid"
+    return os.path.join(output, job['id'][:2], name)
+
+
+def read_manifest(output):
+    done = {}
+    path = os.path.join(output, MANIFEST)
+    if not os.path.exists(path):
+        return done
+    with open(path) as f:
+        for line in f:
+            try:
+                record = json.loads(line)
+            except json.JSONDecodeError:
+                continue  # A run killed mid-write leaves a partial last line
+            if os.path.exists(os.path.join(output, record['path'])):
+                done[record['id']] = record
+    return done
+
+
+def init_worker(slots):
+    global player, llm_slots
+    from chord_player import ChordProgressionPlayer
+    logging.getLogger().setLevel(logging.WARNING)
+    # No prefetch worker; the progression cache is shared between the workers (and
+    # with the CLI) and waits out their writes, so a rerun finds every stored answer
+    player = ChordProgressionPlayer(prefetch=False)
+    # Every variant has its own cache key, so a rerun gets back exactly the answer stored for it
+    player.cache_first = True
+    player.progression_cache.avoid_repeats = 0
+    llm_slots = slots
+
+
+def run_job(job, output):
+    from arrangement import Arrangement
+    from chord_player import generation_request
+    start = time.perf_counter()
+    random.seed(job['id'])
+    player.key = job['key'].rstrip('m')
+    player.is_minor = job['key'].endswith('m')
+    player.progression_length = job['length']
+    player.artist_to_emulate = job['artist']
+    player.tempo = job['tempo']
+    player.arrangement = Arrangement() if job['arrange'] else None
+    player.current_progression = []
+
+    if job['source'] == "ollama":
+        # Variants get their own cache entries so a rerun reproduces each of them
+        request = generation_request(player.key, player.is_minor, job['length'], job['artist'], variant=job['variant'])
+        with llm_slots:
+            progression_string = player.fetch_progression(request)
+        if not progression_string:
+            return None  # Still pending: the next run asks Ollama again
+        progression = player.progression_from_string(progression_string)
+    else:
+        progression = player.generate_random_progression()
+
+    path = job_path(output, job)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path + ".tmp", "wb") as f:
+        f.write(player.render_midi(progression))
+    os.replace(path + ".tmp", path)  # Never leave a truncated file under the final name
+
+    return dict(job, path=os.path.relpath(path, output),
+                progression=[player.format_chord(chord) for chord in progression],
+                seconds=round(time.perf_counter() - start, 4))
+
+
+def run_batch(spec, workers=None, llm_concurrency=2):
+    output = spec.get("output", "batch_output")
+    os.makedirs(output, exist_ok=True)
+    jobs = expand_jobs(spec)
+    done = read_manifest(output)
+    pending_jobs = [job for job in jobs if job['id'] not in done]
+    print(f"{len(jobs)} jobs, {len(jobs) - len(pending_jobs)} already done, {len(pending_jobs)} to run")
+
+    workers = workers or os.cpu_count() or 1
+    slots = multiprocessing.get_context().BoundedSemaphore(llm_concurrency)
+    failures = 0
+    unanswered = 0
+    completed = 0
+    started = time.perf_counter()
+    with open(os.path.join(output, MANIFEST), "a+b") as manifest, \
+            ProcessPoolExecutor(max_workers=workers, initializer=init_worker, initargs=(slots,)) as executor:
+        if manifest.tell():
+            manifest.seek(-1, os.SEEK_END)
+            if manifest.read(1) != b"\n":
+                manifest.write(b"\n")  # Terminate a partial line left by a killed run
+        remaining = iter(pending_jobs)
+        in_flight = {}
+        try:
+            while True:
+                # Keep a bounded window of submitted jobs instead of queueing the whole library
+                for job in remaining:
+                    in_flight[executor.submit(run_job, job, output)] = job
+                    if len(in_flight) >= workers * 4:
+                        break
+                if not in_flight:
+                    break
+                finished, _ = wait(in_flight, return_when=FIRST_COMPLETED)
+                for future in finished:
+                    job = in_flight.pop(future)
+                    try:
+                        record = future.result()
+                    except Exception as e:
+                        failures += 1
+                        logging.error(f"Job {job['id']} ({job['key']}, {job['artist']}, {job['length']}) failed: {e}")
+                        continue
+                    if record is None:
+                        unanswered += 1
+                        continue
+                    manifest.write(json.dumps(record).encode() + b"\n")
+                    manifest.flush()
+                    completed += 1
+                    if completed % 100 == 0:
+                        print(f"{completed}/{len(pending_jobs)} done ({completed / (time.perf_counter() - started):.1f} jobs/s)")
+        except KeyboardInterrupt:
+            executor.shutdown(wait=False, cancel_futures=True)
+            print(f"Interrupted after {completed} jobs; run again to resume.")
+            raise
+
+    print(f"Finished {completed} jobs in {time.perf_counter() - started:.1f}s, {failures} failed")
+    if unanswered:
+        print(f"{unanswered} jobs got no answer from Ollama and are still pending; run again to retry them.")
+    return failures + unanswered
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Render a library of chord progressions to MIDI files")
+    parser.add_argument("spec", help="JSON job spec")
+    parser.add_argument("--workers", type=int, default=None, help="Worker processes (default: CPU count)")
+    parser.add_argument("--llm-concurrency", type=int, default=2, help="Ollama requests in flight across all workers")
+    args = parser.parse_args()
+
+    with open(args.spec) as f:
+        spec = json.load(f)
+    try:
+        incomplete = run_batch(spec, args.workers, args.llm_concurrency)
+    except KeyboardInterrupt:
+        sys.exit(130)
+    sys.exit(1 if incomplete else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,69 @@
+"""Compare the array-based SMF encoder with per-note MIDIUtil calls on long session files.
+
+Run from the repository root: python benchmarks/midi_encoder_benchmark.py [chords]
+
+Correctness (a mido round trip of the encoded files) is covered by tests/test_midi_encoder.py.
+"""
+import io
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from midiutil import MIDIFile
+from midi_encoder import note_events, encode_track, encode_smf
+
+BEATS_PER_CHORD = 2
+
+
+def build_session(chords, seed=0):
+    rng = random.Random(seed)
+    return [sorted(rng.sample(range(48, 73), 4)) for _ in range(chords)]
+
+
+def render_midiutil(session, tempo=120):
+    midi = MIDIFile(1)
+    midi.addTempo(0, 0, tempo)
+    for i, notes in enumerate(session):
+        for note in notes:
+            midi.addNote(0, 0, note, i * BEATS_PER_CHORD, BEATS_PER_CHORD, 100)
+    buffer = io.BytesIO()
+    midi.writeFile(buffer)
+    return buffer.getvalue()
+
+
+def session_events(session):
+    starts = [i * BEATS_PER_CHORD for i, notes in enumerate(session) for _ in notes]
+    notes = [note for chord in session for note in chord]
+    return note_events(starts, BEATS_PER_CHORD, notes, 100)
+
+
+def render_native(session, tempo=120):
+    return encode_smf([encode_track(session_events(session), tempo=tempo)])
+
+
+def measure(render, session, repeats=3):
+    best = None
+    for _ in range(repeats):
+        start = time.perf_counter()
+        data = render(session)
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return data, best
+
+
+def main():
+    chords = int(sys.argv[1]) if len(sys.argv) > 1 else 10000
+    session = build_session(chords)
+    notes = sum(len(chord) for chord in session)
+
+    for name, render in (('midiutil', render_midiutil), ('native', render_native)):
+        data, elapsed = measure(render, session)
+        print(f"{name:>8}: {chords} chords ({notes * 2} events, {len(data):,} bytes) in {elapsed:.3f}s "
+              f"({notes * 2 / elapsed:,.0f} events/s)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,81 @@
+"""Track cold-start cost of the interactive CLI using ``python -X importtime``.
+
+Run from the repository root: python benchmarks/startup_benchmark.py [--runs N] [--json results.json]
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+STARTUP_SNIPPET = """
+import time
+start = time.perf_counter()
+import main
+from chord_player import ChordProgressionPlayer
+player = ChordProgressionPlayer()
+print(time.perf_counter() - start)
+player.progression_cache.close()
+"""
+
+
+def parse_importtime(stderr):
+    # Lines look like: "import time:   self [us] | cumulative | imported package"
+    modules = {}
+    for line in stderr.splitlines():
+        if not line.startswith("import time:") or "imported package" in line:
+            continue
+        self_us, cumulative_us, name = line[len("import time:"):].split("|")
+        modules[name.strip()] = (int(self_us), int(cumulative_us))
+    return modules
+
+
+def run_once():
+    result = subprocess.run([sys.executable, "-X", "importtime", "-c", STARTUP_SNIPPET],
+                            cwd=ROOT, capture_output=True, text=True, check=True)
+    return float(result.stdout.strip().splitlines()[-1]), parse_importtime(result.stderr)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--top", type=int, default=10)
+    parser.add_argument("--json", help="write the results to this file")
+    args = parser.parse_args()
+
+    startup_times = []
+    import_times = []
+    modules = {}
+    for _ in range(args.runs):
+        startup, modules = run_once()
+        startup_times.append(startup)
+        import_times.append(modules.get("main", (0, 0))[1] / 1e6)
+
+    heavy = {name: modules.get(name, (0, 0))[1] / 1e6 for name in ("music21", "pygame", "mido", "requests")}
+    slowest = sorted(modules.items(), key=lambda item: item[1][0], reverse=True)[:args.top]
+    results = {
+        "runs": args.runs,
+        "startup_median_s": statistics.median(startup_times),
+        "import_main_median_s": statistics.median(import_times),
+        "heavy_modules_at_startup_s": heavy,
+        "slowest_self_imports_s": {name: times[0] / 1e6 for name, times in slowest},
+    }
+
+    print(f"startup (import main + player): {results['startup_median_s'] * 1000:.1f} ms median of {args.runs}")
+    print(f"import main: {results['import_main_median_s'] * 1000:.1f} ms")
+    for name, seconds in heavy.items():
+        print(f"  {name:<10} {'not imported' if not seconds else f'{seconds * 1000:.1f} ms'}")
+    print("slowest modules (self time):")
+    for name, seconds in results["slowest_self_imports_s"].items():
+        print(f"  {name:<40} {seconds * 1000:.1f} ms")
+
+    if args.json:
+        with open(args.json, "w") as output:
+            json.dump(results, output, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,287 @@
+"""Benchmark suite over the real entry points, with JSON baselines and regression checks.
+
+Run from the repository root:
+
+    python benchmarks/suite.py --save benchmarks/baseline.json      # record a baseline
+    python benchmarks/suite.py --compare benchmarks/baseline.json   # fail on regressions
+    python benchmarks/suite.py --cases parse,voice_leading --sizes 4,1000
+
+Every case runs on synthetic, seeded corpora (4 to 10k chords by default),
+and Ollama is replaced by a stub, so runs are reproducible and offline. A
+case regresses when its fastest run grows by more than ``--threshold``
+(20% by default) over the baseline; the minimum only moves when the code
+does, while the median also picks up whatever else the machine is doing.
+The suite is run ``--rounds`` times, interleaved, and each case keeps its
+best round, so a slow stretch on a shared machine does not set the number;
+cases that still look slower are measured again (``--confirm``) before
+they are reported.
+The committed baseline.json was recorded on a single development machine;
+record your own before comparing.
+"""
+import argparse
+import gc
+import json
+import os
+import platform
+import random
+import statistics
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+DEFAULT_SIZES = (4, 64, 1000, 10000)
+ROMAN_FIGURES = ['I', 'ii', 'iii', 'IV', 'V', 'vi', 'vii°']
+CHORD_SYMBOLS = ['C', 'Cmaj7', 'Dm7', 'G7', 'Am', 'F', 'E7', 'Bdim', 'F#m7', 'Gsus4', 'C/E', 'G/B', 'D9', 'Aadd9']
+
+
+class StubOllamaAPI:
+    """Answers every prompt with a canned progression of the requested length.
+
+    Structured replies go through the same stream parser as Ollama's, one
+    chord per chunk, so the generate case times parsing and validation too.
+    """
+
+    def __init__(self, seed=0):
+        self.rng = random.Random(seed)
+
+    def generate_progression_with_ollama(self, prompt, chord_limit=None, cancel=None):
+        return '-'.join(self.rng.choices(CHORD_SYMBOLS, k=chord_limit or 4))
+
+    def generate_chords(self, prompt, count, cancel=None):
+        from ollama_interface import ChordArrayStreamParser
+        parser = ChordArrayStreamParser()
+        items = [json.dumps(chord) for chord in self.rng.choices(CHORD_SYMBOLS, k=count)]
+        chords = parser.feed('{"chords": [')
+        for item in items[:-1]:
+            chords.extend(parser.feed(item + ', '))
+        chords.extend(parser.feed(items[-1] + ']}'))
+        return chords
+
+    def close(self):
+        pass
+
+
+def chord_corpus(size, seed=0, figures=CHORD_SYMBOLS + ROMAN_FIGURES):
+    return random.Random(seed).choices(figures, k=size)
+
+
+def make_player(size):
+    from chord_player import ChordProgressionPlayer
+    player = ChordProgressionPlayer(cache_path=":memory:", prefetch=False)
+    player.ollama_api = StubOllamaAPI()
+    player.progression_length = size
+    return player
+
+
+def setup_tokenize(size):
+    from chord_tokenizer import tokenize_progression
+    progression_string = '-'.join(chord_corpus(size))
+    return lambda: tokenize_progression(progression_string)
+
+
+def setup_parse(size):
+    player = make_player(size)
+    progression = chord_corpus(size)
+    player.parse_progression(progression)  # music21 lookups for new chord symbols are cached after the first call
+    return lambda: player.parse_progression(progression)
+
+
+def setup_voice_leading(size):
+    player = make_player(size)
+    progression = player.parse_progression(chord_corpus(size))
+    return lambda: player.apply_voice_leading(progression)
+
+
+def setup_create_midi_file(size):
+    player = make_player(size)
+    progression = player.parse_progression(chord_corpus(size))
+    path = os.path.join(tempfile.mkdtemp(), "benchmark.mid")
+    return lambda: player.create_midi_file(progression, filename=path)
+
+
+def setup_generate(size):
+    # The fetch, validate and parse steps of a generate command; interactive
+    # generates always ask the (stubbed) model rather than the cache.
+    player = make_player(size)
+
+    def run():
+        return player.progression_from_string(player.fetch_progression(player.generation_request()))
+    return run
+
+
+def setup_progression_events(size):
+    from midi_sequencer import Pattern
+    player = make_player(size)
+    progression = player.parse_progression(chord_corpus(size))
+
+    def run():
+        events, length = player.progression_events(progression)
+        return Pattern(events, length)
+    return run
+
+
+def setup_apply_rhythm(size):
+    import chord_rhythm
+    progression = chord_corpus(size, figures=ROMAN_FIGURES)
+
+    def run():
+        random.seed(0)
+        return chord_rhythm.apply_rhythm(progression)
+    return run
+
+
+def setup_rhythm_create_midi(size):
+    import chord_rhythm
+    progression = chord_corpus(size, figures=ROMAN_FIGURES)
+    chord_rhythm.load_rhythm_library()  # Cached against the relative path, so load it from the repository root
+    os.chdir(tempfile.mkdtemp())  # create_midi writes output.mid to the working directory
+
+    def run():
+        random.seed(0)
+        return chord_rhythm.create_midi(progression)
+    return run
+
+
+CASES = {
+    'tokenize': setup_tokenize,
+    'parse': setup_parse,
+    'voice_leading': setup_voice_leading,
+    'create_midi_file': setup_create_midi_file,
+    'generate': setup_generate,
+    'progression_events': setup_progression_events,
+    'apply_rhythm': setup_apply_rhythm,
+    'rhythm_create_midi': setup_rhythm_create_midi,
+}
+
+
+def measure(run, min_time=0.2, min_repeats=10, max_repeats=200, min_sample=0.001):
+    # Like timeit's autorange: fast cases run in loops of ``number`` calls so
+    # one sample never drops below ``min_sample`` and timer noise stays small.
+    # Also like timeit, the collector is off while timing, so a case does not
+    # pay for the garbage the cases before it left behind.
+    gc.collect()
+    gc_was_enabled = gc.isenabled()
+    gc.disable()
+    try:
+        return sample(run, min_time, min_repeats, max_repeats, min_sample)
+    finally:
+        if gc_was_enabled:
+            gc.enable()
+
+
+def sample(run, min_time, min_repeats, max_repeats, min_sample):
+    number = 1
+    while True:
+        start = time.perf_counter()
+        for _ in range(number):
+            run()
+        if time.perf_counter() - start >= min_sample:
+            break
+        number *= 2
+
+    times = []
+    started = time.perf_counter()
+    while len(times) < min_repeats or (time.perf_counter() - started < min_time and len(times) < max_repeats):
+        start = time.perf_counter()
+        for _ in range(number):
+            run()
+        times.append((time.perf_counter() - start) / number)
+    return {'median_s': statistics.median(times), 'min_s': min(times), 'repeats': len(times), 'number': number}
+
+
+def run_suite(runs, min_time, rounds=1):
+    rounds_by_run = {}
+    for _ in range(rounds):
+        for case, size in runs:
+            cwd = os.getcwd()
+            os.chdir(ROOT)
+            try:
+                result = measure(CASES[case](size), min_time)
+            finally:
+                os.chdir(cwd)
+            rounds_by_run.setdefault((case, size), []).append(result)
+
+    results = {}
+    for (case, size), measured in rounds_by_run.items():
+        result = dict(min(measured, key=lambda result: result['min_s']),
+                      repeats=sum(result['repeats'] for result in measured), rounds=len(measured))
+        result['chords_per_s'] = size / result['median_s']
+        results[f"{case}[{size}]"] = result
+        print(f"{case + f'[{size}]':<28} {result['median_s'] * 1000:>10.3f} ms median "
+              f"{result['min_s'] * 1000:>10.3f} ms min ({result['chords_per_s']:>12,.0f} chords/s, "
+              f"{result['repeats']} runs)")
+    return results
+
+
+def compare(results, baseline, threshold):
+    regressions = []
+    print(f"\nCompared with baseline ({baseline['meta']['python']}, {baseline['meta']['machine']}):")
+    for name, result in results.items():
+        previous = baseline['results'].get(name)
+        if previous is None:
+            print(f"{name:<28} new")
+            continue
+        ratio = result['min_s'] / previous['min_s']
+        flag = "REGRESSION" if ratio > 1 + threshold else "faster" if ratio < 1 - threshold else "ok"
+        print(f"{name:<28} {ratio:>6.2f}x  {flag}")
+        if flag == "REGRESSION":
+            regressions.append(name)
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the chord pipeline entry points")
+    parser.add_argument("--cases", default=','.join(CASES), help="comma separated, from: " + ', '.join(CASES))
+    parser.add_argument("--sizes", default=','.join(map(str, DEFAULT_SIZES)), help="corpus sizes in chords")
+    parser.add_argument("--min-time", type=float, default=0.2, help="seconds to spend on each case, size and round")
+    parser.add_argument("--rounds", type=int, default=3, help="times to run the whole suite; each case keeps its best")
+    parser.add_argument("--save", help="write the results to this baseline file")
+    parser.add_argument("--compare", help="compare against this baseline file")
+    parser.add_argument("--threshold", type=float, default=0.2, help="allowed slowdown before flagging, 0.2 = 20%%")
+    parser.add_argument("--confirm", type=int, default=2, help="times to re-measure apparent regressions")
+    args = parser.parse_args()
+
+    import logging
+    logging.disable(logging.INFO)  # The player logs every Ollama prompt
+    cases = args.cases.split(',')
+    unknown = [case for case in cases if case not in CASES]
+    if unknown:
+        parser.error(f"unknown cases: {', '.join(unknown)}")
+
+    random.seed(0)
+    runs = {f"{case}[{size}]": (case, int(size)) for case in cases for size in args.sizes.split(',')}
+    results = run_suite(runs.values(), args.min_time, args.rounds)
+
+    regressions = []
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+        regressions = compare(results, baseline, args.threshold)
+        for _ in range(args.confirm):
+            if not regressions:
+                break
+            # Noise only ever adds time, so a real regression survives a second look
+            print(f"\nMeasuring {len(regressions)} slower case(s) again")
+            for name, result in run_suite([runs[name] for name in regressions], args.min_time, args.rounds).items():
+                results[name] = min(results[name], result, key=lambda result: result['min_s'])
+            regressions = compare({name: results[name] for name in regressions}, baseline, args.threshold)
+
+    if args.save:
+        report = {
+            'meta': {'python': platform.python_version(), 'machine': platform.machine(),
+                     'platform': platform.platform(), 'created': time.strftime('%Y-%m-%dT%H:%M:%S')},
+            'results': results,
+        }
+        with open(args.save, "w") as output:
+            json.dump(report, output, indent=2)
+
+    if regressions:
+        print(f"\n{len(regressions)} regression(s): {', '.join(regressions)}")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
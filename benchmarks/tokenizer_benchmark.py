@@ -0,0 +1,68 @@
+"""Compare the compiled, memoized tokenizer with the original per-call regex version.
+
+Run from the repository root: python benchmarks/tokenizer_benchmark.py [progressions]
+"""
+import os
+import random
+import re
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from chord_tokenizer import tokenize_chord, tokenize_progressions
+from utils import ChordType, ROMAN_PATTERN, ROOT_PATTERN, QUALITY_PATTERN, EXTENSIONS_PATTERN, BASS_PATTERN
+
+CHORDS = ['C', 'Cmaj7', 'Dm7', 'G7', 'Am', 'F', 'E7', 'Bdim', 'F#m7', 'Bb', 'Ebmaj7', 'Gsus4', 'C/E', 'G/B',
+          'D9', 'Aadd9', 'I', 'IV', 'V', 'vi', 'ii', 'iii', 'vii°', 'Hm', 'X7']
+
+
+def legacy_tokenize_chord(chord_string):
+    chord_string = chord_string.strip()
+
+    roman_match = ROMAN_PATTERN.match(chord_string)
+    if roman_match:
+        return {'original': chord_string, 'type': ChordType.ROMAN, 'root': roman_match.group(),
+                'quality': None, 'extensions': None, 'bass': None}
+
+    chord_pattern = f"{ROOT_PATTERN.pattern}{QUALITY_PATTERN.pattern}{EXTENSIONS_PATTERN.pattern}{BASS_PATTERN.pattern}$"
+    match = re.match(chord_pattern, chord_string)
+    if match:
+        root, quality, extensions, bass = match.groups()
+        return {'original': chord_string, 'type': ChordType.CHORD_SYMBOL, 'root': root, 'quality': quality,
+                'extensions': re.findall(r'(?:maj|add|sus|[0-9])*[0-9]+', extensions) if extensions else None,
+                'bass': bass}
+
+    return {'original': chord_string, 'type': ChordType.INVALID, 'root': None, 'quality': None,
+            'extensions': None, 'bass': None}
+
+
+def legacy_tokenize_progressions(progression_strings):
+    for progression_string in progression_strings:
+        if progression_string.strip():
+            yield [legacy_tokenize_chord(chord) for chord in progression_string.split('-')]
+
+
+def build_corpus(progressions, seed=0):
+    rng = random.Random(seed)
+    return ['-'.join(rng.choices(CHORDS, k=rng.randint(4, 16))) for _ in range(progressions)]
+
+
+def measure(tokenize, corpus):
+    start = time.perf_counter()
+    chords = sum(len(tokens) for tokens in tokenize(corpus))
+    return chords, time.perf_counter() - start
+
+
+def main():
+    progressions = int(sys.argv[1]) if len(sys.argv) > 1 else 50000
+    corpus = build_corpus(progressions)
+    tokenize_chord.cache_clear()
+
+    for name, tokenize in (('legacy', legacy_tokenize_progressions), ('compiled', tokenize_progressions)):
+        chords, elapsed = measure(tokenize, corpus)
+        print(f"{name:>8}: {chords} chords in {elapsed:.3f}s ({chords / elapsed:,.0f} chords/s)")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,209 +1,328 @@
+import io
+import math
+import os
+import queue
 import threading
-import pygame
-import music21
+import time
 import random
 import logging
-from midiutil import MIDIFile
+from collections import namedtuple
 from chord_tokenizer import tokenize_progression, format_chord_token, tokenize_chord
-from ollama_interface import OllamaAPI
+from ollama_interface import Prefetcher
+from llm_router import OllamaRouter, endpoints_from_env
+from llm_validation import OutputValidator
+from progression_cache import ProgressionCache, cache_key
+from chord_resolver import QUALITY_MARKS, ResolvedChord, resolve_roman, resolve_chord_symbol
 from utils import ChordType
+from voicing import voice_lead, optimal_voice_lead
+import instrumentation
 
 logging.basicConfig(level=logging.INFO)
 
+FALLBACK_AVOID_REPEATS = 2  # cached answers a fallback skips because they were just played
+
+GenerationRequest = namedtuple('GenerationRequest', ['prompt', 'length', 'cache_key', 'key', 'is_minor', 'artist'])
+
 class ChordProgressionPlayer:
-    def __init__(self):
+    def __init__(self, cache_path="progression_cache.sqlite3", prefetch=True):
         self.current_progression = []
-        self.all_progressions = []
+        self.session_recorder = None
         self.is_playing = False
-        self.should_stop = False
+        self.commands = queue.Queue()
+        self.playback_thread = None
+        self.swap_boundary = 'bar'
+        self.midi_cache_key = None
+        self.midi_cache = None
+        self.sequencer = None
+        self.arrangement = None
         self.tempo = 60
         self.key = 'C'
         self.is_minor = False
         self.progression_length = 4
         self.artist_to_emulate = None
         self.valid_keys = ['C', 'C#', 'D', 'D#', 'E', 'F', 'F#', 'G', 'G#', 'A', 'A#', 'B']
-        self.ollama_api = OllamaAPI("http://192.168.0.214:7869")  # Update with your actual Ollama instance
-
-    def generate_progression_with_ollama(self):
-        prompt = f"Generate a {self.progression_length}-chord progression"
-
-        if self.artist_to_emulate:
-            prompt += f" in the style of {self.artist_to_emulate}"
-
-        prompt += f" in the key of {self.key}{'m' if self.is_minor else ''}. "
-        prompt += "Use only chord names."
-        prompt += "Respond with only the chord progression, with chords in root + quality, separated by dashes. For example: G-Cmaj7-F-G7"
+        self.ollama_api = OllamaRouter(endpoints_from_env())  # Set OLLAMA_ENDPOINTS to use your Ollama instances
+        self.output_validator = OutputValidator()
+        self.progression_cache = ProgressionCache(cache_path, avoid_repeats=FALLBACK_AVOID_REPEATS)
+        # Generating means asking Ollama: the cache only answers when Ollama gives nothing, and
+        # prefetching already hides the request latency a cache hit would save. Batch runs read
+        # the cache first instead, so a rerun reproduces its output.
+        self.cache_first = False
+        # Without a prefetcher (batch workers, benchmarks) generates fetch on the calling thread
+        self.prefetcher = Prefetcher(self.fetch_progression, depth=2) if prefetch else None
+        self.backend = 'ollama'
+        self.corpus_path = "progression_corpus.bin"
+        self.corpus = None
+        self.corpus_pending = []  # LLM answers not yet indexed; folded in on the next corpus use
+        self.corpus_lock = threading.Lock()
+
+    def generation_params(self):
+        return (self.key, self.is_minor, self.progression_length, self.artist_to_emulate, self.backend)
+
+    def build_prompt(self):
+        previous = [self.format_chord(chord) for chord in self.current_progression]
+        return build_prompt(self.key, self.is_minor, self.progression_length, self.artist_to_emulate, previous)
+
+    def generation_request(self, with_previous=True):
+        previous = [self.format_chord(chord) for chord in self.current_progression] if with_previous else []
+        return generation_request(self.key, self.is_minor, self.progression_length, self.artist_to_emulate, previous)
+
+    def fetch_progression(self, request, backend=None, cancel=None):
+        if (backend or self.backend) == 'corpus':
+            return self.corpus_progression(request.key, request.is_minor, request.length, request.artist)
+
+        progression_string = self.progression_cache.get(request.cache_key) if self.cache_first else None
+        if progression_string is None:
+            progression_string = self.output_validator.generate(self.ollama_api, request.prompt, request.length, cancel)
+            if progression_string:
+                self.progression_cache.put(request.cache_key, progression_string)
+                with self.corpus_lock:
+                    self.corpus_pending.append((progression_string, request.key, request.is_minor, request.artist))
+            elif not self.cache_first and not (cancel is not None and cancel.is_set()):
+                progression_string = self.progression_cache.get(request.cache_key)
+        return progression_string
+
+    def get_corpus(self):
+        # Loaded on first use; a new corpus starts from every cached LLM response
+        from corpus_index import ProgressionCorpus
+        with self.corpus_lock:
+            if self.corpus is None:
+                if os.path.exists(self.corpus_path):
+                    self.corpus = ProgressionCorpus.load(self.corpus_path)
+                else:
+                    self.corpus = ProgressionCorpus()
+                    self.corpus.import_progression_cache(self.progression_cache.path)
+            pending, self.corpus_pending = self.corpus_pending, []
+            for progression_string, key, is_minor, artist in pending:
+                self.corpus.add(progression_string, key, is_minor, artist)
+            return self.corpus
+
+    def corpus_progression(self, key, is_minor, length, artist=None):
+        figures = self.get_corpus().generate(key, is_minor, length, artist)
+        return '-'.join(figures) if figures else None
+
+    def set_backend(self, backend):
+        if backend in ('ollama', 'corpus'):
+            self.backend = backend
+            return True
+        return False
 
-        if self.current_progression:
-            previous_progression = '-'.join(self.format_chord(chord) for chord in self.current_progression)
-            prompt += f" The previous progression was: {previous_progression}."
+    def prefetch(self):
+        # Speculative requests leave out the previous progression: by the time
+        # one is used, the progression it would follow has usually moved on.
+        if self.prefetcher is not None:
+            self.prefetcher.prime(self.generation_params(), self.generation_request(with_previous=False))
 
-        logging.info(f"Sending prompt to Ollama: {prompt}")
+    @instrumentation.timed("generate")
+    def generate_progression_with_ollama(self):
+        request = self.generation_request()
+        logging.info(f"Sending prompt to Ollama: {request.prompt}")
 
-        progression_string = self.ollama_api.generate_progression_with_ollama(prompt)
+        # Served from the prefetch queue when a progression for these settings is ready
+        if self.prefetcher is not None:
+            progression_string = self.prefetcher.get(self.generation_params(), request,
+                                                     self.generation_request(with_previous=False))
+        else:
+            progression_string = self.fetch_progression(request)
         print(progression_string)
-        
+        return self.progression_from_string(progression_string)
+
+    def progression_from_string(self, progression_string, params=None):
+        # ``params`` as from generation_params(); the service passes each client's own
+        key, is_minor, length, artist = (params or self.generation_params())[:4]
         if progression_string:
             chord_tokens = tokenize_progression(progression_string)
-            cleaned_progression = [format_chord_token(token) for token in chord_tokens if token['type'] != ChordType.INVALID]
+            cleaned_progression = [format_chord_token(token) for token in chord_tokens if token.type != ChordType.INVALID]
+            return self.parse_progression(cleaned_progression, key, length)
 
-            parsed_progression = self.parse_progression(cleaned_progression)
-            return parsed_progression
-        else:
-            return self.generate_random_progression()
+        # Without an LLM answer, the corpus model beats uniformly random degrees
+        fallback = self.corpus_progression(key, is_minor, length, artist)
+        if fallback:
+            return self.progression_from_string(fallback, params)
+        return random_progression(key, is_minor, length)
 
-    def parse_progression(self, progression):
-        parsed = []
-        key = music21.key.Key(self.key)
-        tonic_chord = music21.roman.RomanNumeral('I', key)
-
-        for chord in progression:
-            try:
-                token = tokenize_chord(chord)
-                if token['type'] == ChordType.ROMAN:
-                    parsed.append(music21.roman.RomanNumeral(token['root'], key))
-                elif token['type'] == ChordType.CHORD_SYMBOL:
-                    harmony = music21.harmony.ChordSymbol(format_chord_token(token))
-                    if token['bass']:
-                        harmony.bass(music21.pitch.Pitch(token['bass']))
-                    parsed.append(harmony)
-                else:
-                    parsed.append(tonic_chord)
-            except Exception:
-                parsed.append(tonic_chord)
-
-        while len(parsed) < self.progression_length:
-            parsed.append(tonic_chord)
-
-        return parsed[:self.progression_length]
+    @instrumentation.timed("parse")
+    def parse_progression(self, progression, key=None, length=None):
+        return parse_figures(progression, key or self.key, length or self.progression_length)
 
     def generate_random_progression(self):
-        degrees_minor = ['i', 'iv', 'v', 'VI', 'III', 'ii°', 'VII']
-        degrees_major = ['I', 'IV', 'V', 'vi', 'ii', 'iii', 'viio']
-        degrees = degrees_minor if self.is_minor else degrees_major
-        return [music21.roman.RomanNumeral(degree, music21.key.Key(self.key)) for degree in random.choices(degrees, k=self.progression_length)]
+        return random_progression(self.key, self.is_minor, self.progression_length)
 
     def format_chord(self, chord):
+        if isinstance(chord, ResolvedChord):
+            return chord.figure
+        import music21
         if isinstance(chord, music21.roman.RomanNumeral):
-            return chord.romanNumeral
+            return chord.romanNumeral + QUALITY_MARKS.get(chord.quality, '')
         if isinstance(chord, music21.harmony.ChordSymbol):
             return chord.figure
         return str(chord)
 
-    def apply_voice_leading(self, progression):
-        def find_best_inversion(previous_pitches, current_pitches):
-            possible_inversions = [
-                current_pitches,
-                [current_pitches[1], current_pitches[2], current_pitches[3], current_pitches[0].transpose(12)],
-                [current_pitches[2], current_pitches[3], current_pitches[0].transpose(12), current_pitches[1].transpose(12)],
-                [current_pitches[3], current_pitches[0].transpose(12), current_pitches[1].transpose(12), current_pitches[2].transpose(12)]
-            ]
-
-            def movement(inversion):
-                return sum(min(abs(prev.midi - curr.midi), 12 - abs(prev.midi - curr.midi)) for prev, curr in zip(previous_pitches, inversion))
-
-            return min(possible_inversions, key=movement)
-
-        def normalize_octave(pitches, reference_pitch=60):  # Middle C (C4) is MIDI note 60
-            normalized_pitches = []
-            for pitch in pitches:
-                while pitch.midi > reference_pitch + 12:
-                    pitch = pitch.transpose(-12)
-                while pitch.midi < reference_pitch - 12:
-                    pitch = pitch.transpose(12)
-                normalized_pitches.append(pitch)
-            return normalized_pitches
-
-        voice_led_progression = []
-        previous_pitches = None
-
-        for chord in progression:
-            if isinstance(chord, (music21.roman.RomanNumeral, music21.harmony.ChordSymbol)):
-                current_pitches = list(chord.pitches)
-
-                while len(current_pitches) < 4:
-                    current_pitches.append(current_pitches[-1].transpose(-12))
-                while len(current_pitches) > 4:
-                    current_pitches.pop()
-
-                if previous_pitches is not None:
-                    while len(previous_pitches) < 4:
-                        previous_pitches.append(previous_pitches[-1].transpose(-12))
-                    while len(previous_pitches) > 4:
-                        previous_pitches.pop()
-
-                    current_pitches = find_best_inversion(previous_pitches, current_pitches)
-                    current_pitches = normalize_octave(current_pitches)
-
-                    available_pitches = current_pitches[:]
-                    for i in range(4):
-                        closest_pitch = min(available_pitches, key=lambda p: abs(p.midi - previous_pitches[i].midi))
-                        current_pitches[i] = closest_pitch
-                        available_pitches.remove(closest_pitch)
-
-                current_pitches = normalize_octave(current_pitches)
-                previous_pitches = current_pitches[:]
-                voice_led_chord = music21.chord.Chord(current_pitches)
-                voice_led_progression.append(voice_led_chord)
-            else:
-                voice_led_progression.append(chord)
+    @instrumentation.timed("voice")
+    def voice_lead_midi(self, progression, optimal=False, loop=False, **search_options):
+        chord_positions = [i for i, chord in enumerate(progression) if is_chord(chord)]
+        chords = [chord_midi(progression[i]) for i in chord_positions]
 
-        return voice_led_progression
+        if optimal:
+            voicings = optimal_voice_lead(chords, loop=loop, **search_options)
+        else:
+            voicings = voice_lead(chords)
 
-    def create_midi_file(self, progression, filename="midi_output/chord_progression.mid"):
-        voice_led_progression = self.apply_voice_leading(progression)
+        voice_led = [None] * len(progression)
+        for i, notes in zip(chord_positions, voicings):
+            voice_led[i] = tuple(notes)
+        return voice_led
 
-        midi = MIDIFile(1)
-        track = 0
-        time = 0
-        midi.addTrackName(track, time, f"Chord Progression in {self.key}{'m' if self.is_minor else ''}")
-        midi.addTempo(track, time, self.tempo)
+    def apply_voice_leading(self, progression, optimal=False, loop=False, **search_options):
+        import music21
+        voice_led_progression = list(progression)
+        for i, notes in enumerate(self.voice_lead_midi(progression, optimal, loop, **search_options)):
+            if notes is not None:
+                voice_led_progression[i] = music21.chord.Chord([music21.pitch.Pitch(midi=note) for note in notes])
 
-        for chord in voice_led_progression:
-            pitches = chord.pitches if isinstance(chord, (music21.chord.Chord, music21.roman.RomanNumeral, music21.harmony.ChordSymbol)) else []
-            for pitch in pitches:
-                midi.addNote(track, 0, pitch.midi, time, 2, 100)
-            time += 2
+        return voice_led_progression
 
+    @instrumentation.timed("render")
+    def render_midi(self, progression, **voice_leading_options):
+        title = f"Chord Progression in {self.key}{'m' if self.is_minor else ''}"
+        return render_voicings(self.voice_lead_midi(progression, **voice_leading_options), title, self.tempo,
+                               self.arrangement)
+
+    def render_cached_midi(self, progression, **voice_leading_options):
+        cache_key = (tuple(self.format_chord(chord) for chord in progression), self.tempo, self.key, self.is_minor,
+                     self.arrangement is not None, tuple(sorted(voice_leading_options.items())))
+        if cache_key != self.midi_cache_key:
+            self.midi_cache = self.render_midi(progression, **voice_leading_options)
+            self.midi_cache_key = cache_key
+        return self.midi_cache
+
+    @instrumentation.timed("create_midi_file")
+    def create_midi_file(self, progression, filename="midi_output/chord_progression.mid", **voice_leading_options):
         with open(filename, "wb") as output_file:
-            midi.writeFile(output_file)
-
-    def play_progression(self):
-        while not self.should_stop:
-            self.create_midi_file(self.current_progression)
-            pygame.mixer.music.load("midi_output/chord_progression.mid")
-            pygame.mixer.music.play()
-            while pygame.mixer.music.get_busy() and not self.should_stop:
-                pygame.time.Clock().tick(10)
-        self.is_playing = False
+            output_file.write(self.render_midi(progression, **voice_leading_options))
+
+    def progression_events(self, progression, beats_per_chord=2):
+        from midi_sequencer import chord_events
+        voicings = self.voice_lead_midi(progression)
+        if self.arrangement is not None:
+            return self.arrangement.sequencer_events(self.arrangement.render(voicings)), self.arrangement.length(voicings)
+        chords = [voicing or () for voicing in voicings]
+        return chord_events(chords, beats_per_chord), beats_per_chord * len(chords)
+
+    def set_arrangement(self, enabled):
+        # Chord, bass and two arpeggiators on channels 1-4 instead of a single chord track
+        from arrangement import Arrangement
+        self.arrangement = Arrangement() if enabled else None
+        if self.is_playing:
+            self.queue_progression(self.current_progression)
+
+    def set_midi_output(self, port_name=None, virtual=False):
+        # The new port is opened first, so a port that fails to open leaves playback where it was
+        from midi_sequencer import MidiSequencer, open_output
+        sequencer = MidiSequencer(open_output(port_name, virtual), self.tempo) if port_name or virtual else None
+        if self.sequencer is not None:
+            self.sequencer.close()
+        elif self.playback_thread is not None:
+            self.commands.put(('stop', None))
+        self.sequencer = sequencer
+        if self.is_playing:
+            self.queue_progression(self.current_progression)
+
+    def playback_loop(self):
+        # Double buffered: the next progression is rendered by the caller and
+        # waits in `pending` until the next bar or loop boundary of the current one.
+        import pygame
+        if not pygame.mixer.get_init():
+            pygame.mixer.init()  # The audio backend only starts once something plays
+        started_at = None
+        period = None
+        pending = None
+        swap_at = None
+
+        while True:
+            timeout = None if pending is None else max(0.0, swap_at - time.perf_counter())
+            try:
+                command, payload = self.commands.get(timeout=timeout)
+            except queue.Empty:
+                command, payload = None, None
+
+            if command == 'stop':
+                pygame.mixer.music.stop()
+                started_at = pending = None
+            elif command == 'play':
+                pending = payload
+                swap_at = time.perf_counter() if started_at is None else next_boundary(started_at, period)
+
+            if pending is not None and time.perf_counter() >= swap_at:
+                midi_data, period, queued_at = pending
+                with instrumentation.span("playback.load"):
+                    pygame.mixer.music.load(io.BytesIO(midi_data), "mid")
+                    pygame.mixer.music.play(loops=-1)
+                started_at = time.perf_counter()
+                if instrumentation.enabled:
+                    # From the request to audible output, including any wait for the bar
+                    instrumentation.record("playback.start", started_at - queued_at)
+                pending = None
+
+    def queue_progression(self, progression):
+        from midi_sequencer import BEATS_PER_BAR
+        queued_at = time.perf_counter()
+        if self.sequencer is not None:
+            with instrumentation.span("playback.start"):
+                events, length = self.progression_events(progression)
+                self.sequencer.play(events, length, boundary=self.swap_boundary)
+            return
+
+        beats = BEATS_PER_BAR if self.swap_boundary == 'bar' else 2 * len(progression)
+        self.commands.put(('play', (self.render_cached_midi(progression), beats * 60.0 / self.tempo, queued_at)))
+        if self.playback_thread is None:
+            self.playback_thread = threading.Thread(target=self.playback_loop, daemon=True)
+            self.playback_thread.start()
 
     def start_playing(self, progression):
         self.current_progression = progression
-        self.all_progressions.extend(progression)
-        self.should_stop = False
-        if not self.is_playing:
-            self.is_playing = True
-            threading.Thread(target=self.play_progression).start()
+        self.queue_progression(progression)
+        self.record_session(progression)
+        self.is_playing = True
 
     def stop_playing(self):
-        self.should_stop = True
+        if self.sequencer is not None:
+            self.sequencer.stop()
+        else:
+            self.commands.put(('stop', None))
+        self.is_playing = False
         self.create_session_midi()
 
+    def record_session(self, progression):
+        if self.session_recorder is None:
+            from session_recorder import SessionRecorder
+            self.session_recorder = SessionRecorder("midi_output/session_progression.mid",
+                                                    f"Chord Progression in {self.key}{'m' if self.is_minor else ''}", self.tempo)
+        self.session_recorder.append([chord_midi(chord) if is_chord(chord) else None for chord in progression], self.tempo)
+
     def create_session_midi(self):
-        if self.all_progressions:
-            self.create_midi_file(self.all_progressions, "midi_output/session_progression.mid")
+        if self.session_recorder is not None:
+            self.session_recorder.checkpoint()
             logging.info("Session MIDI file created: session_progression.mid")
         else:
             print("No progressions generated in this session.")
 
     def set_tempo(self, new_tempo):
         self.tempo = new_tempo
+        if self.sequencer is not None:
+            self.sequencer.set_tempo(new_tempo)
+        elif self.is_playing:
+            self.queue_progression(self.current_progression)
 
     def set_key(self, new_key):
         key = new_key.rstrip('m')
         if key in self.valid_keys:
+            semitones = (self.valid_keys.index(key) - self.valid_keys.index(self.key) + 5) % 12 - 5
             self.key = key
             self.is_minor = new_key.endswith('m')
+            if self.is_playing and semitones:
+                self.current_progression = [chord.transpose(semitones) for chord in self.current_progression]
+                self.queue_progression(self.current_progression)
             return True
         return False
 
@@ -215,3 +334,109 @@ class ChordProgressionPlayer:
 
     def set_artist(self, artist):
         self.artist_to_emulate = artist
+
+    def close(self):
+        self.stop_playing()
+        if self.prefetcher is not None:
+            self.prefetcher.close()
+        self.ollama_api.close()
+        if self.corpus_pending:
+            self.get_corpus()
+        self.progression_cache.close()
+        if self.corpus is not None and self.corpus.dirty:
+            self.corpus.save(self.corpus_path)
+        if self.session_recorder is not None:
+            self.session_recorder.close()
+        self.set_midi_output(None)
+
+
+def build_prompt(key, is_minor, length, artist=None, previous=None):
+    prompt = f"Generate a {length}-chord progression"
+
+    if artist:
+        prompt += f" in the style of {artist}"
+
+    prompt += f" in the key of {key}{'m' if is_minor else ''}. "
+    prompt += "Use only chord names."
+    prompt += "Respond with only the chord progression, with chords in root + quality, separated by dashes. For example: G-Cmaj7-F-G7"
+
+    if previous:
+        prompt += f" The previous progression was: {'-'.join(previous)}."
+
+    return prompt
+
+
+def generation_request(key, is_minor, length, artist=None, previous=(), variant=None):
+    return GenerationRequest(build_prompt(key, is_minor, length, artist, previous), length,
+                             cache_key(key, is_minor, length, artist, list(previous), variant), key, is_minor, artist)
+
+
+def parse_figures(progression, key, length):
+    parsed = []
+    tonic_chord = resolve_roman('I', key)
+
+    for chord in progression:
+        try:
+            token = tokenize_chord(chord)
+            if token.type == ChordType.ROMAN:
+                parsed.append(resolve_roman(token.root, key))
+            elif token.type == ChordType.CHORD_SYMBOL:
+                parsed.append(resolve_chord_symbol(format_chord_token(token), token.bass) or tonic_chord)
+            else:
+                parsed.append(tonic_chord)
+        except Exception:
+            parsed.append(tonic_chord)
+
+    while len(parsed) < length:
+        parsed.append(tonic_chord)
+
+    return parsed[:length]
+
+
+def random_progression(key, is_minor, length):
+    degrees_minor = ['i', 'iv', 'v', 'VI', 'III', 'ii°', 'VII']
+    degrees_major = ['I', 'IV', 'V', 'vi', 'ii', 'iii', 'viio']
+    degrees = degrees_minor if is_minor else degrees_major
+    return [resolve_roman(degree, key) for degree in random.choices(degrees, k=length)]
+
+
+def render_voicings(voicings, title, tempo, arrangement=None):
+    from midi_encoder import note_events, encode_track, encode_smf
+    if arrangement is not None:
+        return arrangement.to_smf(arrangement.render(voicings), arrangement.length(voicings), tempo, title)
+
+    starts, notes = [], []
+    for i, voicing in enumerate(voicings):
+        for note in voicing or ():
+            starts.append(2 * i)
+            notes.append(note)
+
+    events = note_events(starts, 2, notes, 100)
+    track = encode_track(events, name=title, tempo=tempo)
+    return encode_smf([track])
+
+
+def preload_modules():
+    # Imported lazily to keep startup fast; main.py calls this from a
+    # background thread so they are usually ready by the first command.
+    import music21
+    import pygame
+    import midi_encoder
+
+
+def is_chord(chord):
+    if isinstance(chord, ResolvedChord):
+        return True
+    import music21
+    return isinstance(chord, (music21.roman.RomanNumeral, music21.harmony.ChordSymbol))
+
+
+def chord_midi(chord):
+    if isinstance(chord, ResolvedChord):
+        return list(chord.midi)
+    return [pitch.midi for pitch in chord.pitches]
+
+
+def next_boundary(started_at, period):
+    elapsed = time.perf_counter() - started_at
+    return started_at + math.ceil(elapsed / period) * period
@@ -0,0 +1,119 @@
+import re
+import sys
+from collections import namedtuple
+from functools import lru_cache
+from utils import ChordType
+
+CHORD_SYMBOL_CACHE_SIZE = 2048
+
+PITCH_CLASSES = {'C': 0, 'D': 2, 'E': 4, 'F': 5, 'G': 7, 'A': 9, 'B': 11}
+SHARP_NAMES = ['C', 'C#', 'D', 'D#', 'E', 'F', 'F#', 'G', 'G#', 'A', 'A#', 'B']
+NUMERALS = ['I', 'II', 'III', 'IV', 'V', 'VI', 'VII']
+MAJOR_SCALE = [0, 2, 4, 5, 7, 9, 11]
+MINOR_SCALE = [0, 2, 3, 5, 7, 8, 10]
+MAJOR_TRIAD = (0, 4, 7)
+MINOR_TRIAD = (0, 3, 7)
+DIMINISHED_TRIAD = (0, 3, 6)
+DIMINISHED_MARKS = ('°', 'o')
+QUALITY_MARKS = {'diminished': '°', 'augmented': '+'}  # Kept on roman figures; music21's romanNumeral drops them
+TONIC_OCTAVE_MIDI = 60  # music21 puts the tonic of a RomanNumeral in octave 4
+FLAT_NOTE = re.compile(r'(^|/)([A-G])b')  # music21 spells flats with '-' ('Bb' reads as B plus a 'b' chord type)
+MUSIC21_FLAT_NOTE = re.compile(r'(^|/)([A-G])-')
+
+
+class ResolvedChord(namedtuple('ResolvedChord', ['figure', 'kind', 'midi'])):
+    """A parsed chord reduced to its display figure and MIDI notes."""
+    __slots__ = ()
+
+    def transpose(self, semitones):
+        figure = self.figure
+        if self.kind == ChordType.CHORD_SYMBOL:
+            figure = transpose_figure(figure, semitones)
+        return ResolvedChord(figure, self.kind, tuple(note + semitones for note in self.midi))
+
+
+def pitch_class(name):
+    return (PITCH_CLASSES[name[0].upper()] + name.count('#') - name.count('b') - name.count('-')) % 12
+
+
+def transpose_figure(figure, semitones):
+    root_length = 2 if len(figure) > 1 and figure[1] in '#b-' else 1
+    figure = SHARP_NAMES[(pitch_class(figure[:root_length]) + semitones) % 12] + figure[root_length:]
+    if '/' in figure:
+        chord, bass = figure.rsplit('/', 1)
+        figure = f"{chord}/{SHARP_NAMES[(pitch_class(bass) + semitones) % 12]}"
+    return figure
+
+
+def build_roman_table():
+    # Triads on every degree of all 24 keys, following music21's reading of a
+    # bare numeral: case picks major/minor, a degree sign makes it diminished,
+    # and in minor keys lowercase or diminished vi/vii sit on the raised sixth
+    # and seventh.
+    table = {}
+    for tonic_name in SHARP_NAMES:
+        for key in (tonic_name, tonic_name.lower()):
+            minor = key.islower()
+            tonic = TONIC_OCTAVE_MIDI + pitch_class(tonic_name)
+            scale = MINOR_SCALE if minor else MAJOR_SCALE
+            for degree, numeral in enumerate(NUMERALS):
+                for figure in (numeral, numeral.lower()):
+                    lowercase = figure.islower()
+                    for mark in ('',) + DIMINISHED_MARKS:
+                        raised = minor and degree >= 5 and (lowercase or bool(mark))
+                        root = tonic + scale[degree] + raised
+                        display = ('#' if raised else '') + figure + ('°' if mark else '')
+                        triad = DIMINISHED_TRIAD if mark else MINOR_TRIAD if lowercase else MAJOR_TRIAD
+                        table[(figure + mark, key)] = ResolvedChord(display, ChordType.ROMAN,
+                                                                    tuple(root + interval for interval in triad))
+    return table
+
+
+ROMAN_TABLE = build_roman_table()
+
+
+@lru_cache(maxsize=256)
+def resolve_roman_with_music21(figure, key):
+    import music21
+    numeral = music21.roman.RomanNumeral(figure, music21.key.Key(key))
+    return ResolvedChord(numeral.romanNumeral + QUALITY_MARKS.get(numeral.quality, ''), ChordType.ROMAN,
+                         tuple(pitch.midi for pitch in numeral.pitches))
+
+
+def resolve_roman(figure, key):
+    """Resolve a roman numeral in ``key`` (music21 style: 'C' major, 'c' minor)."""
+    chord = ROMAN_TABLE.get((figure, key))
+    if chord is None:
+        chord = resolve_roman_with_music21(figure, key)
+    return chord
+
+
+@lru_cache(maxsize=CHORD_SYMBOL_CACHE_SIZE)
+def resolve_chord_symbol(figure, bass=None):
+    """Resolve a chord symbol through music21 once; returns None when music21 rejects it."""
+    import music21
+    try:
+        harmony = music21.harmony.ChordSymbol(FLAT_NOTE.sub(r'\1\2-', figure))
+        if bass:
+            harmony.bass(music21.pitch.Pitch(bass))
+    except Exception:
+        return None
+    return ResolvedChord(MUSIC21_FLAT_NOTE.sub(r'\1\2b', harmony.figure), ChordType.CHORD_SYMBOL,
+                         tuple(pitch.midi for pitch in harmony.pitches))
+
+
+def check_roman_table():
+    mismatches = []
+    for (figure, key), chord in ROMAN_TABLE.items():
+        expected = resolve_roman_with_music21.__wrapped__(figure, key)
+        if expected != chord:
+            mismatches.append((figure, key, chord, expected))
+    return mismatches
+
+
+if __name__ == "__main__":
+    mismatches = check_roman_table()
+    for mismatch in mismatches:
+        print("Mismatch:", *mismatch)
+    print(f"{len(ROMAN_TABLE) - len(mismatches)}/{len(ROMAN_TABLE)} roman numeral entries match music21")
+    sys.exit(1 if mismatches else 0)
@@ -1,29 +1,156 @@
-import pygame
 import random
 import json
-from midiutil import MIDIFile
-
-# Initialize Pygame
-pygame.init()
-
-# Load rhythmic patterns from JSON file
-with open('rhythmic_patterns.json', 'r') as f:
-    rhythmic_patterns = json.load(f)["patterns"]
-
-# Map chords to MIDI note lists (C major scale for simplicity)
-chord_to_midi = {
-    "I": [60, 64, 67],     # C Major (C, E, G)
-    "ii": [62, 65, 69],    # D minor (D, F, A)
-    "iii": [64, 67, 71],   # E minor (E, G, B)
-    "IV": [65, 69, 72],    # F Major (F, A, C)
-    "V": [67, 71, 74],     # G Major (G, B, D)
-    "vi": [69, 72, 76],    # A minor (A, C, E)
-    "vii°": [71, 74, 77],  # B diminished (B, D, F)
-}
+from collections import namedtuple
+from functools import lru_cache
+import numpy as np
+from midi_encoder import note_events, encode_track, encode_smf
+from chord_tokenizer import tokenize_chord, format_chord_token
+from chord_resolver import resolve_roman, resolve_chord_symbol
+from utils import ChordType
+
+DEFAULT_NOTES = (60,)  # Middle C for anything that cannot be resolved
+DEFAULT_METER = 4  # Beats per bar for patterns without a "meter" field
+
+# Load rhythmic patterns from JSON file on first use
+@lru_cache(maxsize=None)
+def load_rhythmic_patterns(path='rhythmic_patterns.json'):
+    with open(path, 'r') as f:
+        return json.load(f)["patterns"]
+
+# Map a chord (roman numeral or chord symbol) to MIDI notes in the given key
+@lru_cache(maxsize=1024)
+def chord_notes(chord, key='C'):
+    token = tokenize_chord(chord)
+    try:
+        if token.type == ChordType.ROMAN:
+            return resolve_roman(token.root, key).midi
+        if token.type == ChordType.CHORD_SYMBOL:
+            resolved = resolve_chord_symbol(format_chord_token(token), token.bass)
+            if resolved is not None:
+                return resolved.midi
+    except Exception:
+        pass
+    return DEFAULT_NOTES
+
+RhythmEvents = namedtuple('RhythmEvents', ['progression', 'start', 'duration', 'pitch', 'velocity'])
+
+class RhythmLibrary:
+    """Every rhythm pattern compiled into flat step/onset/duration arrays.
+
+    Step ``s`` of a pattern is what one chord plays; a step holds note items
+    (offset and duration within the step) and lasts the sum of its notes
+    and one beat per rest. Patterns are indexed by name, by meter (beats
+    per bar, from the pattern's "meter" field) and by density (note onsets
+    per beat).
+    """
+
+    def __init__(self, patterns):
+        self.names = [pattern["name"] for pattern in patterns]
+        self.by_name = {name: i for i, name in enumerate(self.names)}
+        self.by_meter = {}
+        self.by_density = {}
+
+        step_base, step_count, step_length = [], [], []
+        item_start, item_count, item_offset, item_duration = [], [], [], []
+        for i, pattern in enumerate(patterns):
+            step_base.append(len(step_length))
+            step_count.append(len(pattern["pattern"]))
+            onsets = 0
+            for step in pattern["pattern"]:
+                item_start.append(len(item_offset))
+                offset = 0
+                for duration in step:
+                    if duration == "rest":
+                        offset += 1
+                        continue
+                    item_offset.append(offset)
+                    item_duration.append(duration)
+                    offset += duration
+                    onsets += 1
+                item_count.append(len(item_offset) - item_start[-1])
+                step_length.append(offset)
+
+            meter = pattern.get("meter", DEFAULT_METER)
+            density = onsets / sum(step_length[step_base[-1]:])
+            self.by_meter.setdefault(meter, []).append(pattern["name"])
+            self.by_density.setdefault(density_bucket(density), []).append(pattern["name"])
+
+        self.step_base = np.array(step_base)
+        self.step_count = np.array(step_count)
+        self.step_length = np.array(step_length, dtype=float)
+        self.item_start = np.array(item_start)
+        self.item_count = np.array(item_count)
+        self.item_offset = np.array(item_offset, dtype=float)
+        self.item_duration = np.array(item_duration, dtype=float)
+
+    def select(self, meter=None, density=None):
+        names = self.names
+        if meter is not None:
+            names = [name for name in names if name in self.by_meter.get(meter, [])]
+        if density is not None:
+            names = [name for name in names if name in self.by_density.get(density, [])]
+        return names
+
+    def render(self, progressions, patterns=None, key='C', velocity=100):
+        """Apply rhythm patterns to a batch of progressions in one vectorized pass.
+
+        Chords may be figures (resolved in ``key``) or MIDI note lists.
+        ``patterns`` is one name, a name per progression, or None for a
+        random pattern each. Times are in beats from the start of each
+        progression.
+        """
+        if patterns is None:
+            patterns = [random.choice(self.names) for _ in progressions]
+        elif isinstance(patterns, str):
+            patterns = [patterns] * len(progressions)
+
+        lengths = np.array([len(progression) for progression in progressions], dtype=int)
+        chords = [chord_notes(chord, key) if isinstance(chord, str) else tuple(chord)
+                  for progression in progressions for chord in progression]
+        if not chords:
+            empty = np.array([], dtype=int)
+            return RhythmEvents(empty, empty.astype(float), empty.astype(float), empty, empty)
+
+        notes = np.full((len(chords), max(len(chord) for chord in chords)), -1)
+        for i, chord in enumerate(chords):
+            notes[i, :len(chord)] = chord
+
+        first_chord = np.cumsum(lengths) - lengths
+        progression_index = np.repeat(np.arange(len(progressions)), lengths)
+        position = np.arange(len(chords)) - first_chord[progression_index]
+        pattern_index = np.array([self.by_name[name] for name in patterns])[progression_index]
+        step = self.step_base[pattern_index] + position % self.step_count[pattern_index]
+
+        chord_length = self.step_length[step]
+        elapsed = np.concatenate(([0.0], np.cumsum(chord_length)))
+        chord_start = elapsed[:-1] - elapsed[first_chord][progression_index]
+
+        counts = self.item_count[step]
+        chord_index = np.repeat(np.arange(len(chords)), counts)
+        within = np.arange(counts.sum()) - np.repeat(np.cumsum(counts) - counts, counts)
+        item = self.item_start[step][chord_index] + within
+
+        pitch = notes[chord_index]
+        sounding = pitch >= 0
+        start = np.broadcast_to((chord_start[chord_index] + self.item_offset[item])[:, None], pitch.shape)[sounding]
+        duration = np.broadcast_to(self.item_duration[item][:, None], pitch.shape)[sounding]
+        progression = np.broadcast_to(progression_index[chord_index][:, None], pitch.shape)[sounding]
+        return RhythmEvents(progression, start, duration, pitch[sounding], np.full(len(start), velocity))
+
+def density_bucket(density):
+    if density < 0.5:
+        return 'sparse'
+    if density < 1:
+        return 'medium'
+    return 'dense'
+
+@lru_cache(maxsize=None)
+def load_rhythm_library(path='rhythmic_patterns.json'):
+    return RhythmLibrary(load_rhythmic_patterns(path))
 
 # Apply a random rhythm pattern
 def apply_rhythm(chords):
-    pattern = random.choice(rhythmic_patterns)["pattern"]
+    pattern = random.choice(load_rhythmic_patterns())["pattern"]
     rhythmic_progression = []
     
     # Iterate over the chord progression and apply the rhythm pattern
@@ -39,33 +166,19 @@ def apply_rhythm(chords):
     return rhythmic_progression
 
 # Generate MIDI from chord progression
-def create_midi(chord_progression, tempo=120):
-    rhythmic_progression = apply_rhythm(chord_progression)
-
-    # Create MIDI file
-    midi = MIDIFile(1)  # One track
-    track = 0
-    time = 0  # Start at the beginning
-    midi.addTempo(track, time, tempo)
-
-    for item in rhythmic_progression:
-        chord = item[0]
-        duration = item[1]
-
-        if chord == "rest":
-            time += duration  # Advance time for rests
-        else:
-            notes = chord_to_midi.get(chord, [60])  # Default to C major if not found
-            for note in notes:
-                midi.addNote(track, 0, note, time, duration, 100)
-            time += duration
+def create_midi(chord_progression, tempo=120, key='C', pattern=None):
+    events = load_rhythm_library().render([chord_progression], pattern, key=key)
+
+    midi = encode_track(note_events(events.start, events.duration, events.pitch, events.velocity), tempo=tempo)
 
     # Save MIDI file to disk
     with open("output.mid", "wb") as output_file:
-        midi.writeFile(output_file)
+        output_file.write(encode_smf([midi]))
 
 # Play MIDI file with pygame
 def play_midi():
+    import pygame
+    pygame.init()
     pygame.mixer.music.load("output.mid")
     pygame.mixer.music.play()
 
@@ -80,6 +193,7 @@ def main():
     print(f"Playing chord progression: {chord_progression}")
     play_midi()
 
+    import pygame
     pygame.quit()
 
 if __name__ == "__main__":
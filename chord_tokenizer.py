@@ -1,56 +1,75 @@
 import re
-from enum import Enum, auto
-from utils import ChordType, ROMAN_PATTERN, ROOT_PATTERN, QUALITY_PATTERN, EXTENSIONS_PATTERN, BASS_PATTERN
+from collections import namedtuple
+from functools import lru_cache
+from utils import ChordType, TOKEN_PATTERN
 
+TOKEN_CACHE_SIZE = 4096
+
+
+class ChordToken(namedtuple('ChordToken', ['original', 'type', 'root', 'quality', 'extensions', 'bass'])):
+    __slots__ = ()
+
+    def __getitem__(self, item):
+        # Tokens used to be dicts; keep token['root'] style access working
+        if isinstance(item, str):
+            return getattr(self, item)
+        return super().__getitem__(item)
+
+
+@lru_cache(maxsize=TOKEN_CACHE_SIZE)
 def tokenize_chord(chord_string):
     chord_string = chord_string.strip()
+    match = TOKEN_PATTERN.match(chord_string)
+
+    if match is None:
+        return ChordToken(chord_string, ChordType.INVALID, None, None, None, None)
 
-    roman_match = ROMAN_PATTERN.match(chord_string)
-    if roman_match:
-        return {
-            'original': chord_string,
-            'type': ChordType.ROMAN,
-            'root': roman_match.group(),
-            'quality': None,
-            'extensions': None,
-            'bass': None
-        }
-
-    chord_pattern = f"{ROOT_PATTERN.pattern}{QUALITY_PATTERN.pattern}{EXTENSIONS_PATTERN.pattern}{BASS_PATTERN.pattern}$"
-    match = re.match(chord_pattern, chord_string)
-
-    if match:
-        root, quality, extensions, bass = match.groups()
-        return {
-            'original': chord_string,
-            'type': ChordType.CHORD_SYMBOL,
-            'root': root,
-            'quality': quality,
-            'extensions': re.findall(r'(?:maj|add|sus|[0-9])*[0-9]+', extensions) if extensions else None,
-            'bass': bass
-        }
-
-    return {
-        'original': chord_string,
-        'type': ChordType.INVALID,
-        'root': None,
-        'quality': None,
-        'extensions': None,
-        'bass': None
-    }
+    roman, _, root, quality, extensions, bass = match.groups()
+    if roman is not None:
+        return ChordToken(chord_string, ChordType.ROMAN, roman, None, None, None)
+    # A single repetition of the extensions group always spans every extension
+    return ChordToken(chord_string, ChordType.CHORD_SYMBOL, root, quality, (extensions,) if extensions else None, bass)
 
 def format_chord_token(token):
-    if token['type'] == ChordType.ROMAN:
-        return token['original']
-    if token['type'] == ChordType.CHORD_SYMBOL:
-        chord = token['root'] + (token['quality'] or "")
-        if token['extensions']:
-            chord += "".join(token['extensions'])
-        if token['bass']:
-            chord += f"/{token['bass']}"
+    if token.type == ChordType.ROMAN:
+        return token.original
+    if token.type == ChordType.CHORD_SYMBOL:
+        chord = token.root + (token.quality or "")
+        if token.extensions:
+            chord += "".join(token.extensions)
+        if token.bass:
+            chord += f"/{token.bass}"
         return chord
     return "Invalid Chord"
 
 def tokenize_progression(progression_string):
-    chords = progression_string.split('-')
-    return [tokenize_chord(chord) for chord in chords]
+    return [tokenize_chord(chord) for chord in progression_string.split('-')]
+
+def tokenize_progressions(progression_strings):
+    # Bulk variant for large corpora: one progression per string, blank lines skipped
+    tokenize = tokenize_chord
+    for progression_string in progression_strings:
+        progression_string = progression_string.strip()
+        if progression_string:
+            yield [tokenize(chord) for chord in progression_string.split('-')]
+
+def tokenize_corpus(path):
+    with open(path, encoding='utf-8') as corpus:
+        yield from tokenize_progressions(corpus)
+
+class ProgressionStreamParser:
+    """Tokenizes a progression as text arrives; a chord is complete once a dash or newline follows it."""
+
+    SEPARATOR_PATTERN = re.compile(r'[-\n]')
+
+    def __init__(self):
+        self.buffer = ''
+
+    def feed(self, text):
+        self.buffer += text
+        *complete, self.buffer = self.SEPARATOR_PATTERN.split(self.buffer)
+        return [tokenize_chord(chord) for chord in complete if chord.strip()]
+
+    def finish(self):
+        chord, self.buffer = self.buffer, ''
+        return [tokenize_chord(chord)] if chord.strip() else []
@@ -0,0 +1,269 @@
+import json
+import os
+import random
+import re
+import sqlite3
+import struct
+import sys
+import threading
+from array import array
+from bisect import bisect
+from itertools import accumulate
+from chord_tokenizer import tokenize_chord, tokenize_progression
+from progression_cache import parse_cache_key
+from chord_resolver import SHARP_NAMES, MAJOR_SCALE, pitch_class, resolve_roman
+from utils import ChordType
+
+MAGIC = b'PCIX'
+VERSION = 1
+DEFAULT_ORDER = 3  # Two chords of context
+START = 0  # Symbol id 0 pads the context before the first chord
+DEGREE_NAMES = ['I', 'bII', 'II', 'bIII', 'III', 'IV', '#IV', 'V', 'bVI', 'VI', 'bVII', 'VII']
+SYMBOL_PATTERN = re.compile(r'^([b#]?)(VII|VI|V|IV|III|II|I|vii|vi|v|iv|iii|ii|i)([°+]?)(.*)$')
+NUMERALS = ['I', 'II', 'III', 'IV', 'V', 'VI', 'VII']
+ROMAN_TRIAD = re.compile(r'([iIvV]+)([°oø+]?)')  # The numeral and quality mark, without inversion or seventh
+
+
+def key_tonic(key):
+    return pitch_class(key.rstrip('m'))
+
+
+def degree_symbol(interval, minor=False, diminished=False, augmented=False, suffix=''):
+    name = DEGREE_NAMES[interval % 12]
+    if minor or diminished:
+        name = name.lower()
+    return name + ('°' if diminished else '+' if augmented else '') + suffix
+
+
+def normalize_chord(chord, tonic):
+    """Key-independent roman-style symbol for a chord figure, e.g. 'Am7' in C is 'vi7'; None if unparseable."""
+    token = tokenize_chord(chord)
+    if token.type == ChordType.CHORD_SYMBOL:
+        quality = token.quality
+        suffix = ''.join(token.extensions or ())
+        if quality in ('maj', 'M') and suffix:
+            suffix = 'maj' + suffix
+        return degree_symbol(pitch_class(token.root) - tonic, quality in ('m', 'min'), quality == 'dim',
+                             quality in ('+', 'aug'), suffix)
+    if token.type == ChordType.ROMAN:
+        # Romans read in the major key, as the player resolves them; the
+        # quality is read off the resolved triad, so 'viio' stays diminished
+        # and a bare 'vii' is minor, as music21 plays it
+        numeral, mark = ROMAN_TRIAD.match(token.original).groups()
+        try:
+            root, third, fifth = resolve_roman(numeral + mark.replace('ø', '°'), 'C').midi[:3]
+        except Exception:
+            return None
+        return degree_symbol(root, third - root == 3, fifth - root == 6, fifth - root == 8)
+    return None
+
+
+def denormalize_symbol(symbol, key):
+    """Chord symbol figure for a normalized symbol in ``key``, e.g. 'vi7' in G is 'Em7'."""
+    accidental, numeral, mark, suffix = SYMBOL_PATTERN.match(symbol).groups()
+    interval = MAJOR_SCALE[NUMERALS.index(numeral.upper())] + {'b': -1, '#': 1}.get(accidental, 0)
+    root = SHARP_NAMES[(key_tonic(key) + interval) % 12]
+    quality = 'dim' if mark == '°' else 'aug' if mark == '+' else 'm' if numeral.islower() else ''
+    return root + quality + suffix
+
+
+class TransitionModel:
+    """N-gram chord transitions with backoff to shorter contexts; sampling is a dict lookup and a bisect."""
+
+    def __init__(self, sequences, order=DEFAULT_ORDER):
+        self.order = order
+        counts = {}
+        for sequence in sequences:
+            padded = (START,) * (order - 1) + tuple(sequence)
+            for i in range(order - 1, len(padded)):
+                for n in range(order):
+                    following = counts.setdefault(padded[i - n:i], {})
+                    following[padded[i]] = following.get(padded[i], 0) + 1
+        self.table = {context: (tuple(following), list(accumulate(following.values())))
+                      for context, following in counts.items()}
+
+    def __bool__(self):
+        return bool(self.table)
+
+    def generate(self, length, rng=random):
+        history = (START,) * (self.order - 1)
+        sequence = []
+        while len(sequence) < length:
+            for n in range(self.order - 1, -1, -1):
+                entry = self.table.get(history[len(history) - n:] if n else ())
+                if entry is not None:
+                    break
+            symbols, cumulative = entry
+            symbol = symbols[bisect(cumulative, rng.random() * cumulative[-1])]
+            sequence.append(symbol)
+            history = (history + (symbol,))[1:] if self.order > 1 else ()
+        return sequence
+
+
+class ProgressionCorpus:
+    """Every progression we have seen, transposed to key-independent symbols and stored in flat arrays.
+
+    Progression ``i`` is ``chords[offsets[i]:offsets[i + 1]]`` (symbol ids),
+    with its mode in ``modes`` and its style tag (an artist, or '') in
+    ``tags``. Transition models are built per mode/tag filter on first use
+    and dropped whenever the corpus grows.
+    """
+
+    def __init__(self, order=DEFAULT_ORDER):
+        self.order = order
+        self.symbols = ['']  # id 0 is START
+        self.symbol_ids = {}
+        self.tag_names = ['']
+        self.tag_ids = {'': 0}
+        self.chords = array('H')
+        self.offsets = array('I', [0])
+        self.modes = array('B')
+        self.tags = array('H')
+        self.seen = set()
+        self.models = {}
+        self.dirty = False
+        self.lock = threading.Lock()
+
+    def __len__(self):
+        return len(self.modes)
+
+    def symbol_id(self, symbol):
+        symbol_id = self.symbol_ids.get(symbol)
+        if symbol_id is None:
+            symbol_id = self.symbol_ids[symbol] = len(self.symbols)
+            self.symbols.append(symbol)
+        return symbol_id
+
+    def tag_id(self, tag):
+        tag = ' '.join(tag.lower().split()) if tag else ''
+        tag_id = self.tag_ids.get(tag)
+        if tag_id is None:
+            tag_id = self.tag_ids[tag] = len(self.tag_names)
+            self.tag_names.append(tag)
+        return tag_id
+
+    def add(self, progression, key, is_minor=False, tag=None):
+        """Add a progression (figures, or a dash-separated string) played in ``key``; returns False for duplicates."""
+        if isinstance(progression, str):
+            progression = [token.original for token in tokenize_progression(progression)]
+        tonic = key_tonic(key)
+        symbols = [symbol for symbol in (normalize_chord(chord, tonic) for chord in progression) if symbol]
+        if not symbols:
+            return False
+        with self.lock:
+            ids = tuple(self.symbol_id(symbol) for symbol in symbols)
+            tag_id = self.tag_id(tag)
+            if (ids, bool(is_minor), tag_id) in self.seen:
+                return False
+            self.seen.add((ids, bool(is_minor), tag_id))
+            self.chords.extend(ids)
+            self.offsets.append(len(self.chords))
+            self.modes.append(bool(is_minor))
+            self.tags.append(tag_id)
+            self.models.clear()
+            self.dirty = True
+            return True
+
+    def sequences(self, is_minor=None, tag=None):
+        tag_id = self.tag_ids.get(' '.join(tag.lower().split()), -1) if tag else None
+        for i in range(len(self.modes)):
+            if (is_minor is None or self.modes[i] == is_minor) and (tag_id is None or self.tags[i] == tag_id):
+                yield self.chords[self.offsets[i]:self.offsets[i + 1]]
+
+    def model(self, is_minor=None, tag=None):
+        filters = (is_minor, tag)
+        with self.lock:
+            model = self.models.get(filters)
+            if model is None:
+                model = self.models[filters] = TransitionModel(self.sequences(is_minor, tag), self.order)
+            return model
+
+    def generate(self, key, is_minor, length, tag=None, rng=random):
+        """Sample ``length`` chord figures in ``key``; the tag and mode filters are relaxed when they match nothing."""
+        for filters in dict.fromkeys(((is_minor, tag), (is_minor, None), (None, None))):
+            model = self.model(*filters)
+            if model:
+                return [denormalize_symbol(self.symbols[symbol], key) for symbol in model.generate(length, rng)]
+        return None
+
+    def stats(self):
+        with self.lock:
+            return {'progressions': len(self.modes), 'chords': len(self.chords), 'symbols': len(self.symbols) - 1,
+                    'tags': len(self.tag_names) - 1}
+
+    def save(self, path):
+        with self.lock:
+            header = json.dumps({'version': VERSION, 'order': self.order, 'byteorder': sys.byteorder,
+                                 'symbols': self.symbols, 'tags': self.tag_names,
+                                 'progressions': len(self.modes), 'chords': len(self.chords)}).encode()
+            with open(path + '.tmp', 'wb') as f:
+                f.write(MAGIC + struct.pack('>I', len(header)) + header)
+                for data in (self.chords, self.offsets, self.modes, self.tags):
+                    data.tofile(f)
+            os.replace(path + '.tmp', path)
+            self.dirty = False
+
+    @classmethod
+    def load(cls, path):
+        with open(path, 'rb') as f:
+            if f.read(4) != MAGIC:
+                raise ValueError(f"{path} is not a progression corpus")
+            header = json.loads(f.read(struct.unpack('>I', f.read(4))[0]))
+            corpus = cls(header['order'])
+            corpus.symbols = header['symbols']
+            corpus.symbol_ids = {symbol: i for i, symbol in enumerate(corpus.symbols) if i}
+            corpus.tag_names = header['tags']
+            corpus.tag_ids = {tag: i for i, tag in enumerate(corpus.tag_names)}
+            corpus.chords = array('H')
+            corpus.chords.fromfile(f, header['chords'])
+            corpus.offsets = array('I')
+            corpus.offsets.fromfile(f, header['progressions'] + 1)
+            corpus.modes.fromfile(f, header['progressions'])
+            corpus.tags.fromfile(f, header['progressions'])
+        if header['byteorder'] != sys.byteorder:
+            for data in (corpus.chords, corpus.offsets, corpus.tags):
+                data.byteswap()
+        for i in range(len(corpus.modes)):
+            corpus.seen.add((tuple(corpus.chords[corpus.offsets[i]:corpus.offsets[i + 1]]), bool(corpus.modes[i]),
+                             corpus.tags[i]))
+        return corpus
+
+    def import_progression_cache(self, path):
+        """Add every LLM response stored in a ProgressionCache database."""
+        db = sqlite3.connect(path)
+        try:
+            rows = db.execute("SELECT key, response FROM progressions").fetchall()
+        except sqlite3.OperationalError:
+            rows = []
+        finally:
+            db.close()
+        added = 0
+        for key, response in rows:
+            try:
+                key, is_minor, _, artist = parse_cache_key(key)[:4]
+            except ValueError:
+                continue  # Keys from before the current layout
+            added += self.add(response, key, is_minor, artist)
+        return added
+
+    def import_manifest(self, path):
+        """Add the progressions recorded in a batch run's manifest.jsonl."""
+        added = 0
+        with open(path) as f:
+            for line in f:
+                try:
+                    record = json.loads(line)
+                except json.JSONDecodeError:
+                    continue
+                added += self.add(record['progression'], record['key'], record['key'].endswith('m'), record['artist'])
+        return added
+
+    def import_text(self, path, key='C', is_minor=False, tag=None):
+        """Add one dash-separated progression per line, all in ``key``."""
+        added = 0
+        with open(path, encoding='utf-8') as f:
+            for line in f:
+                if line.strip():
+                    added += self.add(line.strip(), key, is_minor, tag)
+        return added
+
@@ -0,0 +1,168 @@
+import atexit
+import functools
+import json
+import math
+import os
+import threading
+import time
+from collections import deque
+
+BUCKETS_PER_DOUBLING = 8  # Bucket edges 9% apart, so percentiles are within about 5%
+SMALLEST_SPAN = 1e-6  # seconds; anything faster lands in the first bucket
+TRACE_EVENTS = 10000
+
+enabled = os.environ.get("CHORD_STATS") == "1"
+histograms = {}
+trace = deque(maxlen=TRACE_EVENTS)
+profiler = None
+lock = threading.Lock()
+
+
+class Histogram:
+    """Log-bucketed latency histogram: O(1) to record, percentiles read from the bucket counts."""
+
+    def __init__(self):
+        self.buckets = {}
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+
+    def record(self, seconds):
+        index = int(BUCKETS_PER_DOUBLING * math.log2(max(seconds, SMALLEST_SPAN) / SMALLEST_SPAN))
+        self.buckets[index] = self.buckets.get(index, 0) + 1
+        self.count += 1
+        self.total += seconds
+        self.max = max(self.max, seconds)
+
+    def percentile(self, fraction):
+        rank = fraction * self.count
+        seen = 0
+        for index in sorted(self.buckets):
+            seen += self.buckets[index]
+            if seen >= rank:
+                # Geometric middle of the bucket, capped by the largest sample seen
+                return min(self.max, SMALLEST_SPAN * 2 ** ((index + 0.5) / BUCKETS_PER_DOUBLING))
+        return self.max
+
+    def summary(self):
+        if not self.count:
+            return {'count': 0, 'mean_ms': 0.0, 'p50_ms': 0.0, 'p95_ms': 0.0, 'p99_ms': 0.0, 'max_ms': 0.0}
+        return {
+            'count': self.count,
+            'mean_ms': self.total / self.count * 1000,
+            'p50_ms': self.percentile(0.50) * 1000,
+            'p95_ms': self.percentile(0.95) * 1000,
+            'p99_ms': self.percentile(0.99) * 1000,
+            'max_ms': self.max * 1000,
+        }
+
+
+def enable(on=True):
+    global enabled
+    enabled = on
+
+
+def record(name, seconds, start=None):
+    with lock:
+        histogram = histograms.get(name)
+        if histogram is None:
+            histogram = histograms[name] = Histogram()
+        histogram.record(seconds)
+        if start is not None:
+            trace.append((name, start, seconds, threading.get_ident()))
+
+
+class Span:
+    __slots__ = ('name', 'start')
+
+    def __init__(self, name):
+        self.name = name
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc_info):
+        record(self.name, time.perf_counter() - self.start, self.start)
+        return False
+
+
+class NullSpan:
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        return False
+
+
+NULL_SPAN = NullSpan()
+
+
+def span(name):
+    """Time a block under ``name``; a shared no-op when instrumentation is off."""
+    return Span(name) if enabled else NULL_SPAN
+
+
+def timed(name):
+    def decorator(func):
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            if not enabled:
+                return func(*args, **kwargs)
+            start = time.perf_counter()
+            try:
+                return func(*args, **kwargs)
+            finally:
+                record(name, time.perf_counter() - start, start)
+        return wrapper
+    return decorator
+
+
+def summary():
+    with lock:
+        return {name: histogram.summary() for name, histogram in histograms.items()}
+
+
+def reset():
+    with lock:
+        histograms.clear()
+        trace.clear()
+
+
+def dump_trace(path):
+    # Chrome trace event format; open in chrome://tracing or Perfetto
+    with lock:
+        events = [{'name': name, 'ph': 'X', 'ts': start * 1e6, 'dur': seconds * 1e6, 'pid': os.getpid(), 'tid': thread}
+                  for name, start, seconds, thread in trace]
+    with open(path, 'w') as f:
+        json.dump({'traceEvents': events}, f)
+    return len(events)
+
+
+def start_profile():
+    global profiler
+    import cProfile
+    if profiler is None:
+        profiler = cProfile.Profile()
+        profiler.enable()
+
+
+def stop_profile(path):
+    global profiler
+    if profiler is None:
+        return False
+    profiler.disable()
+    profiler.dump_stats(path)  # Read with: python -m pstats <path>
+    profiler = None
+    return True
+
+
+def is_profiling():
+    return profiler is not None
+
+
+if os.environ.get("CHORD_PROFILE"):
+    start_profile()
+    atexit.register(stop_profile, os.environ["CHORD_PROFILE"])
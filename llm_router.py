@@ -0,0 +1,276 @@
+import logging
+import os
+import threading
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, wait
+from ollama_interface import OllamaAPI, DEFAULT_MODEL, DEFAULT_TIMEOUT
+
+DEFAULT_ENDPOINT = "http://192.168.0.214:7869"  # Update with your actual Ollama instance
+EWMA_ALPHA = 0.2
+INITIAL_HEDGE_DELAY = 2.0  # seconds, until an endpoint has enough samples for a p95
+MIN_HEDGE_DELAY = 0.2
+HEDGE_SAMPLES = 5
+QUEUE_TIMEOUT = 10.0  # seconds a request waits for a slot on a busy endpoint before falling back
+CANCEL_POLL = 0.05  # seconds between checks of the caller's cancel event while waiting
+
+
+def endpoints_from_env(variable="OLLAMA_ENDPOINTS", default=DEFAULT_ENDPOINT):
+    """Endpoints from e.g. ``OLLAMA_ENDPOINTS="http://a:11434|llama3.1|2,http://b:11434|mistral"``
+    (url, optional model, optional concurrency limit)."""
+    endpoints = []
+    for entry in os.environ.get(variable, default).split(','):
+        if entry.strip():
+            url, model, concurrency = (entry.strip().split('|') + ['', ''])[:3]
+            endpoints.append(Endpoint(url, model or DEFAULT_MODEL, int(concurrency or 2)))
+    return endpoints
+
+
+class CircuitBreaker:
+    """Opens after ``failure_threshold`` consecutive failures; after ``reset_timeout`` one probe is let through."""
+
+    def __init__(self, failure_threshold=3, reset_timeout=30.0):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.failures = 0
+        self.opened_at = None
+        self.probing = False
+
+    @property
+    def state(self):
+        if self.opened_at is None:
+            return 'closed'
+        return 'half-open' if time.monotonic() - self.opened_at >= self.reset_timeout else 'open'
+
+    def blocked(self):
+        """True while ``allow`` would refuse; unlike ``allow`` it never claims the half-open probe."""
+        return self.opened_at is not None and (time.monotonic() - self.opened_at < self.reset_timeout or self.probing)
+
+    def allow(self):
+        if self.opened_at is None:
+            return True
+        if time.monotonic() - self.opened_at >= self.reset_timeout and not self.probing:
+            self.probing = True
+            return True
+        return False
+
+    def record_success(self):
+        self.failures = 0
+        self.opened_at = None
+        self.probing = False
+
+    def record_failure(self):
+        self.failures += 1
+        if self.failures >= self.failure_threshold or self.probing:
+            self.opened_at = time.monotonic()
+        self.probing = False
+
+    def record_cancelled(self):
+        # A probe we hung up on proved nothing either way; let the next request probe instead
+        self.probing = False
+
+
+class Endpoint:
+    def __init__(self, api_url, model=DEFAULT_MODEL, max_concurrency=2, timeout=DEFAULT_TIMEOUT, breaker=None):
+        self.api = OllamaAPI(api_url, model, timeout)
+        self.max_concurrency = max_concurrency
+        self.breaker = breaker or CircuitBreaker()
+        self.in_flight = 0
+        self.ewma = None
+        self.latencies = deque(maxlen=200)
+        self.successes = 0
+        self.failures = 0
+
+    @property
+    def name(self):
+        return f"{self.api.model}@{self.api.api_url}"
+
+    def score(self):
+        # Expected wait: smoothed latency scaled by the requests already queued on it.
+        # Endpoints without samples score 0 so each gets tried early.
+        return (self.ewma or 0.0) * (1 + self.in_flight)
+
+    def record_latency(self, seconds, alpha=EWMA_ALPHA):
+        self.ewma = seconds if self.ewma is None else alpha * seconds + (1 - alpha) * self.ewma
+        self.latencies.append(seconds)
+
+    def p95(self):
+        if len(self.latencies) < HEDGE_SAMPLES:
+            return None
+        samples = sorted(self.latencies)
+        return samples[min(len(samples) - 1, int(len(samples) * 0.95))]
+
+
+class OllamaRouter:
+    """Drop-in for OllamaAPI that spreads requests over several Ollama endpoints and models.
+
+    Each request goes to the allowed endpoint with the lowest expected wait
+    (EWMA latency times queue depth), within its concurrency limit; when every
+    healthy endpoint is at its limit it waits up to ``queue_timeout`` for a
+    slot. If no answer has come back by that endpoint's p95 latency, a hedged
+    duplicate goes to the next best endpoint with a free slot, the first valid
+    answer wins and the losers are cancelled. Failures are retried elsewhere
+    straight away. Endpoints that keep failing are cut off by a circuit
+    breaker. When nothing can answer, the router returns None and the player
+    falls back to the corpus or random generator.
+    """
+
+    def __init__(self, endpoints, initial_hedge_delay=INITIAL_HEDGE_DELAY, min_hedge_delay=MIN_HEDGE_DELAY,
+                 queue_timeout=QUEUE_TIMEOUT):
+        self.endpoints = list(endpoints)
+        self.initial_hedge_delay = initial_hedge_delay
+        self.min_hedge_delay = min_hedge_delay
+        self.queue_timeout = queue_timeout
+        self.lock = threading.Lock()
+        self.slot_freed = threading.Condition(self.lock)
+        self.executor = ThreadPoolExecutor(max_workers=sum(endpoint.max_concurrency for endpoint in self.endpoints),
+                                           thread_name_prefix="ollama-router")
+        self.requests = 0
+        self.hedges = 0
+        self.hedge_wins = 0
+        self.unavailable = 0
+        self.queue_timeouts = 0
+        self.failed = 0
+
+    def acquire(self, exclude=(), timeout=0.0, cancel=None):
+        """Take a slot on the best endpoint outside ``exclude``, waiting up to ``timeout`` seconds
+        for a busy one to free up. Returns None straight away when every candidate's breaker is open."""
+        deadline = time.perf_counter() + timeout
+        with self.slot_freed:
+            while cancel is None or not cancel.is_set():
+                candidates = [endpoint for endpoint in self.endpoints
+                              if endpoint not in exclude and not endpoint.breaker.blocked()]
+                if not candidates:
+                    return None
+                for endpoint in sorted(candidates, key=Endpoint.score):
+                    if endpoint.in_flight < endpoint.max_concurrency and endpoint.breaker.allow():
+                        endpoint.in_flight += 1
+                        return endpoint
+                remaining = deadline - time.perf_counter()
+                if remaining <= 0:
+                    return None
+                self.slot_freed.wait(remaining if cancel is None else min(remaining, CANCEL_POLL))
+        return None
+
+    def call(self, endpoint, method, args, cancel):
+        start = time.perf_counter()
+        try:
+            result = None if cancel.is_set() else getattr(endpoint.api, method)(*args, cancel=cancel)
+        except Exception as e:
+            logging.error(f"Error from {endpoint.name}: {e}")
+            result = None
+        elapsed = time.perf_counter() - start
+        with self.slot_freed:
+            endpoint.in_flight -= 1
+            if result:
+                endpoint.successes += 1
+                endpoint.record_latency(elapsed)
+                endpoint.breaker.record_success()
+            elif cancel.is_set():
+                endpoint.breaker.record_cancelled()  # A losing hedge says nothing about the endpoint
+            else:
+                endpoint.failures += 1
+                endpoint.breaker.record_failure()
+            self.slot_freed.notify_all()
+        return result
+
+    def hedge_delay(self, endpoint):
+        with self.lock:
+            p95 = endpoint.p95()
+        return self.initial_hedge_delay if p95 is None else max(self.min_hedge_delay, p95)
+
+    def generate_progression_with_ollama(self, prompt, chord_limit=None, cancel=None):
+        return self.route('generate_progression_with_ollama', prompt, chord_limit, cancel=cancel)
+
+    def generate_chords(self, prompt, count, cancel=None):
+        return self.route('generate_chords', prompt, count, cancel=cancel)
+
+    def route(self, method, *args, cancel=None):
+        # ``cancel`` is the caller's: once set, every call still in flight hangs up and None comes back
+        with self.lock:
+            self.requests += 1
+        queue_deadline = time.perf_counter() + self.queue_timeout
+        tried = []
+        hedged = set()
+        pending = {}
+        deadline = None
+        try:
+            while True:
+                if deadline is None or time.perf_counter() >= deadline:
+                    # First attempts and retries queue for a slot; a hedge only takes one that is free now
+                    timeout = 0.0 if pending else max(0.0, queue_deadline - time.perf_counter())
+                    endpoint = self.acquire(exclude=tried, timeout=timeout, cancel=cancel)
+                    if endpoint is not None:
+                        if pending:
+                            hedged.add(endpoint)
+                            with self.lock:
+                                self.hedges += 1
+                        tried.append(endpoint)
+                        hang_up = threading.Event()
+                        pending[self.executor.submit(self.call, endpoint, method, args, hang_up)] = endpoint, hang_up
+                        deadline = time.perf_counter() + self.hedge_delay(endpoint)
+                    elif not pending:
+                        if cancel is None or not cancel.is_set():
+                            self.give_up(tried)
+                        return None
+                    else:
+                        deadline = float('inf')  # Nothing left to hedge with; wait for what is in flight
+
+                timeout = None if deadline == float('inf') else max(0.0, deadline - time.perf_counter())
+                if cancel is not None:
+                    timeout = CANCEL_POLL if timeout is None else min(timeout, CANCEL_POLL)
+                done, _ = wait(pending, timeout=timeout, return_when=FIRST_COMPLETED)
+                if cancel is not None and cancel.is_set():
+                    return None
+                for future in done:
+                    endpoint, _ = pending.pop(future)
+                    result = future.result()
+                    if result:
+                        if endpoint in hedged:
+                            with self.lock:
+                                self.hedge_wins += 1
+                        return result
+                if done and not pending:
+                    deadline = None  # Every request so far failed: retry on another endpoint now
+        finally:
+            for endpoint, hang_up in pending.values():
+                hang_up.set()  # Losers hang up; call() still runs so their slots are released
+
+    def give_up(self, tried):
+        with self.lock:
+            untried = [endpoint for endpoint in self.endpoints if endpoint not in tried]
+            if not untried:
+                self.failed += 1
+                reason = "Every Ollama endpoint failed"
+            elif all(endpoint.breaker.blocked() for endpoint in untried):
+                self.unavailable += 1
+                reason = "No Ollama endpoint available"
+            else:
+                self.queue_timeouts += 1
+                reason = "Timed out waiting for a free Ollama endpoint"
+        logging.warning(f"{reason}; falling back to local generation")
+
+    def stats(self):
+        with self.lock:
+            return {
+                'requests': self.requests,
+                'hedges': self.hedges,
+                'hedge_wins': self.hedge_wins,
+                'unavailable': self.unavailable,
+                'queue_timeouts': self.queue_timeouts,
+                'failed': self.failed,
+                'endpoints': [{
+                    'name': endpoint.name,
+                    'state': endpoint.breaker.state,
+                    'in_flight': endpoint.in_flight,
+                    'ewma_ms': (endpoint.ewma or 0.0) * 1000,
+                    'p95_ms': (endpoint.p95() or 0.0) * 1000,
+                    'successes': endpoint.successes,
+                    'failures': endpoint.failures,
+                } for endpoint in self.endpoints],
+            }
+
+    def close(self):
+        self.executor.shutdown(wait=False, cancel_futures=True)
+        for endpoint in self.endpoints:
+            endpoint.api.close()
@@ -0,0 +1,108 @@
+import logging
+import threading
+from chord_tokenizer import tokenize_chord, format_chord_token
+from chord_resolver import resolve_roman, resolve_chord_symbol
+from utils import ChordType
+
+MAX_REASKS = 2
+
+
+def is_valid_chord(chord):
+    """True when the player can resolve ``chord`` to pitches instead of padding it with the tonic."""
+    if not isinstance(chord, str):
+        return False
+    token = tokenize_chord(chord)
+    try:
+        if token.type == ChordType.ROMAN:
+            return resolve_roman(token.root, 'C') is not None
+        if token.type == ChordType.CHORD_SYMBOL:
+            return resolve_chord_symbol(format_chord_token(token), token.bass) is not None
+    except Exception:
+        return False
+    return False
+
+
+def invalid_positions(chords):
+    return [i for i, chord in enumerate(chords) if not is_valid_chord(chord)]
+
+
+def reask_prompt(prompt, chords, positions):
+    shown = '-'.join(f"[{chord or '?'}]" if i in positions else chord for i, chord in enumerate(chords))
+    numbers = ', '.join(str(i + 1) for i in positions)
+    return (f"{prompt}\nYour previous answer was {shown}. The bracketed chords (positions {numbers}) are not valid "
+            f"chord names. Give {len(positions)} valid chord(s) to replace only those positions, in order.")
+
+
+class OutputValidator:
+    """Checks LLM chord lists locally and re-asks only for the positions that failed.
+
+    APIs with ``generate_chords`` are asked for schema-constrained JSON; a
+    reply that still has unusable chords is repaired with up to
+    ``max_reasks`` short follow-up requests for just those positions, instead
+    of being thrown away or padded with the tonic. Anything else (stubs, older
+    APIs) is passed straight through.
+    """
+
+    def __init__(self, max_reasks=MAX_REASKS):
+        self.max_reasks = max_reasks
+        self.lock = threading.Lock()
+        self.progressions = 0
+        self.usable = 0
+        self.calls = 0
+        self.reasks = 0
+        self.tokens = 0
+        self.invalid_tokens = 0
+
+    def record(self, calls=0, reasks=0, tokens=0, invalid_tokens=0):
+        with self.lock:
+            self.calls += calls
+            self.reasks += reasks
+            self.tokens += tokens
+            self.invalid_tokens += invalid_tokens
+
+    def generate(self, api, prompt, count, cancel=None):
+        if not hasattr(api, 'generate_chords'):
+            return api.generate_progression_with_ollama(prompt, chord_limit=count, cancel=cancel)
+
+        with self.lock:
+            self.progressions += 1
+        chords = api.generate_chords(prompt, count, cancel=cancel)
+        self.record(calls=1)
+        if chords is None:
+            return None
+        chords = (list(chords) + [None] * count)[:count]
+        invalid = invalid_positions(chords)
+        self.record(tokens=count, invalid_tokens=len(invalid))
+
+        for _ in range(self.max_reasks):
+            if not invalid or (cancel is not None and cancel.is_set()):
+                break
+            replacements = api.generate_chords(reask_prompt(prompt, chords, invalid), len(invalid), cancel=cancel)
+            self.record(calls=1, reasks=1)
+            if replacements is None:
+                break
+            for i, chord in zip(invalid, replacements):
+                chords[i] = chord
+            still_invalid = invalid_positions(chords)
+            self.record(tokens=len(invalid), invalid_tokens=len(still_invalid))
+            invalid = still_invalid
+
+        if invalid:
+            logging.warning(f"Dropping {len(invalid)} invalid chord(s) after {self.max_reasks} re-asks")
+        else:
+            with self.lock:
+                self.usable += 1
+        valid = [chord for i, chord in enumerate(chords) if i not in invalid]
+        return '-'.join(valid) if valid else None
+
+    def stats(self):
+        with self.lock:
+            return {
+                'progressions': self.progressions,
+                'usable': self.usable,
+                'calls': self.calls,
+                'reasks': self.reasks,
+                'invalid_token_rate': self.invalid_tokens / self.tokens if self.tokens else 0.0,
+                'reasks_per_success': self.reasks / self.usable if self.usable else 0.0,
+                'calls_per_usable': self.calls / self.usable if self.usable else 0.0,
+            }
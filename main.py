@@ -1,9 +1,11 @@
-import pygame
-from chord_player import ChordProgressionPlayer
+import threading
+import instrumentation
+from chord_player import ChordProgressionPlayer, preload_modules
 
 def main():
-    pygame.mixer.init()
+    threading.Thread(target=preload_modules, daemon=True).start()
     player = ChordProgressionPlayer()
+    player.prefetch()
 
     print("Welcome to the Chord Progression Chat!")
     print("Commands:")
@@ -12,19 +14,30 @@ def main():
     print("  key <key> - Change the key signature (e.g., 'key G' or 'key Em')")
     print("  length <num> - Set the number of chords in the progression (e.g., 'length 6')")
     print("  artist <name> - Set an artist to emulate (e.g., 'artist The Beatles')")
+    print("  midi <port> - Send chords and clock to a MIDI port ('midi list', 'midi virtual', 'midi off')")
+    print("  arrange <on|off> - Play chord, bass and two arpeggiators on MIDI channels 1-4 ('arrange' shows part timings)")
+    print("  jitter - Show MIDI output timing statistics")
+    print("  cache - Show progression cache statistics")
+    print("  backends - Show the health and latency of each Ollama endpoint, and how often its chords need re-asking")
+    print("  backend <ollama|corpus> - Generate with Ollama or offline from the corpus of past progressions")
+    print("  corpus [import <file>] - Show corpus statistics, or import a batch manifest.jsonl or a file of progressions in C")
+    print("  stats [on|off|reset] - Show or toggle latency histograms for generate, parse, voice, render and playback")
+    print("  stats profile [file] - Start cProfile, or stop it and write the stats file (default profile.pstats)")
+    print("  stats trace [file] - Write recorded spans as a Chrome trace (default trace.json)")
     print("  stop - Stop playing")
     print("  quit - Exit the program")
 
     while True:
-        command = input("Enter a command: ").strip().lower()
+        line = input("Enter a command: ").strip()
+        command = line.lower()
 
         if command == "generate":
             new_progression = player.generate_progression_with_ollama()
             key_name = f"{player.key}{'m' if player.is_minor else ''}"
             formatted_progression = [player.format_chord(chord) for chord in new_progression]
             print(f"New progression: {'-'.join(formatted_progression)} in key of {key_name}")
-            player.stop_playing()
             player.start_playing(new_progression)
+            player.create_session_midi()
 
         elif command.startswith("tempo "):
             try:
@@ -33,7 +46,7 @@ def main():
                     player.set_tempo(new_tempo)
                     print(f"Tempo changed to {new_tempo} BPM.")
                     if player.is_playing:
-                        print("Restart playback to apply the new tempo.")
+                        print("The new tempo starts at the next bar.")
                 else:
                     print("Tempo should be between 40 and 240 BPM.")
             except (IndexError, ValueError):
@@ -43,8 +56,9 @@ def main():
             new_key = command.split()[1].capitalize()
             if player.set_key(new_key):
                 print(f"Key signature changed to {new_key}.")
+                player.prefetch()
                 if player.is_playing:
-                    print("Restart playback to apply the new key.")
+                    print("The progression moves to the new key at the next bar.")
             else:
                 print("Invalid key. Please use C, C#, D, D#, E, F, F#, G, G#, A, A#, or B, optionally followed by 'm' for minor.")
 
@@ -53,6 +67,7 @@ def main():
                 new_length = int(command.split()[1])
                 if player.set_progression_length(new_length):
                     print(f"Progression length set to {new_length} chords.")
+                    player.prefetch()
                 else:
                     print("Invalid length. Please choose a number between 1 and 16.")
             except (IndexError, ValueError):
@@ -62,13 +77,126 @@ def main():
             artist = ' '.join(command.split()[1:])
             player.set_artist(artist)
             print(f"Artist to emulate set to: {artist}")
+            player.prefetch()
+
+        elif command.startswith("midi "):
+            port = ' '.join(command.split()[1:])
+            try:
+                if port == "off":
+                    player.set_midi_output(None)
+                    print("MIDI output disabled.")
+                elif port == "virtual":
+                    player.set_midi_output(virtual=True)
+                    print("Opened virtual MIDI output 'Chord Generator'.")
+                else:
+                    import mido
+                    names = mido.get_output_names()
+                    matches = [name for name in names if name.lower().startswith(port)]
+                    if port == "list":
+                        print("Available MIDI outputs: " + (', '.join(names) if names else "none"))
+                    elif matches:
+                        player.set_midi_output(matches[0])
+                        print(f"MIDI output set to {matches[0]}.")
+                    else:
+                        print("Unknown MIDI port. Use 'midi list' to see available outputs.")
+            except (ImportError, OSError, NotImplementedError) as e:
+                # No rtmidi backend (e.g. no ALSA), virtual ports on Windows, or a port in use
+                print(f"MIDI output unavailable: {e}")
+
+        elif command == "arrange on" or command == "arrange off":
+            player.set_arrangement(command == "arrange on")
+            print("Arrangement " + ("enabled: chord, bass, arpeggiator A and B on channels 1-4." if player.arrangement else "disabled."))
+
+        elif command == "arrange":
+            if player.arrangement is None:
+                print("Arrangement is off. Use 'arrange on'.")
+            else:
+                for name, timing in player.arrangement.timing_summary().items():
+                    print(f"{name}: {timing['renders']} renders, last {timing['last_ms']:.3f} ms, mean {timing['mean_ms']:.3f} ms")
+
+        elif command == "jitter":
+            if player.sequencer is None:
+                print("No MIDI output selected.")
+            else:
+                stats = player.sequencer.jitter.summary()
+                print(f"{stats['events']} events, mean {stats['mean_ms']:.3f} ms, stdev {stats['stdev_ms']:.3f} ms, "
+                      f"p99 {stats['p99_ms']:.3f} ms, max {stats['max_ms']:.3f} ms late")
+
+        elif command == "cache":
+            stats = player.progression_cache.stats()
+            print(f"{stats['entries']} cached progressions, {stats['hits']} hits ({stats['memory_hits']} from memory), "
+                  f"{stats['misses']} misses, hit rate {stats['hit_rate']:.0%}")
+
+        elif command == "backends":
+            stats = player.ollama_api.stats()
+            print(f"{stats['requests']} requests, {stats['hedges']} hedged ({stats['hedge_wins']} won by the hedge), "
+                  f"{stats['unavailable']} with no endpoint available, {stats['queue_timeouts']} timed out "
+                  f"waiting for a slot, {stats['failed']} failed on every endpoint")
+            for endpoint in stats['endpoints']:
+                print(f"  {endpoint['name']}: {endpoint['state']}, {endpoint['in_flight']} in flight, "
+                      f"ewma {endpoint['ewma_ms']:.0f} ms, p95 {endpoint['p95_ms']:.0f} ms, "
+                      f"{endpoint['successes']} ok, {endpoint['failures']} failed")
+            validation = player.output_validator.stats()
+            print(f"{validation['usable']}/{validation['progressions']} progressions usable, "
+                  f"{validation['invalid_token_rate']:.1%} invalid chords, "
+                  f"{validation['reasks_per_success']:.2f} re-asks per success, "
+                  f"{validation['calls_per_usable']:.2f} calls per usable progression")
+
+        elif command.startswith("backend "):
+            backend = command.split(maxsplit=1)[1].strip()
+            if player.set_backend(backend):
+                print(f"Progressions now come from {'Ollama' if backend == 'ollama' else 'the corpus model'}.")
+                player.prefetch()
+            else:
+                print("Unknown backend. Use 'backend ollama' or 'backend corpus'.")
+
+        elif command == "corpus":
+            stats = player.get_corpus().stats()
+            print(f"{stats['progressions']} progressions, {stats['chords']} chords, {stats['symbols']} distinct chords, "
+                  f"{stats['tags']} artists")
+
+        elif command.startswith("corpus import "):
+            path = line.split(maxsplit=2)[2]  # File names keep their case
+            try:
+                corpus = player.get_corpus()
+                added = corpus.import_manifest(path) if path.endswith(".jsonl") else corpus.import_text(path)
+                print(f"Imported {added} new progressions.")
+            except OSError as e:
+                print(f"Could not import {path}: {e}")
+
+        elif command == "stats" or command.startswith("stats "):
+            args = command.split()[1:]
+            if not args:
+                if not instrumentation.enabled:
+                    print("Instrumentation is off. Use 'stats on'.")
+                for name, stats in sorted(instrumentation.summary().items()):
+                    print(f"{name:>18}: {stats['count']:>5} calls, p50 {stats['p50_ms']:.2f} ms, p95 {stats['p95_ms']:.2f} ms, "
+                          f"p99 {stats['p99_ms']:.2f} ms, max {stats['max_ms']:.2f} ms")
+            elif args[0] in ("on", "off"):
+                instrumentation.enable(args[0] == "on")
+                print(f"Instrumentation {args[0]}.")
+            elif args[0] == "reset":
+                instrumentation.reset()
+                print("Statistics cleared.")
+            elif args[0] == "profile":
+                path = args[1] if len(args) > 1 else "profile.pstats"
+                if instrumentation.stop_profile(path):
+                    print(f"Profile written to {path} (view with 'python -m pstats {path}').")
+                else:
+                    instrumentation.start_profile()
+                    print("Profiling started; run 'stats profile' again to write it.")
+            elif args[0] == "trace":
+                path = args[1] if len(args) > 1 else "trace.json"
+                print(f"Wrote {instrumentation.dump_trace(path)} spans to {path}.")
+            else:
+                print("Unknown stats command. Use 'stats', 'stats on', 'stats off', 'stats reset', 'stats profile' or 'stats trace'.")
 
         elif command == "stop":
             player.stop_playing()
             print("Playback stopped.")
 
         elif command == "quit":
-            player.stop_playing()
+            player.close()
             print("Goodbye!")
             break
 
@@ -0,0 +1,114 @@
+from collections import namedtuple
+import numpy as np
+
+TICKS_PER_BEAT = 960
+END_OF_TRACK = b'\xff\x2f\x00'
+NOTE_OFF = 0x80
+NOTE_ON = 0x90
+MAX_DELTA = 0x0FFFFFFF  # Largest value a four byte variable-length quantity can hold
+
+TrackEvents = namedtuple('TrackEvents', ['tick', 'status', 'data1', 'data2'])
+
+
+def variable_length(value):
+    data = bytearray([value & 0x7F])
+    value >>= 7
+    while value:
+        data.insert(0, (value & 0x7F) | 0x80)
+        value >>= 7
+    return bytes(data)
+
+
+def tempo_meta(bpm):
+    return b'\xff\x51\x03' + (60000000 // bpm).to_bytes(3, 'big')
+
+
+def track_name_meta(name):
+    name = name.encode('latin-1', 'replace')
+    return b'\xff\x03' + variable_length(len(name)) + name
+
+
+def note_events(start, duration, pitch, velocity=100, channel=0, ticks_per_beat=TICKS_PER_BEAT):
+    """Note on/off events in tick order from parallel arrays of notes (times in beats).
+
+    At equal ticks note-offs come before note-ons, so a repeated pitch is
+    released before it is struck again. Exact duplicate notes (a doubled
+    voice) are written once, as MIDIUtil does.
+    """
+    start = np.rint(np.asarray(start, dtype=float) * ticks_per_beat).astype(np.int64)
+    end = start + np.rint(np.asarray(duration, dtype=float) * ticks_per_beat).astype(np.int64)
+    pitch = np.asarray(pitch, dtype=np.int64)
+    count = len(pitch)
+    velocity = np.broadcast_to(np.asarray(velocity, dtype=np.int64), (count,))
+    channel = np.broadcast_to(np.asarray(channel, dtype=np.int64), (count,))
+    if count:
+        _, keep = np.unique(np.stack((start, end, pitch, channel), axis=1), axis=0, return_index=True)
+        keep.sort()
+        start, end, pitch, velocity, channel = start[keep], end[keep], pitch[keep], velocity[keep], channel[keep]
+        count = len(keep)
+
+    tick = np.concatenate((end, start))
+    status = np.concatenate((NOTE_OFF | channel, NOTE_ON | channel))
+    data1 = np.concatenate((pitch, pitch))
+    data2 = np.concatenate((np.zeros(count, dtype=np.int64), velocity))
+    order = np.lexsort((status & 0xF0, tick))
+    return TrackEvents(tick[order], status[order], data1[order], data2[order])
+
+
+def encode_track(events=None, name=None, tempo=None, end_tick=None):
+    """Encode one MTrk chunk from tick-ordered channel events.
+
+    Delta times, running status and data bytes are computed as arrays and
+    scattered into one preallocated buffer. ``end_tick`` lets the track
+    carry trailing silence before its End of Track.
+    """
+    meta = bytearray()
+    if name is not None:
+        meta += b'\x00' + track_name_meta(name)
+    if tempo is not None:
+        meta += b'\x00' + tempo_meta(tempo)
+
+    if events is None or len(events.tick) == 0:
+        last_tick = 0
+        body = b''
+    else:
+        tick = np.asarray(events.tick, dtype=np.int64)
+        status = np.asarray(events.status, dtype=np.int64)
+        delta = np.diff(tick, prepend=0)
+        if delta.min() < 0 or delta.max() > MAX_DELTA:
+            raise ValueError("Track events must be in tick order with deltas below 2**28")
+        last_tick = int(tick[-1])
+
+        delta_bytes = 1 + (delta >= 1 << 7) + (delta >= 1 << 14) + (delta >= 1 << 21)
+        # Meta events before the first channel event cancel running status
+        status_bytes = np.diff(status, prepend=-1) != 0
+        data_bytes = np.where((status & 0xE0) == 0xC0, 1, 2)  # program change and channel pressure
+        sizes = delta_bytes + status_bytes + data_bytes
+        offsets = np.cumsum(sizes) - sizes
+
+        body = bytearray(int(sizes.sum()))
+        view = np.frombuffer(body, dtype=np.uint8)
+        for shift in range(4):
+            has_byte = delta_bytes > shift
+            position = offsets + delta_bytes - 1 - shift
+            view[position[has_byte]] = ((delta[has_byte] >> (7 * shift)) & 0x7F) | (0x80 if shift else 0)
+        offsets = offsets + delta_bytes
+        view[offsets[status_bytes]] = status[status_bytes]
+        offsets = offsets + status_bytes
+        view[offsets] = np.asarray(events.data1, dtype=np.int64) & 0x7F
+        two_data = data_bytes == 2
+        view[offsets[two_data] + 1] = np.asarray(events.data2, dtype=np.int64)[two_data] & 0x7F
+
+    end_tick = last_tick if end_tick is None else max(end_tick, last_tick)
+    if end_tick - last_tick > MAX_DELTA:
+        raise ValueError("Trailing silence does not fit in a MIDI delta time")
+    chunk = meta + body + variable_length(end_tick - last_tick) + END_OF_TRACK
+    return b'MTrk' + len(chunk).to_bytes(4, 'big') + bytes(chunk)
+
+
+def encode_smf(tracks, ticks_per_beat=TICKS_PER_BEAT):
+    """Build a Standard MIDI File from encoded tracks (format 0 for one track, format 1 otherwise)."""
+    header = b'MThd' + (6).to_bytes(4, 'big') + (0 if len(tracks) == 1 else 1).to_bytes(2, 'big')
+    header += len(tracks).to_bytes(2, 'big') + ticks_per_beat.to_bytes(2, 'big')
+    return header + b''.join(tracks)
+
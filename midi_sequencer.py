@@ -0,0 +1,252 @@
+import os
+import heapq
+import logging
+import math
+import queue
+import statistics
+import threading
+import time
+from collections import deque
+import mido
+
+CLOCKS_PER_BEAT = 24
+BEATS_PER_BAR = 4
+SPIN_THRESHOLD = 0.002  # Busy-wait the last 2 ms before an event instead of sleeping
+
+# Ordering of simultaneous events: clock first, then releases, then new notes
+CLOCK_PRIORITY = 0
+NOTE_OFF_PRIORITY = 1
+NOTE_ON_PRIORITY = 2
+
+
+def chord_events(chords, beats_per_chord=2, velocity=100, channel=0):
+    """Build (beat, priority, message) events for a list of MIDI note tuples, one chord per slot."""
+    events = []
+    for i, notes in enumerate(chords):
+        start = i * beats_per_chord
+        for note in notes:
+            events.append((start, NOTE_ON_PRIORITY, mido.Message('note_on', note=note, velocity=velocity, channel=channel)))
+            events.append((start + beats_per_chord, NOTE_OFF_PRIORITY, mido.Message('note_off', note=note, channel=channel)))
+    events.sort(key=lambda event: event[:2])
+    return events
+
+
+def open_output(port_name=None, virtual=False):
+    if virtual:
+        return mido.open_output(port_name or "Chord Generator", virtual=True)
+    return mido.open_output(port_name)
+
+
+class JitterStats:
+    def __init__(self, max_samples=10000):
+        self.samples = deque(maxlen=max_samples)
+        self.count = 0
+        self.lock = threading.Lock()
+
+    def record(self, lateness):
+        with self.lock:
+            self.samples.append(lateness)
+            self.count += 1
+
+    def reset(self):
+        with self.lock:
+            self.samples.clear()
+            self.count = 0
+
+    def summary(self):
+        with self.lock:
+            samples = sorted(self.samples)
+            count = self.count
+        if not samples:
+            return {'events': count, 'mean_ms': 0.0, 'stdev_ms': 0.0, 'p99_ms': 0.0, 'max_ms': 0.0}
+        return {
+            'events': count,
+            'mean_ms': statistics.fmean(samples) * 1000,
+            'stdev_ms': statistics.pstdev(samples) * 1000,
+            'p99_ms': samples[min(len(samples) - 1, int(len(samples) * 0.99))] * 1000,
+            'max_ms': samples[-1] * 1000,
+        }
+
+
+class Pattern:
+    """An event pattern pre-split into bar windows, ready to be swapped in at a boundary."""
+
+    def __init__(self, events, length, beats_per_bar=BEATS_PER_BAR):
+        self.length = length
+        self.bars = []
+        events = sorted(events, key=lambda event: event[:2])
+        bar_count = max(1, math.ceil(length / beats_per_bar))
+        i = 0
+        for bar in range(bar_count):
+            start = bar * beats_per_bar
+            end = min(length, start + beats_per_bar)
+            window = []
+            # The last window also takes note-offs that land exactly on the loop end
+            while i < len(events) and (events[i][0] < end or bar == bar_count - 1):
+                window.append(events[i])
+                i += 1
+            self.bars.append((start, end, window))
+
+
+class MidiSequencer:
+    """Sends a looped event pattern and 24 PPQN MIDI clock from a dedicated thread.
+
+    Every event is scheduled against an absolute tempo anchor, so lateness
+    on one event never accumulates into the next. ``port`` can be any object
+    with a ``send`` method, such as a mido output or a virtual port.
+
+    While running, new patterns and tempo changes go through a command queue
+    and take effect exactly at the next bar (or loop) boundary.
+    """
+
+    def __init__(self, port, tempo=60, send_clock=True, beats_per_bar=BEATS_PER_BAR):
+        self.port = port
+        self.tempo = tempo
+        self.send_clock = send_clock
+        self.beats_per_bar = beats_per_bar
+        self.jitter = JitterStats()
+        self.lock = threading.Lock()
+        self.commands = queue.Queue()
+        self.stop_event = threading.Event()
+        self.thread = None
+        self.active_notes = set()
+        self.anchor_time = 0.0
+        self.anchor_beat = 0.0
+
+    @property
+    def is_running(self):
+        return self.thread is not None and self.thread.is_alive()
+
+    def beat_to_time(self, beat):
+        with self.lock:
+            return self.anchor_time + (beat - self.anchor_beat) * 60.0 / self.tempo
+
+    def current_beat(self):
+        with self.lock:
+            return self.anchor_beat + (time.perf_counter() - self.anchor_time) * self.tempo / 60.0
+
+    def set_tempo(self, tempo):
+        if self.is_running:
+            self.commands.put(('tempo', tempo, 'bar'))
+        else:
+            self.tempo = tempo
+
+    def play(self, events, length, loop=True, boundary='bar'):
+        pattern = Pattern(events, length, self.beats_per_bar)
+        if self.is_running:
+            self.commands.put(('pattern', (pattern, loop), boundary))
+            return
+
+        self.stop()
+        self.stop_event.clear()
+        self.jitter.reset()
+        while not self.commands.empty():
+            self.commands.get_nowait()
+        with self.lock:
+            self.anchor_time = time.perf_counter()
+            self.anchor_beat = 0.0
+        self.thread = threading.Thread(target=self.run, args=(pattern, loop), name="midi-sequencer", daemon=True)
+        self.thread.start()
+
+    def stop(self):
+        if self.thread is None:
+            return
+        self.stop_event.set()
+        if self.thread is not threading.current_thread():
+            self.thread.join()
+        self.thread = None
+
+    def close(self):
+        self.stop()
+        self.port.close()
+
+    def window_events(self, window):
+        start, end, events = window
+        streams = [events]
+        if self.send_clock:
+            streams.append((tick / CLOCKS_PER_BEAT, CLOCK_PRIORITY, mido.Message('clock'))
+                           for tick in range(math.ceil(start * CLOCKS_PER_BEAT), math.ceil(end * CLOCKS_PER_BEAT)))
+        return heapq.merge(*streams, key=lambda event: event[:2])
+
+    def wait_until(self, due):
+        while True:
+            remaining = due - time.perf_counter()
+            if remaining <= 0:
+                return True
+            if remaining > SPIN_THRESHOLD:
+                if self.stop_event.wait(remaining - SPIN_THRESHOLD):
+                    return False
+            elif self.stop_event.is_set():
+                return False
+
+    def send(self, message):
+        if message.type == 'note_on' and message.velocity > 0:
+            self.active_notes.add((message.channel, message.note))
+        elif message.type in ('note_on', 'note_off'):
+            self.active_notes.discard((message.channel, message.note))
+        self.port.send(message)
+
+    def release_notes(self):
+        for channel, note in sorted(self.active_notes):
+            self.port.send(mido.Message('note_off', note=note, channel=channel))
+        self.active_notes.clear()
+
+    def retempo(self, beat, tempo):
+        with self.lock:
+            self.anchor_time += (beat - self.anchor_beat) * 60.0 / self.tempo
+            self.anchor_beat = beat
+            self.tempo = tempo
+
+    def play_window(self, origin, window):
+        for beat, _, message in self.window_events(window):
+            due = self.beat_to_time(origin + beat)
+            if not self.wait_until(due):
+                return False
+            self.jitter.record(time.perf_counter() - due)
+            self.send(message)
+        return self.wait_until(self.beat_to_time(origin + window[1]))
+
+    def run(self, pattern, loop):
+        raise_thread_priority()
+        if self.send_clock:
+            self.port.send(mido.Message('start'))
+
+        origin = 0.0
+        bar = 0
+        pending = {}
+        while self.play_window(origin, pattern.bars[bar]):
+            boundary = origin + pattern.bars[bar][1]
+            bar += 1
+            at_loop_end = bar == len(pattern.bars)
+
+            while not self.commands.empty():
+                kind, payload, when = self.commands.get_nowait()
+                pending[kind] = (payload, when)
+
+            for kind, (payload, when) in list(pending.items()):
+                if when != 'bar' and not at_loop_end:
+                    continue
+                del pending[kind]
+                if kind == 'tempo':
+                    self.retempo(boundary, payload)
+                else:
+                    self.release_notes()
+                    pattern, loop = payload
+                    origin, bar, at_loop_end = boundary, 0, False
+
+            if at_loop_end:
+                if not loop:
+                    break
+                origin, bar = boundary, 0
+
+        self.release_notes()
+        if self.send_clock:
+            self.port.send(mido.Message('stop'))
+
+
+def raise_thread_priority():
+    # Real-time scheduling needs privileges; fall back to the default policy quietly
+    try:
+        os.sched_setscheduler(0, os.SCHED_FIFO, os.sched_param(os.sched_get_priority_min(os.SCHED_FIFO)))
+    except (AttributeError, OSError):
+        logging.debug("Running MIDI sequencer without real-time priority")
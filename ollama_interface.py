@@ -1,18 +1,235 @@
-import requests
+import json
 import logging
+import queue
+import re
+import threading
+from collections import deque
+from concurrent.futures import Future
+import instrumentation
+from chord_tokenizer import ProgressionStreamParser
+from utils import ChordType, CHORD_TOKEN_REGEX
 
 logging.basicConfig(level=logging.INFO)
 
+DEFAULT_MODEL = "llama3.1"
+DEFAULT_TIMEOUT = (3.05, 60)  # (connect, read) seconds
+# Chunks still read once enough chords are in: a reply that ends by then is
+# drained, so its keep-alive connection can be reused; a longer one is hung up on
+TAIL_CHUNKS = 8
+
 class OllamaAPI:
-    def __init__(self, api_url):
+    def __init__(self, api_url, model=DEFAULT_MODEL, timeout=DEFAULT_TIMEOUT):
         self.api_url = api_url
+        self.model = model
+        self.timeout = timeout
+        self.http = None
+
+    @property
+    def session(self):
+        # Created on first use so importing requests stays off the startup path
+        if self.http is None:
+            import requests
+            self.http = requests.Session()  # Keeps the connection to Ollama alive between requests
+        return self.http
 
-    def generate_progression_with_ollama(self, prompt):
+    @instrumentation.timed("ollama.request")
+    def generate_progression_with_ollama(self, prompt, chord_limit=None, cancel=None):
+        if chord_limit is not None:
+            return self.stream_progression(prompt, chord_limit, cancel)
         try:
-            response = requests.post(f'{self.api_url}/api/generate',
-                                     json={"model": "llama3.1", "prompt": prompt, "stream": False})
+            response = self.session.post(f'{self.api_url}/api/generate',
+                                         json={"model": self.model, "prompt": prompt, "stream": False},
+                                         timeout=self.timeout)
             response.raise_for_status()
             return response.json()['response'].strip()
         except Exception as e:
             logging.error(f"Error communicating with Ollama: {e}")
             return None
+
+    @instrumentation.timed("ollama.request")
+    def generate_chords(self, prompt, count, cancel=None):
+        # Structured output: Ollama constrains decoding to the JSON schema,
+        # so every item already matches the chord grammar in utils.py. The
+        # reply is streamed like stream_progression: once ``count`` items are
+        # complete we hang up rather than wait out the whitespace some models
+        # pad JSON with.
+        parser = ChordArrayStreamParser()
+        chords = []
+        tail = 0
+        try:
+            with self.session.post(f'{self.api_url}/api/generate',
+                                   json={"model": self.model, "stream": True, "format": chord_schema(count),
+                                         "prompt": prompt + ' Respond as JSON with a "chords" array.'},
+                                   timeout=self.timeout, stream=True) as response:
+                response.raise_for_status()
+                for line in response.iter_lines():
+                    if cancel is not None and cancel.is_set():
+                        return None
+                    if not line:
+                        continue
+                    if len(chords) >= count:
+                        tail += 1
+                        if tail > TAIL_CHUNKS:
+                            return chords[:count]
+                        continue
+                    chunk = json.loads(line)
+                    chords.extend(parser.feed(chunk.get('response', '')))
+            if len(chords) >= count:
+                return chords[:count]
+            # Fewer items than asked for, or ones the stream parser could not follow (e.g. null)
+            chords = json.loads(parser.text)['chords']
+            if not isinstance(chords, list):
+                raise ValueError(f"expected a list of chords, got {chords!r}")
+            return [chord if isinstance(chord, str) else None for chord in chords]
+        except Exception as e:
+            logging.error(f"Error communicating with Ollama: {e}")
+            return chords[:count] or None
+
+    def stream_progression(self, prompt, chord_limit, cancel=None):
+        # Parse chords as tokens stream in and hang up once enough valid ones
+        # have arrived, or once ``cancel`` is set; closing the connection makes
+        # Ollama stop generating.
+        parser = ProgressionStreamParser()
+        chords = []
+        tail = 0
+        try:
+            with self.session.post(f'{self.api_url}/api/generate',
+                                   json={"model": self.model, "prompt": prompt, "stream": True},
+                                   timeout=self.timeout, stream=True) as response:
+                response.raise_for_status()
+                for line in response.iter_lines():
+                    if cancel is not None and cancel.is_set():
+                        return None
+                    if not line:
+                        continue
+                    if len(chords) >= chord_limit:
+                        tail += 1
+                        if tail > TAIL_CHUNKS:
+                            break
+                        continue
+                    chunk = json.loads(line)
+                    tokens = parser.feed(chunk.get('response', ''))
+                    if chunk.get('done'):
+                        tokens += parser.finish()
+                    chords.extend(token.original for token in tokens if token.type != ChordType.INVALID)
+                else:
+                    chords.extend(token.original for token in parser.finish() if token.type != ChordType.INVALID)
+        except Exception as e:
+            logging.error(f"Error communicating with Ollama: {e}")
+            if not chords:
+                return None
+        return '-'.join(chords[:chord_limit]) or None
+
+    def close(self):
+        if self.http is not None:
+            self.http.close()
+
+
+class ChordArrayStreamParser:
+    """Pulls the string items out of a ``{"chords": [...]}`` reply as it arrives; an item is complete at its closing quote."""
+
+    ARRAY_PATTERN = re.compile(r'"chords"\s*:\s*\[')
+    ITEM_PATTERN = re.compile(r'\s*,?\s*("(?:[^"\\]|\\.)*")')
+
+    def __init__(self):
+        self.text = ''
+        self.position = None
+
+    def feed(self, text):
+        self.text += text
+        if self.position is None:
+            start = self.ARRAY_PATTERN.search(self.text)
+            if start is None:
+                return []
+            self.position = start.end()
+        items = []
+        while (match := self.ITEM_PATTERN.match(self.text, self.position)) is not None:
+            items.append(json.loads(match.group(1)))
+            self.position = match.end()
+        return items
+
+
+def chord_schema(count):
+    return {
+        "type": "object",
+        "properties": {
+            "chords": {"type": "array", "items": {"type": "string", "pattern": CHORD_TOKEN_REGEX},
+                       "minItems": count, "maxItems": count},
+        },
+        "required": ["chords"],
+    }
+
+
+class Prefetcher:
+    """Keeps up to ``depth`` calls of ``fetch`` ready or in flight for the current parameters.
+
+    ``get`` hands back the first finished result (waiting only if none is
+    ready yet) and tops the queue up again with ``prefetch_request``. A change
+    of ``params`` discards everything fetched for the old ones and sets the
+    ``cancel`` event ``fetch`` was given, so a slow request for stale settings
+    hangs up instead of holding a worker. A fetch that raised comes back as
+    None, the same as no answer.
+    """
+
+    def __init__(self, fetch, depth=2, workers=1):
+        self.fetch = fetch
+        self.depth = depth
+        self.params = None
+        self.futures = deque()
+        self.lock = threading.Lock()
+        self.work = queue.Queue()
+        for i in range(max(1, workers)):
+            threading.Thread(target=self.worker, name=f"prefetch-{i}", daemon=True).start()
+
+    def worker(self):
+        while True:
+            future, request, cancel = self.work.get()
+            if not future.set_running_or_notify_cancel():
+                continue
+            try:
+                future.set_result(self.fetch(request, cancel=cancel))
+            except Exception as e:
+                future.set_exception(e)
+
+    def submit(self, request):
+        future, cancel = Future(), threading.Event()
+        self.work.put((future, request, cancel))
+        return future, cancel
+
+    def switch_params(self, params):
+        if params != self.params:
+            for future, cancel in self.futures:
+                future.cancel()
+                cancel.set()
+            self.futures.clear()
+            self.params = params
+
+    def get(self, params, request, prefetch_request=None):
+        with self.lock:
+            self.switch_params(params)
+            entry = next((entry for entry in self.futures if entry[0].done()), None)
+            if entry is None and self.futures:
+                entry = self.futures[0]
+            if entry is None:
+                entry = self.submit(request)
+            else:
+                self.futures.remove(entry)
+            future = entry[0]
+
+            while len(self.futures) < self.depth:
+                self.futures.append(self.submit(prefetch_request or request))
+        try:
+            return future.result()
+        except Exception as e:
+            logging.error(f"Prefetched request failed: {e}")
+            return None
+
+    def prime(self, params, request):
+        with self.lock:
+            self.switch_params(params)
+            while len(self.futures) < self.depth:
+                self.futures.append(self.submit(request))
+
+    def close(self):
+        with self.lock:
+            self.switch_params(None)
@@ -1,6 +1,7 @@
 import music21
 import random
 from chord_tokenizer import tokenize_chord, ChordType, format_chord_token
+from voicing import voice_lead
 
 def distribute_chords_across_bars(self, progression):
     chords_per_bar = max(1, len(progression) // self.bars)
@@ -23,61 +24,12 @@ def distribute_chords_across_bars(self, progression):
     return distributed_progression
 
 def apply_voice_leading(self, progression):
-    def find_best_inversion(previous_pitches, current_pitches):
-        possible_inversions = [
-            current_pitches,
-            [current_pitches[1], current_pitches[2], current_pitches[3], current_pitches[0].transpose(12)],
-            [current_pitches[2], current_pitches[3], current_pitches[0].transpose(12), current_pitches[1].transpose(12)],
-            [current_pitches[3], current_pitches[0].transpose(12), current_pitches[1].transpose(12), current_pitches[2].transpose(12)]
-        ]
+    voice_led_progression = list(progression)
+    chord_positions = [i for i, chord in enumerate(progression)
+                       if isinstance(chord, (music21.roman.RomanNumeral, music21.harmony.ChordSymbol))]
+    voicings = voice_lead([pitch.midi for pitch in progression[i].pitches] for i in chord_positions)
 
-        def movement(inversion):
-            return sum(min(abs(prev.midi - curr.midi), 12 - abs(prev.midi - curr.midi)) for prev, curr in zip(previous_pitches, inversion))
+    for i, notes in zip(chord_positions, voicings):
+        voice_led_progression[i] = music21.chord.Chord([music21.pitch.Pitch(midi=note) for note in notes])
 
-        return min(possible_inversions, key=movement)
-
-    def normalize_octave(pitches, reference_pitch=60):  # Middle C (C4) is MIDI note 60
-        normalized_pitches = []
-        for pitch in pitches:
-            while pitch.midi > reference_pitch + 12:
-                pitch = pitch.transpose(-12)
-            while pitch.midi < reference_pitch - 12:
-                pitch = pitch.transpose(12)
-            normalized_pitches.append(pitch)
-        return normalized_pitches
-
-    voice_led_progression = []
-    previous_pitches = None
-
-    for chord in progression:
-        if isinstance(chord, (music21.roman.RomanNumeral, music21.harmony.ChordSymbol)):
-            current_pitches = list(chord.pitches)
-
-            while len(current_pitches) < 4:
-                current_pitches.append(current_pitches[-1].transpose(-12))
-            while len(current_pitches) > 4:
-                current_pitches.pop()
-
-            if previous_pitches is not None:
-                while len(previous_pitches) < 4:
-                    previous_pitches.append(previous_pitches[-1].transpose(-12))
-                while len(previous_pitches) > 4:
-                    previous_pitches.pop()
-
-                current_pitches = find_best_inversion(previous_pitches, current_pitches)
-                current_pitches = normalize_octave(current_pitches)
-
-                available_pitches = current_pitches[:]
-                for i in range(4):
-                    closest_pitch = min(available_pitches, key=lambda p: abs(p.midi - previous_pitches[i].midi))
-                    current_pitches[i] = closest_pitch
-                    available_pitches.remove(closest_pitch)
-
-            current_pitches = normalize_octave(current_pitches)
-            previous_pitches = current_pitches[:]
-            voice_led_chord = music21.chord.Chord(current_pitches)
-            voice_led_progression.append(voice_led_chord)
-        else:
-            voice_led_progression.append(chord)
-
-    return voice_led_progression
\ No newline at end of file
+    return voice_led_progression
@@ -0,0 +1,156 @@
+import json
+import random
+import sqlite3
+import threading
+import time
+from collections import OrderedDict, deque
+
+DEFAULT_TTL = 7 * 24 * 3600  # one week
+TOUCH_BATCH = 64  # last_used updates buffered in memory before they are written
+BUSY_TIMEOUT = 30.0  # seconds a write waits for another process holding the database (batch workers share it)
+
+
+def cache_key(key, is_minor, progression_length, artist=None, previous=None, variant=None):
+    artist = ' '.join(artist.lower().split()) if artist else None
+    previous = '-'.join(previous) if previous else None
+    parts = [key, bool(is_minor), progression_length, artist, previous]
+    if variant is not None:
+        parts.append(variant)  # Batch jobs keep one entry per variant
+    return json.dumps(parts)
+
+
+def parse_cache_key(key):
+    return json.loads(key)
+
+
+class ProgressionCache:
+    """Two-tier (memory LRU over sqlite) cache of LLM progression responses.
+
+    Several responses ("variants") can be stored per key. With
+    ``sample_variants`` above 1, lookups miss until that many variants have
+    been collected and then return a random one, so cached results stay varied.
+    The last ``avoid_repeats`` responses handed out for a key (from the cache
+    or just stored) are skipped, so back-to-back lookups never repeat.
+    """
+
+    def __init__(self, path, ttl=DEFAULT_TTL, max_entries=10000, memory_entries=256, sample_variants=1,
+                 avoid_repeats=0, busy_timeout=BUSY_TIMEOUT):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.memory_entries = memory_entries
+        self.sample_variants = sample_variants
+        self.avoid_repeats = avoid_repeats
+        self.memory = OrderedDict()
+        self.recent = {}
+        self.touched = {}
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.memory_hits = 0
+        self.misses = 0
+        self.path = path
+        self.db = sqlite3.connect(path, timeout=busy_timeout, check_same_thread=False)
+        self.db.execute("PRAGMA journal_mode=WAL")  # Readers in other processes do not block a writer
+        self.db.execute("""CREATE TABLE IF NOT EXISTS progressions (
+                               key TEXT NOT NULL,
+                               response TEXT NOT NULL,
+                               created REAL NOT NULL,
+                               last_used REAL NOT NULL,
+                               PRIMARY KEY (key, response))""")
+        self.db.execute("CREATE INDEX IF NOT EXISTS progressions_last_used ON progressions (last_used)")
+        self.db.commit()
+
+    def remember(self, key, variants):
+        self.memory[key] = variants
+        self.memory.move_to_end(key)
+        while len(self.memory) > self.memory_entries:
+            evicted, _ = self.memory.popitem(last=False)
+            self.recent.pop(evicted, None)
+
+    def handed_out(self, key, response):
+        if self.avoid_repeats:
+            self.recent.setdefault(key, deque(maxlen=self.avoid_repeats)).append(response)
+
+    def get(self, key):
+        now = time.time()
+        with self.lock:
+            variants = self.memory.get(key)
+            from_memory = variants is not None
+            if variants is None:
+                rows = self.db.execute("SELECT response, created FROM progressions WHERE key = ? AND created > ?",
+                                       (key, now - self.ttl)).fetchall()
+                variants = [(response, created) for response, created in rows]
+                self.remember(key, variants)
+            else:
+                self.memory.move_to_end(key)
+            variants = [variant for variant in variants if variant[1] > now - self.ttl]
+            self.memory[key] = variants
+
+            recent = self.recent.get(key, ())
+            choices = [variant for variant in variants if variant[0] not in recent]
+            if not choices or len(variants) < self.sample_variants:
+                self.misses += 1
+                return None
+
+            self.hits += 1
+            self.memory_hits += from_memory
+            response = random.choice(choices)[0]
+            self.handed_out(key, response)
+            # Hits only touch memory; last_used reaches sqlite in batches, or before an eviction needs it
+            self.touched[(key, response)] = now
+            if len(self.touched) >= TOUCH_BATCH:
+                self.flush_touched()
+                self.db.commit()
+            return response
+
+    def flush_touched(self):
+        self.db.executemany("UPDATE progressions SET last_used = ? WHERE key = ? AND response = ?",
+                            [(last_used, key, response) for (key, response), last_used in self.touched.items()])
+        self.touched.clear()
+
+    def evict(self, now):
+        rows = self.db.execute("""SELECT rowid, key, response FROM progressions WHERE created <= ? OR rowid IN (
+                                      SELECT rowid FROM progressions ORDER BY last_used DESC LIMIT -1 OFFSET ?)""",
+                               (now - self.ttl, self.max_entries)).fetchall()
+        self.db.executemany("DELETE FROM progressions WHERE rowid = ?", [(rowid,) for rowid, _, _ in rows])
+        for _, key, response in rows:
+            # Keep the memory tier in step with sqlite
+            if key in self.memory:
+                self.memory[key] = [variant for variant in self.memory[key] if variant[0] != response]
+
+    def put(self, key, response):
+        now = time.time()
+        with self.lock:
+            self.flush_touched()
+            self.db.execute("INSERT OR REPLACE INTO progressions VALUES (?, ?, ?, ?)", (key, response, now, now))
+            variants = [variant for variant in self.memory.get(key, []) if variant[0] != response]
+            self.remember(key, variants + [(response, now)])
+            self.evict(now)
+            self.db.commit()
+            self.handed_out(key, response)
+
+    def stats(self):
+        with self.lock:
+            entries = self.db.execute("SELECT COUNT(*) FROM progressions").fetchone()[0]
+            lookups = self.hits + self.misses
+            return {
+                'hits': self.hits,
+                'memory_hits': self.memory_hits,
+                'misses': self.misses,
+                'hit_rate': self.hits / lookups if lookups else 0.0,
+                'entries': entries,
+                'memory_entries': len(self.memory),
+            }
+
+    def clear(self):
+        with self.lock:
+            self.db.execute("DELETE FROM progressions")
+            self.db.commit()
+            self.memory.clear()
+            self.recent.clear()
+            self.touched.clear()
+
+    def close(self):
+        with self.lock:
+            self.flush_touched()
+            self.db.commit()
+            self.db.close()
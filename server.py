@@ -0,0 +1,596 @@
+"""Headless chord service: generation and MIDI rendering over HTTP and WebSocket, on localhost only.
+
+Run from the repository root: python server.py [--port 8765] [--batch-window-ms 5] [--cache-mb 64]
+
+Every client works in a session with its own key, tempo, artist, length,
+backend and arrangement; the one shared ChordProgressionPlayer only provides
+the Ollama router, the progression cache and the corpus. Renders from all
+clients are collected into micro-batches, and the MIDI bytes are kept in an
+in-memory LRU cache, so repeated requests never render twice.
+
+HTTP, JSON in and out (MIDI responses are audio/midi):
+
+    POST /sessions                  {"key": "Am", ...}  -> session id and settings
+    GET  /sessions/<id>             settings and current progression
+    POST /sessions/<id>/settings    {"key": "G", "tempo": 90, "artist": "The Beatles",
+                                     "length": 8, "backend": "corpus", "arrange": true}
+    POST /sessions/<id>/generate    new progression for the session's settings
+    GET  /sessions/<id>/midi        the current progression as a MIDI file
+    POST /render                    {"progression": ["Am", "F", "C", "G"], "key": "C", "tempo": 120}
+    GET  /stats
+
+WebSocket: GET /ws starts a new session, /ws?session=<id> joins one. Send
+JSON text frames {"type": "settings", "tempo": 100}, {"type": "generate"},
+{"type": "play"}, {"type": "stop"} or {"type": "midi"}. The server sends
+"settings", "progression", "chord" (one per chord change while playing) and
+"error" messages as JSON, and MIDI as a binary frame.
+"""
+import argparse
+import asyncio
+import base64
+import hashlib
+import json
+import logging
+import os
+import struct
+from collections import OrderedDict
+from urllib.parse import urlsplit, parse_qs
+import instrumentation
+from chord_player import ChordProgressionPlayer, generation_request, parse_figures, render_voicings
+
+HOST = "127.0.0.1"
+DEFAULT_PORT = 8765
+BATCH_WINDOW = 0.005  # seconds a render waits for others to join its batch
+MAX_BATCH = 64
+MIDI_CACHE_BYTES = 64 * 1024 * 1024
+MAX_SESSIONS = 1000
+MAX_BODY = 1024 * 1024
+MAX_SEND_BUFFER = 1024 * 1024  # A WebSocket client this far behind is disconnected rather than stalling playback
+BEATS_PER_CHORD = 2
+VALID_KEYS = ['C', 'C#', 'D', 'D#', 'E', 'F', 'F#', 'G', 'G#', 'A', 'A#', 'B']
+WEBSOCKET_GUID = "258EAFA5-E914-47DA-95CA-C5AB0DC85B11"
+TEXT, BINARY, CLOSE, PING, PONG = 0x1, 0x2, 0x8, 0x9, 0xA
+STATUS_TEXT = {200: "OK", 400: "Bad Request", 404: "Not Found", 413: "Payload Too Large",
+               500: "Internal Server Error"}
+
+
+class HTTPError(Exception):
+    def __init__(self, status, message):
+        super().__init__(message)
+        self.status = status
+
+
+class Session:
+    """One client's settings and progression."""
+
+    def __init__(self, session_id=None):
+        self.id = session_id
+        self.key = 'C'
+        self.is_minor = False
+        self.length = 4
+        self.artist = None
+        self.tempo = 60
+        self.backend = 'ollama'
+        self.arrange = False
+        self.progression = []
+        self.listeners = set()
+        self.play_task = None
+
+    def params(self):
+        return (self.key, self.is_minor, self.length, self.artist, self.backend)
+
+    def update(self, settings):
+        # Everything is checked before anything changes, so a bad request leaves the session as it was
+        unknown = set(settings) - {'key', 'tempo', 'artist', 'length', 'backend', 'arrange'}
+        if unknown:
+            raise HTTPError(400, f"Unknown settings: {', '.join(sorted(unknown))}")
+        key, is_minor = self.key, self.is_minor
+        if 'key' in settings:
+            name = str(settings['key']).strip().capitalize()
+            key, is_minor = name.rstrip('m'), name.endswith('m')
+            if key not in VALID_KEYS:
+                raise HTTPError(400, f"Invalid key {settings['key']!r}")
+        tempo = settings.get('tempo', self.tempo)
+        if not isinstance(tempo, int) or not 40 <= tempo <= 240:
+            raise HTTPError(400, "Tempo must be an integer between 40 and 240")
+        length = settings.get('length', self.length)
+        if not isinstance(length, int) or not 1 <= length <= 16:
+            raise HTTPError(400, "Length must be an integer between 1 and 16")
+        artist = settings.get('artist', self.artist)
+        if artist is not None and not isinstance(artist, str):
+            raise HTTPError(400, "Artist must be a string")
+        backend = settings.get('backend', self.backend)
+        if backend not in ('ollama', 'corpus'):
+            raise HTTPError(400, "Backend must be 'ollama' or 'corpus'")
+
+        semitones = (VALID_KEYS.index(key) - VALID_KEYS.index(self.key) + 5) % 12 - 5
+        if semitones:
+            self.progression = [chord.transpose(semitones) for chord in self.progression]
+        self.key, self.is_minor = key, is_minor
+        self.tempo = tempo
+        self.length = length
+        self.artist = (artist.strip() or None) if artist else None
+        self.backend = backend
+        self.arrange = bool(settings.get('arrange', self.arrange))
+
+    def describe(self):
+        return {
+            'session': self.id,
+            'key': f"{self.key}{'m' if self.is_minor else ''}",
+            'tempo': self.tempo,
+            'length': self.length,
+            'artist': self.artist,
+            'backend': self.backend,
+            'arrange': self.arrange,
+            'progression': [chord.figure for chord in self.progression],
+            'playing': self.play_task is not None and not self.play_task.done(),
+        }
+
+
+class WebSocket:
+    def __init__(self, reader, writer):
+        self.reader = reader
+        self.writer = writer
+        self.closed = False
+
+    def send(self, payload, opcode=TEXT):
+        # Never awaits: events for slow clients buffer up to MAX_SEND_BUFFER, then the client is dropped
+        if self.closed:
+            return
+        if self.writer.transport.get_write_buffer_size() > MAX_SEND_BUFFER:
+            logging.warning("Disconnecting a WebSocket client that stopped reading")
+            self.close()
+            return
+        self.writer.write(encode_frame(opcode, payload))
+
+    def send_json(self, message):
+        self.send(json.dumps(message).encode())
+
+    def close(self):
+        if not self.closed:
+            self.closed = True
+            self.writer.write(encode_frame(CLOSE, b''))
+            self.writer.close()
+
+    async def receive(self):
+        """The next complete text or binary message as (opcode, payload); None once the client has gone."""
+        message_opcode, fragments, size = None, [], 0
+        while not self.closed:
+            fin, opcode, payload = await read_frame(self.reader)
+            if opcode == CLOSE:
+                self.close()
+                return None
+            if opcode == PING:
+                self.send(payload, PONG)
+            elif opcode != PONG:
+                if opcode:
+                    message_opcode, fragments, size = opcode, [], 0
+                fragments.append(payload)
+                size += len(payload)
+                if size > MAX_BODY:
+                    # read_frame caps single frames; this caps a message sent as many small fragments
+                    raise ConnectionError(f"WebSocket message of over {MAX_BODY} bytes is too large")
+                if fin:
+                    return message_opcode, b''.join(fragments)
+        return None
+
+
+def encode_frame(opcode, payload):
+    length = len(payload)
+    if length < 126:
+        header = struct.pack('>BB', 0x80 | opcode, length)
+    elif length < 1 << 16:
+        header = struct.pack('>BBH', 0x80 | opcode, 126, length)
+    else:
+        header = struct.pack('>BBQ', 0x80 | opcode, 127, length)
+    return header + payload
+
+
+async def read_frame(reader):
+    first, second = await reader.readexactly(2)
+    length = second & 0x7F
+    if length == 126:
+        length = struct.unpack('>H', await reader.readexactly(2))[0]
+    elif length == 127:
+        length = struct.unpack('>Q', await reader.readexactly(8))[0]
+    if length > MAX_BODY:
+        raise ConnectionError(f"WebSocket frame of {length} bytes is too large")
+    mask = await reader.readexactly(4) if second & 0x80 else None
+    payload = await reader.readexactly(length)
+    if mask and length:
+        # Unmask the whole payload as one big integer XOR instead of byte by byte
+        key = (mask * (length // 4 + 1))[:length]
+        payload = (int.from_bytes(payload, 'big') ^ int.from_bytes(key, 'big')).to_bytes(length, 'big')
+    return bool(first & 0x80), first & 0x0F, payload
+
+
+def parse_json(body):
+    try:
+        request = json.loads(body or b'{}')
+    except ValueError as e:
+        raise HTTPError(400, f"Invalid JSON: {e}")
+    if not isinstance(request, dict):
+        raise HTTPError(400, "Expected a JSON object")
+    return request
+
+
+def json_body(message):
+    return "application/json", json.dumps(message).encode()
+
+
+class ChordService:
+    def __init__(self, player, batch_window=BATCH_WINDOW, max_batch=MAX_BATCH, cache_bytes=MIDI_CACHE_BYTES):
+        self.player = player
+        self.batch_window = batch_window
+        self.max_batch = max_batch
+        self.cache_bytes = cache_bytes
+        self.sessions = OrderedDict()
+        self.midi_cache = OrderedDict()
+        self.cached_bytes = 0
+        self.rendering = {}  # Render key -> future shared by every request for it
+        self.render_queue = asyncio.Queue()
+        self.arrangement = None
+        self.websockets = 0
+        self.generated = 0
+        self.cache_hits = 0
+        self.cache_misses = 0
+        self.batches = 0
+        self.batched_renders = 0
+        self.largest_batch = 0
+
+    def new_session(self):
+        session = Session(os.urandom(8).hex())
+        self.sessions[session.id] = session
+        if len(self.sessions) > MAX_SESSIONS:
+            # Drop the least recently used session without a live WebSocket
+            for old in list(self.sessions.values()):
+                if not old.listeners:
+                    self.stop(old)
+                    del self.sessions[old.id]
+                    break
+        return session
+
+    def get_session(self, session_id):
+        session = self.sessions.get(session_id)
+        if session is None:
+            raise HTTPError(404, f"Unknown session {session_id}")
+        self.sessions.move_to_end(session_id)
+        return session
+
+    def broadcast(self, session, message):
+        for websocket in list(session.listeners):
+            websocket.send_json(message)
+
+    async def generate(self, session):
+        params = session.params()
+        previous = [chord.figure for chord in session.progression]
+        progression = await asyncio.get_running_loop().run_in_executor(None, self.generate_blocking, params, previous)
+        session.progression = progression
+        self.generated += 1
+        self.broadcast(session, dict(session.describe(), type='progression'))
+        return progression
+
+    def generate_blocking(self, params, previous):
+        # Same path as the CLI: progression cache, validated LLM output, then the corpus and random fallbacks
+        key, is_minor, length, artist, backend = params
+        request = generation_request(key, is_minor, length, artist, previous)
+        progression_string = self.player.fetch_progression(request, backend)
+        return self.player.progression_from_string(progression_string, params)
+
+    async def render(self, progression, key, is_minor, tempo, arrange):
+        render_key = (tuple(progression), key, is_minor, tempo, arrange)
+        data = self.midi_cache.get(render_key)
+        if data is not None:
+            self.midi_cache.move_to_end(render_key)
+            self.cache_hits += 1
+            return data
+        self.cache_misses += 1
+        future = self.rendering.get(render_key)
+        if future is None:
+            future = self.rendering[render_key] = asyncio.get_running_loop().create_future()
+            self.render_queue.put_nowait(render_key)
+        return await asyncio.shield(future)
+
+    async def session_midi(self, session):
+        if not session.progression:
+            raise HTTPError(400, "No progression yet; generate one first")
+        return await self.render(session.progression, session.key, session.is_minor, session.tempo, session.arrange)
+
+    async def render_loop(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            batch = [await self.render_queue.get()]
+            if self.batch_window:
+                await asyncio.sleep(self.batch_window)  # Let renders from other clients join this batch
+            while len(batch) < self.max_batch and not self.render_queue.empty():
+                batch.append(self.render_queue.get_nowait())
+            try:
+                results = await loop.run_in_executor(None, self.render_batch, batch)
+            except Exception as e:
+                results = [e] * len(batch)
+            self.batches += 1
+            self.batched_renders += len(batch)
+            self.largest_batch = max(self.largest_batch, len(batch))
+            for render_key, result in zip(batch, results):
+                future = self.rendering.pop(render_key)
+                if isinstance(result, Exception):
+                    future.set_exception(result)
+                else:
+                    self.store(render_key, result)
+                    future.set_result(result)
+
+    def render_batch(self, batch):
+        # Runs on one executor thread per batch. Arranged renders go through
+        # Arrangement.render_batch together, so all their parts share one pool.
+        from arrangement import Arrangement
+        with instrumentation.span("server.render_batch"):
+            voicings = [self.player.voice_lead_midi(list(progression)) for progression, *_ in batch]
+            arranged = [i for i, render_key in enumerate(batch) if render_key[4]]
+            rendered = {}
+            if arranged:
+                if self.arrangement is None:
+                    self.arrangement = Arrangement()
+                rendered = dict(zip(arranged, self.arrangement.render_batch([voicings[i] for i in arranged])))
+
+            results = []
+            for i, (progression, key, is_minor, tempo, arrange) in enumerate(batch):
+                title = f"Chord Progression in {key}{'m' if is_minor else ''}"
+                try:
+                    if arrange:
+                        results.append(self.arrangement.to_smf(rendered[i], self.arrangement.length(voicings[i]),
+                                                               tempo, title))
+                    else:
+                        results.append(render_voicings(voicings[i], title, tempo))
+                except Exception as e:
+                    logging.error(f"Render failed for {[chord.figure for chord in progression]}: {e}")
+                    results.append(e)
+            return results
+
+    def store(self, render_key, data):
+        self.midi_cache[render_key] = data
+        self.cached_bytes += len(data)
+        while self.cached_bytes > self.cache_bytes and len(self.midi_cache) > 1:
+            _, evicted = self.midi_cache.popitem(last=False)
+            self.cached_bytes -= len(evicted)
+
+    def play(self, session):
+        if not session.progression:
+            raise HTTPError(400, "No progression yet; generate one first")
+        if session.play_task is None or session.play_task.done():
+            session.play_task = asyncio.create_task(self.play_loop(session))
+
+    def stop(self, session):
+        if session.play_task is not None:
+            session.play_task.cancel()
+            session.play_task = None
+
+    async def play_loop(self, session):
+        # Chord-change events on the session's beat grid. Deadlines are absolute,
+        # so sleep overruns do not accumulate; a new progression or key takes
+        # over at the top of the next loop, tempo changes at the next chord.
+        loop = asyncio.get_running_loop()
+        deadline = loop.time()
+        index = 0
+        progression = session.progression
+        while True:
+            if index == 0:
+                progression = session.progression
+            chord = progression[index]
+            self.broadcast(session, {'type': 'chord', 'index': index, 'chord': chord.figure, 'notes': list(chord.midi),
+                                     'beats': BEATS_PER_CHORD, 'tempo': session.tempo})
+            deadline += BEATS_PER_CHORD * 60 / session.tempo
+            index = (index + 1) % len(progression)
+            await asyncio.sleep(max(0.0, deadline - loop.time()))
+
+    async def dispatch(self, method, path, body):
+        parts = [part for part in path.split('/') if part]
+        if parts == ['sessions'] and method == 'POST':
+            session = self.new_session()
+            session.update(parse_json(body))
+            return json_body(session.describe())
+
+        if parts[:1] == ['sessions'] and len(parts) in (2, 3):
+            session = self.get_session(parts[1])
+            action = parts[2] if len(parts) == 3 else None
+            if action is None and method == 'GET':
+                return json_body(session.describe())
+            if action == 'settings' and method == 'POST':
+                session.update(parse_json(body))
+                self.broadcast(session, dict(session.describe(), type='settings'))
+                return json_body(session.describe())
+            if action == 'generate' and method == 'POST':
+                await self.generate(session)
+                return json_body(session.describe())
+            if action == 'midi' and method == 'GET':
+                return "audio/midi", await self.session_midi(session)
+
+        if parts == ['render'] and method == 'POST':
+            request = parse_json(body)
+            figures = request.pop('progression', None)
+            if not isinstance(figures, list) or not figures or not all(isinstance(figure, str) for figure in figures):
+                raise HTTPError(400, "'progression' must be a non-empty list of chord names")
+            settings = Session()
+            settings.update(request)
+            # Off the event loop: the first sight of a chord symbol goes through music21
+            progression = await asyncio.get_running_loop().run_in_executor(None, parse_figures, figures, settings.key,
+                                                                           len(figures))
+            return "audio/midi", await self.render(progression, settings.key, settings.is_minor, settings.tempo,
+                                                   settings.arrange)
+
+        if parts == ['stats'] and method == 'GET':
+            return json_body(self.stats())
+
+        raise HTTPError(404, f"No route for {method} {path}")
+
+    async def handle_connection(self, reader, writer):
+        try:
+            while True:
+                request_line = await reader.readline()
+                if not request_line:
+                    break
+                try:
+                    method, target, version = request_line.decode('latin-1').split()
+                except ValueError:
+                    break
+                headers = {}
+                while True:
+                    line = await reader.readline()
+                    if line in (b'\r\n', b'\n', b''):
+                        break
+                    name, _, value = line.decode('latin-1').partition(':')
+                    headers[name.strip().lower()] = value.strip()
+
+                url = urlsplit(target)
+                if url.path == '/ws' and headers.get('upgrade', '').lower() == 'websocket':
+                    await self.handle_websocket(reader, writer, headers, parse_qs(url.query))
+                    return
+
+                try:
+                    length = int(headers.get('content-length') or 0)
+                except ValueError:
+                    length = -1
+                if length < 0:
+                    await self.respond(writer, 400, *json_body({'error': "Invalid Content-Length"}), False)
+                    break
+                if length > MAX_BODY:
+                    await self.respond(writer, 413, *json_body({'error': "Request body too large"}), False)
+                    break
+                body = await reader.readexactly(length) if length else b''
+                keep_alive = version == 'HTTP/1.1' and headers.get('connection', '').lower() != 'close'
+                try:
+                    with instrumentation.span(f"server.{method} /{url.path.split('/')[1]}"):
+                        status, (content_type, payload) = 200, await self.dispatch(method, url.path, body)
+                except HTTPError as e:
+                    status, (content_type, payload) = e.status, json_body({'error': str(e)})
+                except Exception as e:
+                    logging.exception(f"Error handling {method} {url.path}")
+                    status, (content_type, payload) = 500, json_body({'error': str(e)})
+                await self.respond(writer, status, content_type, payload, keep_alive)
+                if not keep_alive:
+                    break
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        finally:
+            writer.close()
+
+    async def respond(self, writer, status, content_type, payload, keep_alive):
+        writer.write(f"HTTP/1.1 {status} {STATUS_TEXT[status]}\r\nContent-Type: {content_type}\r\n"
+                     f"Content-Length: {len(payload)}\r\nConnection: {'keep-alive' if keep_alive else 'close'}\r\n\r\n"
+                     .encode() + payload)
+        await writer.drain()
+
+    async def handle_websocket(self, reader, writer, headers, query):
+        key = headers.get('sec-websocket-key')
+        session_id = query.get('session', [None])[0]
+        try:
+            if not key:
+                raise HTTPError(400, "Missing Sec-WebSocket-Key")
+            session = self.get_session(session_id) if session_id else self.new_session()
+        except HTTPError as e:
+            await self.respond(writer, e.status, *json_body({'error': str(e)}), False)
+            return
+        accept = base64.b64encode(hashlib.sha1((key + WEBSOCKET_GUID).encode()).digest()).decode()
+        writer.write(f"HTTP/1.1 101 Switching Protocols\r\nUpgrade: websocket\r\nConnection: Upgrade\r\n"
+                     f"Sec-WebSocket-Accept: {accept}\r\n\r\n".encode())
+
+        websocket = WebSocket(reader, writer)
+        session.listeners.add(websocket)
+        self.websockets += 1
+        websocket.send_json(dict(session.describe(), type='settings'))
+        tasks = set()
+        try:
+            while True:
+                message = await websocket.receive()
+                if message is None:
+                    break
+                opcode, payload = message
+                try:
+                    command = parse_json(payload)
+                    if command.get('type') == 'generate':
+                        # In the background, so play/stop still get through during a slow LLM call
+                        task = asyncio.create_task(self.websocket_generate(session, websocket))
+                        tasks.add(task)
+                        task.add_done_callback(tasks.discard)
+                    else:
+                        await self.websocket_command(session, websocket, command)
+                except HTTPError as e:
+                    websocket.send_json({'type': 'error', 'error': str(e)})
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        finally:
+            self.websockets -= 1
+            session.listeners.discard(websocket)
+            if not session.listeners:
+                self.stop(session)
+            websocket.close()
+
+    async def websocket_generate(self, session, websocket):
+        try:
+            await self.generate(session)
+        except Exception as e:
+            logging.exception("Generation failed")
+            websocket.send_json({'type': 'error', 'error': str(e)})
+
+    async def websocket_command(self, session, websocket, command):
+        kind = command.pop('type', None)
+        if kind == 'settings':
+            session.update(command)
+            self.broadcast(session, dict(session.describe(), type='settings'))
+        elif kind == 'play':
+            self.play(session)
+        elif kind == 'stop':
+            self.stop(session)
+        elif kind == 'midi':
+            websocket.send(await self.session_midi(session), BINARY)
+        else:
+            raise HTTPError(400, f"Unknown message type {kind!r}")
+
+    def stats(self):
+        renders = self.cache_hits + self.cache_misses
+        return {
+            'sessions': len(self.sessions),
+            'websockets': self.websockets,
+            'generated': self.generated,
+            'renders': renders,
+            'cache_hit_rate': self.cache_hits / renders if renders else 0.0,
+            'cache_entries': len(self.midi_cache),
+            'cache_bytes': self.cached_bytes,
+            'batches': self.batches,
+            'mean_batch': self.batched_renders / self.batches if self.batches else 0.0,
+            'largest_batch': self.largest_batch,
+            'llm': self.player.output_validator.stats(),
+            'timings': instrumentation.summary(),
+        }
+
+
+async def serve(service, port):
+    server = await asyncio.start_server(service.handle_connection, HOST, port)
+    render_task = asyncio.create_task(service.render_loop())
+    print(f"Listening on http://{HOST}:{port} (WebSocket at ws://{HOST}:{port}/ws)")
+    try:
+        async with server:
+            await server.serve_forever()
+    finally:
+        render_task.cancel()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Serve chord generation and MIDI rendering on localhost")
+    parser.add_argument("--port", type=int, default=DEFAULT_PORT)
+    parser.add_argument("--batch-window-ms", type=float, default=BATCH_WINDOW * 1000,
+                        help="how long a render waits for others to batch with (0 disables waiting)")
+    parser.add_argument("--cache-mb", type=float, default=MIDI_CACHE_BYTES / 2 ** 20, help="MIDI byte cache size")
+    args = parser.parse_args()
+
+    player = ChordProgressionPlayer()
+    service = ChordService(player, args.batch_window_ms / 1000, cache_bytes=int(args.cache_mb * 2 ** 20))
+    try:
+        asyncio.run(serve(service, args.port))
+    except KeyboardInterrupt:
+        pass
+    finally:
+        player.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,90 @@
+import logging
+import time
+from midi_encoder import TICKS_PER_BEAT, END_OF_TRACK, variable_length, tempo_meta, track_name_meta
+from voicing import voice_lead
+
+
+class SessionRecorder:
+    """Append-only single-track MIDI file for a whole session.
+
+    Each append voice-leads just the new chords (continuing from the last
+    voicing) and writes their events to the end of the file. A checkpoint
+    closes the track with End of Track and patches the chunk length in
+    place, so the file on disk is always playable up to the last
+    checkpoint while memory use stays constant.
+    """
+
+    def __init__(self, path, title, tempo, ticks_per_beat=TICKS_PER_BEAT, checkpoint_interval=10.0, channel=0, velocity=100):
+        self.path = path
+        self.ticks_per_beat = ticks_per_beat
+        self.checkpoint_interval = checkpoint_interval
+        self.channel = channel
+        self.velocity = velocity
+        self.previous = None
+        self.tick = 0
+        self.last_event_tick = 0
+        self.chords = 0
+        self.last_checkpoint = time.monotonic()
+
+        self.file = open(path, 'w+b')
+        self.file.write(b'MThd' + (6).to_bytes(4, 'big') + (0).to_bytes(2, 'big') + (1).to_bytes(2, 'big')
+                        + ticks_per_beat.to_bytes(2, 'big'))
+        self.file.write(b'MTrk' + bytes(4))  # length is patched at every checkpoint
+        self.track_start = self.file.tell()
+
+        self.file.write(b'\x00' + track_name_meta(title))
+        self.file.write(b'\x00' + tempo_meta(tempo))
+        self.tempo = tempo
+        self.checkpoint()
+
+    def event(self, tick, payload):
+        delta = tick - self.last_event_tick
+        self.last_event_tick = tick
+        return variable_length(delta) + payload
+
+    def append(self, chords, tempo, beats_per_chord=2):
+        """Record chords (MIDI note lists, or None for a silent slot) after everything recorded so far."""
+        data = bytearray()
+        if tempo != self.tempo:
+            data += self.event(self.tick, tempo_meta(tempo))
+            self.tempo = tempo
+
+        voicings = iter(voice_lead([notes for notes in chords if notes is not None], previous=self.previous))
+        duration = beats_per_chord * self.ticks_per_beat
+        note_on = 0x90 | self.channel
+        note_off = 0x80 | self.channel
+
+        for notes in chords:
+            if notes is not None:
+                notes = next(voicings)
+                # A doubled voice is written once, as note_events does for rendered files
+                distinct = list(dict.fromkeys(notes))
+                for note in distinct:
+                    data += self.event(self.tick, bytes((note_on, note, self.velocity)))
+                for note in distinct:
+                    data += self.event(self.tick + duration, bytes((note_off, note, 0)))
+                self.previous = notes
+                self.chords += 1
+            self.tick += duration
+
+        self.file.write(data)
+        if time.monotonic() - self.last_checkpoint >= self.checkpoint_interval:
+            self.checkpoint()
+
+    def checkpoint(self):
+        # End of Track carries any trailing silence; it is overwritten by the next append
+        end_of_track = variable_length(self.tick - self.last_event_tick) + END_OF_TRACK
+        self.file.write(end_of_track)
+        end = self.file.tell()
+        self.file.truncate()
+        self.file.seek(self.track_start - 4)
+        self.file.write((end - self.track_start).to_bytes(4, 'big'))
+        self.file.flush()
+        self.file.seek(end - len(end_of_track))
+        self.last_checkpoint = time.monotonic()
+
+    def close(self):
+        if not self.file.closed:
+            self.checkpoint()
+            self.file.close()
+            logging.info(f"Session MIDI file closed: {self.path} ({self.chords} chords)")
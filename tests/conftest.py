@@ -0,0 +1,19 @@
+import os
+import sys
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from ollama_stub import StubOllamaServer  # noqa: E402
+
+
+@pytest.fixture
+def ollama_server():
+    servers = []
+
+    def start(**options):
+        servers.append(StubOllamaServer(**options))
+        return servers[-1]
+    yield start
+    for server in servers:
+        server.close()
@@ -0,0 +1,95 @@
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+
+class StubOllamaServer:
+    """Local stand-in for Ollama's /api/generate over keep-alive HTTP/1.1.
+
+    Replies stream as Ollama's newline-delimited JSON chunks, one chord per
+    chunk: a "chords" object when the request carries a ``format`` schema,
+    dash-separated text otherwise. ``delay`` holds back the headers,
+    ``chunk_delay`` paces the chunks and ``padding`` appends whitespace
+    chunks after the answer, the way a rambling model keeps generating.
+    ``hang_ups`` counts replies the client closed before the last chunk.
+    """
+
+    def __init__(self, chords=("C", "F", "G", "C"), delay=0.0, chunk_delay=0.0, padding=0, status=200):
+        self.chords = list(chords)
+        self.delay = delay
+        self.chunk_delay = chunk_delay
+        self.padding = padding
+        self.status = status
+        self.lock = threading.Lock()
+        self.requests = []
+        self.connections = 0
+        self.hang_ups = 0
+        self.hung_up = threading.Event()
+        self.server = ThreadingHTTPServer(("127.0.0.1", 0), self.handler())
+        self.server.daemon_threads = True
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+
+    @property
+    def url(self):
+        return f"http://127.0.0.1:{self.server.server_address[1]}"
+
+    def pieces(self, body):
+        if body.get("format"):
+            items = [json.dumps(chord) for chord in self.chords]
+            pieces = ['{"chords": ['] + [item + ", " for item in items[:-1]] + items[-1:] + [']}']
+        else:
+            pieces = [chord + "-" for chord in self.chords[:-1]] + self.chords[-1:]
+        return pieces + ["\n"] * self.padding
+
+    def handler(self):
+        stub = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"  # Keeps the connection open between requests
+
+            def setup(self):
+                super().setup()
+                with stub.lock:
+                    stub.connections += 1
+
+            def log_message(self, *args):
+                pass
+
+            def send_chunk(self, data):
+                self.wfile.write(b"%x\r\n%s\r\n" % (len(data), data))
+                self.wfile.flush()
+
+            def do_POST(self):
+                body = json.loads(self.rfile.read(int(self.headers["Content-Length"])))
+                with stub.lock:
+                    stub.requests.append(body)
+                time.sleep(stub.delay)
+                if stub.status != 200:
+                    self.send_response(stub.status)
+                    self.send_header("Content-Length", "0")
+                    self.end_headers()
+                    return
+
+                self.send_response(200)
+                self.send_header("Content-Type", "application/x-ndjson")
+                self.send_header("Transfer-Encoding", "chunked")
+                self.end_headers()
+                try:
+                    for piece in stub.pieces(body):
+                        self.send_chunk(json.dumps({"response": piece, "done": False}).encode() + b"\n")
+                        time.sleep(stub.chunk_delay)
+                    self.send_chunk(json.dumps({"response": "", "done": True}).encode() + b"\n")
+                    self.wfile.write(b"0\r\n\r\n")
+                    self.wfile.flush()
+                except (BrokenPipeError, ConnectionResetError):
+                    self.close_connection = True
+                    with stub.lock:
+                        stub.hang_ups += 1
+                    stub.hung_up.set()
+
+        return Handler
+
+    def close(self):
+        self.server.shutdown()
+        self.server.server_close()
@@ -0,0 +1,78 @@
+import json
+import threading
+import pytest
+import batch
+from progression_cache import ProgressionCache
+
+
+class StubAPI:
+    def __init__(self, answer):
+        self.answer = answer
+
+    def generate_progression_with_ollama(self, prompt, chord_limit=None, cancel=None):
+        return self.answer
+
+    def close(self):
+        pass
+
+
+@pytest.fixture
+def worker(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    batch.init_worker(threading.Semaphore(1))
+    yield batch.player
+    batch.player.progression_cache.close()
+
+
+def job(source, **fields):
+    job = dict({'key': 'Am', 'artist': None, 'length': 4, 'variant': 0, 'source': source, 'tempo': 90,
+                'arrange': False}, **fields)
+    job['id'] = f"{source}{job['variant']}".ljust(16, '0')
+    return job
+
+
+def test_workers_do_not_start_a_prefetcher(worker):
+    assert worker.prefetcher is None
+
+
+def test_ollama_job_records_its_answer(worker, tmp_path):
+    worker.ollama_api = StubAPI("Am-Dm-E-Am")
+    record = batch.run_job(job("ollama"), str(tmp_path))
+    assert record['source'] == "ollama"
+    assert record['progression'] == ["Am", "Dm", "E", "Am"]
+    assert (tmp_path / record['path']).exists()
+
+
+def test_unanswered_ollama_job_stays_pending(worker, tmp_path):
+    worker.ollama_api = StubAPI(None)
+    assert batch.run_job(job("ollama"), str(tmp_path)) is None
+    assert batch.read_manifest(str(tmp_path)) == {}
+
+
+def test_rerun_reproduces_each_variant_from_the_cache(worker, tmp_path):
+    worker.ollama_api = StubAPI("Am-F-C-G")
+    first = batch.run_job(job("ollama", variant=1), str(tmp_path))
+    worker.ollama_api = StubAPI(None)
+    assert batch.run_job(job("ollama", variant=1), str(tmp_path))['progression'] == first['progression']
+
+
+def test_workers_share_the_cache_file(tmp_path):
+    path = str(tmp_path / "cache.sqlite3")
+    caches = [ProgressionCache(path, busy_timeout=5.0) for _ in range(4)]
+    errors = []
+
+    def write(cache, worker):
+        try:
+            for i in range(50):
+                cache.put(json.dumps([worker, i]), "C-F-G-C")
+        except Exception as e:
+            errors.append(e)
+    threads = [threading.Thread(target=write, args=(cache, i)) for i, cache in enumerate(caches)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert errors == []
+    assert caches[0].stats()['entries'] == 200
+    for cache in caches:
+        cache.close()
@@ -0,0 +1,111 @@
+import threading
+import pytest
+import midi_sequencer
+from chord_player import ChordProgressionPlayer, parse_figures
+from test_midi_sequencer import StubPort
+
+
+@pytest.fixture
+def player(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)  # The player keeps its cache and session files in the working directory
+    player = ChordProgressionPlayer()
+    yield player
+    player.stop_playing()
+    player.set_midi_output(None)
+    player.prefetcher.close()
+    player.progression_cache.close()
+
+
+def pygame_commands(player):
+    commands = []
+    while not player.commands.empty():
+        commands.append(player.commands.get()[0])
+    return commands
+
+
+def playing_through_pygame(player):
+    # Stands in for the pygame loop: commands stay on the queue where the test can read them
+    player.playback_thread = threading.current_thread()
+    player.current_progression = parse_figures(['I', 'IV', 'V', 'I'], 'C', 4)
+    player.queue_progression(player.current_progression)
+    player.is_playing = True
+    assert pygame_commands(player) == ['play']
+
+
+def test_switching_to_a_port_silences_pygame_and_moves_playback(player, monkeypatch):
+    port = StubPort()
+    monkeypatch.setattr(midi_sequencer, 'open_output', lambda port_name=None, virtual=False: port)
+    playing_through_pygame(player)
+
+    player.set_midi_output("stub")
+    assert pygame_commands(player) == ['stop']
+    assert player.sequencer is not None and player.sequencer.thread is not None
+
+    player.stop_playing()
+    assert player.sequencer.thread is None
+    assert pygame_commands(player) == []
+
+
+def test_switching_back_resumes_on_pygame(player, monkeypatch):
+    monkeypatch.setattr(midi_sequencer, 'open_output', lambda port_name=None, virtual=False: StubPort())
+    playing_through_pygame(player)
+    player.set_midi_output("stub")
+    pygame_commands(player)
+
+    player.set_midi_output(None)
+    assert player.sequencer is None
+    assert player.is_playing
+    assert pygame_commands(player) == ['play']
+
+
+def test_a_port_that_fails_to_open_leaves_playback_alone(player, monkeypatch):
+    def unavailable(port_name=None, virtual=False):
+        raise OSError("no such port")
+    monkeypatch.setattr(midi_sequencer, 'open_output', unavailable)
+    playing_through_pygame(player)
+
+    with pytest.raises(OSError):
+        player.set_midi_output("missing")
+    assert pygame_commands(player) == []
+    assert player.is_playing
+
+
+class CountingAPI:
+    """Ollama stand-in that answers from ``answers`` in turn (None for no answer) and counts the calls."""
+
+    def __init__(self, *answers):
+        self.answers = list(answers)
+        self.calls = 0
+
+    def generate_progression_with_ollama(self, prompt, chord_limit=None, cancel=None):
+        answer = self.answers[self.calls % len(self.answers)]
+        self.calls += 1
+        return answer
+
+    def close(self):
+        pass
+
+
+def test_interactive_generates_always_ask_ollama(player):
+    player.ollama_api = CountingAPI("C-F-G-C", "Am-F-C-G", "C-Am-F-G")
+    request = player.generation_request(with_previous=False)
+    answers = [player.fetch_progression(request) for _ in range(9)]
+    assert player.ollama_api.calls == 9
+    assert answers == ["C-F-G-C", "Am-F-C-G", "C-Am-F-G"] * 3
+
+
+def test_cache_answers_when_ollama_gives_nothing(player):
+    player.ollama_api = CountingAPI("C-F-G-C", "Am-F-C-G", "C-Am-F-G", None)
+    request = player.generation_request(with_previous=False)
+    answers = [player.fetch_progression(request) for _ in range(4)]
+    # The two answers just played are skipped
+    assert answers == ["C-F-G-C", "Am-F-C-G", "C-Am-F-G", "C-F-G-C"]
+
+
+def test_cache_first_reuses_the_stored_answer(player):
+    player.ollama_api = CountingAPI("C-F-G-C", "Am-F-C-G")
+    player.cache_first = True
+    player.progression_cache.avoid_repeats = 0
+    request = player.generation_request(with_previous=False)
+    assert [player.fetch_progression(request) for _ in range(3)] == ["C-F-G-C"] * 3
+    assert player.ollama_api.calls == 1
@@ -0,0 +1,64 @@
+import music21
+import pytest
+from chord_player import parse_figures
+from chord_resolver import ROMAN_TABLE, check_roman_table, resolve_chord_symbol, resolve_roman
+
+KEYS = ['C', 'G', 'F#', 'Bb', 'a', 'e', 'c#']
+ROMAN_FIGURES = ['I', 'ii', 'iii', 'IV', 'V', 'vi', 'vii°', 'i', 'iv', 'v', 'VI', 'III', 'VII', 'ii°', 'viio']
+CHORD_SYMBOLS = ['C', 'Cmaj7', 'Dm7', 'G7', 'Am', 'F#m7', 'Bdim', 'Caug', 'Gsus4', 'D9', 'Aadd9', 'E7']
+# Flats as an LLM writes them, and as music21 spells them
+FLAT_CHORD_SYMBOLS = [('Bb', 'B-'), ('Ebmaj7', 'E-maj7'), ('Abm', 'A-m'), ('Bb7/D', 'B-7/D'), ('Db/Ab', 'D-/A-')]
+SLASH_CHORDS = [('C/E', 'E'), ('G/B', 'B'), ('Am7/G', 'G'), ('F/A', 'A')]
+
+
+def music21_roman(figure, key):
+    return tuple(pitch.midi for pitch in music21.roman.RomanNumeral(figure, music21.key.Key(key)).pitches)
+
+
+def music21_symbol(figure, bass=None):
+    harmony = music21.harmony.ChordSymbol(figure)
+    if bass:
+        harmony.bass(music21.pitch.Pitch(bass))
+    return tuple(pitch.midi for pitch in harmony.pitches)
+
+
+def test_roman_table_matches_music21():
+    assert len(ROMAN_TABLE) > 0
+    assert check_roman_table() == []
+
+
+@pytest.mark.parametrize('key', KEYS)
+@pytest.mark.parametrize('figure', ROMAN_FIGURES)
+def test_resolve_roman_matches_music21(figure, key):
+    assert resolve_roman(figure, key).midi == music21_roman(figure, key)
+
+
+@pytest.mark.parametrize('figure', CHORD_SYMBOLS)
+def test_resolve_chord_symbol_matches_music21(figure):
+    assert resolve_chord_symbol(figure).midi == music21_symbol(figure)
+
+
+@pytest.mark.parametrize('figure, music21_figure', FLAT_CHORD_SYMBOLS)
+def test_resolve_flat_chord_symbol_matches_music21(figure, music21_figure):
+    resolved = resolve_chord_symbol(figure)
+    assert resolved.midi == music21_symbol(music21_figure)
+    assert resolved.figure == figure
+
+
+@pytest.mark.parametrize('figure, bass', SLASH_CHORDS)
+def test_resolve_slash_chord_matches_music21(figure, bass):
+    assert resolve_chord_symbol(figure, bass).midi == music21_symbol(figure, bass)
+
+
+@pytest.mark.parametrize('key', ['C', 'G', 'Eb'])
+def test_parse_figures_matches_music21(key):
+    figures = ['I', 'vi', 'IV', 'V', 'Cmaj7', 'Dm7', 'G7/B', 'Bbmaj7']
+    expected = [music21_roman(figure, key) for figure in figures[:4]]
+    expected += [music21_symbol('Cmaj7'), music21_symbol('Dm7'), music21_symbol('G7/B', 'B'), music21_symbol('B-maj7')]
+    assert [chord.midi for chord in parse_figures(figures, key, len(figures))] == expected
+
+
+def test_parse_figures_pads_invalid_and_missing_chords_with_the_tonic():
+    tonic = music21_roman('I', 'D')
+    parsed = parse_figures(['Xq', 'V'], 'D', 4)
+    assert [chord.midi for chord in parsed] == [tonic, music21_roman('V', 'D'), tonic, tonic]
@@ -0,0 +1,19 @@
+from chord_rhythm import RhythmLibrary, load_rhythm_library
+
+
+def test_meter_comes_from_the_pattern_not_its_name():
+    library = RhythmLibrary([
+        {"name": "slow_waltz_in_name_only", "meter": 4, "pattern": [[4], [4]]},
+        {"name": "minuet", "meter": 3, "pattern": [[3], [2, 1]]},
+        {"name": "jig", "meter": 6, "pattern": [[3, 3]]},
+        {"name": "unmarked", "pattern": [[2], [2]]},
+    ])
+    assert library.select(meter=3) == ["minuet"]
+    assert library.select(meter=6) == ["jig"]
+    assert library.select(meter=4) == ["slow_waltz_in_name_only", "unmarked"]
+
+
+def test_library_patterns_declare_their_meter():
+    library = load_rhythm_library()
+    assert sorted(library.select(meter=3)) == ["complex_waltz_rhythm", "simple_waltz_rhythm"]
+    assert len(library.select(meter=4)) == len(library.names) - 2
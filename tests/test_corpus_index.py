@@ -0,0 +1,34 @@
+import json
+import pytest
+from chord_player import ChordProgressionPlayer
+from chord_resolver import resolve_roman
+from corpus_index import ProgressionCorpus, normalize_chord
+
+
+@pytest.mark.parametrize('figure, symbol', [
+    ('vii°', 'vii°'), ('viio', 'vii°'), ('iio', 'ii°'), ('viiø7', 'vii°'), ('III+', 'III+'),
+    ('vii', 'vii'), ('ii', 'ii'), ('V7', 'V'), ('I', 'I'),
+    ('Am7', 'vi7'), ('Bdim', 'vii°'), ('Bbmaj7', 'bVIImaj7'),
+])
+def test_normalize_chord_reads_the_quality_from_the_resolved_triad(figure, symbol):
+    assert normalize_chord(figure, 0) == symbol
+
+
+def test_resolved_romans_keep_their_quality_mark():
+    assert [resolve_roman(figure, 'C').figure for figure in ('vii°', 'viio', 'vii', 'III+')] == \
+        ['vii°', 'vii°', 'vii', 'III+']
+
+
+def test_manifest_figures_round_trip_through_the_corpus(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    player = ChordProgressionPlayer(prefetch=False)
+    progression = [resolve_roman(figure, 'C') for figure in ('I', 'viio', 'iii', 'vi')]
+    record = {'key': 'C', 'artist': None, 'progression': [player.format_chord(chord) for chord in progression]}
+    player.progression_cache.close()
+    assert record['progression'] == ['I', 'vii°', 'iii', 'vi']
+
+    path = tmp_path / "manifest.jsonl"
+    path.write_text(json.dumps(record) + "\n")
+    corpus = ProgressionCorpus()
+    assert corpus.import_manifest(str(path)) == 1
+    assert [corpus.symbols[i] for i in next(corpus.sequences())] == ['I', 'vii°', 'iii', 'vi']
@@ -0,0 +1,177 @@
+import logging
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from llm_router import CircuitBreaker, Endpoint, OllamaRouter
+
+
+class StubAPI:
+    """Stand-in for OllamaAPI: answers after ``delay`` seconds unless the caller cancels first."""
+
+    def __init__(self, name, delay=0.0, answer="C-F-G-C"):
+        self.model = name
+        self.api_url = "stub"
+        self.delay = delay
+        self.answer = answer
+        self.calls = 0
+        self.cancelled = 0
+        self.lock = threading.Lock()
+
+    def generate_progression_with_ollama(self, prompt, chord_limit=None, cancel=None):
+        with self.lock:
+            self.calls += 1
+        if cancel is not None and cancel.wait(self.delay):
+            with self.lock:
+                self.cancelled += 1
+            return None
+        return self.answer
+
+    def close(self):
+        pass
+
+
+def stub_endpoint(api, max_concurrency=1):
+    endpoint = Endpoint("http://stub", max_concurrency=max_concurrency)
+    endpoint.api = api
+    return endpoint
+
+
+def settle(router):
+    # Cancelled hedges release their slots on the router's own threads
+    deadline = time.perf_counter() + 1.0
+    while any(endpoint.in_flight for endpoint in router.endpoints) and time.perf_counter() < deadline:
+        time.sleep(0.01)
+
+
+def test_busy_endpoint_queues_instead_of_falling_back():
+    api = StubAPI("a", delay=0.1)
+    router = OllamaRouter([stub_endpoint(api)], queue_timeout=2.0)
+    with ThreadPoolExecutor(max_workers=3) as pool:
+        results = list(pool.map(lambda _: router.generate_progression_with_ollama("prompt", 4), range(3)))
+    router.close()
+
+    assert results == ["C-F-G-C"] * 3
+    assert api.calls == 3
+    stats = router.stats()
+    assert stats['unavailable'] == stats['queue_timeouts'] == 0
+
+
+def test_queue_wait_is_bounded():
+    api = StubAPI("a", delay=0.5)
+    router = OllamaRouter([stub_endpoint(api)], queue_timeout=0.05)
+    first = threading.Thread(target=router.generate_progression_with_ollama, args=("prompt", 4))
+    first.start()
+    time.sleep(0.02)
+    start = time.perf_counter()
+    assert router.generate_progression_with_ollama("prompt", 4) is None
+    assert time.perf_counter() - start < 0.3
+    first.join()
+    router.close()
+
+    assert router.stats()['queue_timeouts'] == 1
+    assert router.stats()['unavailable'] == 0
+
+
+def test_open_breakers_fail_fast():
+    endpoint = stub_endpoint(StubAPI("a"))
+    for _ in range(endpoint.breaker.failure_threshold):
+        endpoint.breaker.record_failure()
+    router = OllamaRouter([endpoint], queue_timeout=5.0)
+    start = time.perf_counter()
+    assert router.generate_progression_with_ollama("prompt", 4) is None
+    assert time.perf_counter() - start < 0.1
+    router.close()
+
+    assert router.stats()['unavailable'] == 1
+
+
+def test_losing_hedge_is_cancelled_without_a_breaker_failure():
+    slow, fast = StubAPI("slow", delay=5.0), StubAPI("fast", answer="Am-F-C-G")
+    router = OllamaRouter([stub_endpoint(slow), stub_endpoint(fast)], initial_hedge_delay=0.05)
+    start = time.perf_counter()
+    assert router.generate_progression_with_ollama("prompt", 4) == "Am-F-C-G"
+    assert time.perf_counter() - start < 1.0
+    settle(router)
+    router.close()
+
+    stats = router.stats()
+    assert (stats['hedges'], stats['hedge_wins']) == (1, 1)
+    assert slow.cancelled == 1
+    slow_stats = next(endpoint for endpoint in stats['endpoints'] if endpoint['name'].startswith("slow"))
+    assert (slow_stats['state'], slow_stats['failures'], slow_stats['in_flight']) == ('closed', 0, 0)
+
+
+def test_every_endpoint_failing_is_not_reported_as_unavailable():
+    router = OllamaRouter([stub_endpoint(StubAPI("a", answer=None)), stub_endpoint(StubAPI("b", answer=None))])
+    assert router.generate_progression_with_ollama("prompt", 4) is None
+    router.close()
+
+    stats = router.stats()
+    assert (stats['failed'], stats['unavailable']) == (1, 0)
+
+
+def test_caller_cancel_hangs_up_and_returns_none():
+    api = StubAPI("slow", delay=5.0)
+    router = OllamaRouter([stub_endpoint(api)])
+    cancel = threading.Event()
+    threading.Timer(0.1, cancel.set).start()
+    start = time.perf_counter()
+    assert router.generate_progression_with_ollama("prompt", 4, cancel=cancel) is None
+    assert time.perf_counter() - start < 0.5
+    settle(router)
+    router.close()
+
+    stats = router.stats()
+    assert api.cancelled == 1
+    assert (stats['failed'], stats['unavailable'], stats['endpoints'][0]['failures']) == (0, 0, 0)
+
+
+def endpoint_stats(router, server):
+    return next(endpoint for endpoint in router.stats()['endpoints'] if endpoint['name'].endswith(server.url))
+
+
+def test_hedge_wins_over_a_slow_stream_and_hangs_it_up(ollama_server):
+    slow = ollama_server(chords=["Am", "Dm", "E", "Am"], chunk_delay=0.5)
+    fast = ollama_server()
+    router = OllamaRouter([Endpoint(slow.url), Endpoint(fast.url)], initial_hedge_delay=0.1)
+    start = time.perf_counter()
+    assert router.generate_chords("prompt", 4) == ["C", "F", "G", "C"]
+    assert time.perf_counter() - start < 1.0
+    # The losing stream was already sending chords when it was cut off
+    assert slow.hung_up.wait(2.0)
+    settle(router)
+    router.close()
+
+    stats = router.stats()
+    assert (stats['hedges'], stats['hedge_wins']) == (1, 1)
+    assert (endpoint_stats(router, slow)['state'], endpoint_stats(router, slow)['failures']) == ('closed', 0)
+
+
+def test_breaker_opens_on_a_failing_server_and_stops_sending_it_requests(ollama_server):
+    server = ollama_server(status=500)
+    router = OllamaRouter([Endpoint(server.url, breaker=CircuitBreaker(failure_threshold=2))])
+    assert router.generate_chords("prompt", 4) is None
+    assert router.generate_chords("prompt", 4) is None
+    assert endpoint_stats(router, server)['state'] == 'open'
+
+    start = time.perf_counter()
+    assert router.generate_chords("prompt", 4) is None
+    assert time.perf_counter() - start < 0.1
+    router.close()
+
+    assert len(server.requests) == 2
+    stats = router.stats()
+    assert (stats['failed'], stats['unavailable']) == (2, 1)
+
+
+def test_falls_back_when_every_server_errors_or_times_out(ollama_server, caplog):
+    broken, stalled = ollama_server(status=500), ollama_server(delay=1.0)
+    router = OllamaRouter([Endpoint(broken.url), Endpoint(stalled.url, timeout=(1.0, 0.2))],
+                          initial_hedge_delay=5.0)
+    with caplog.at_level(logging.WARNING):
+        assert router.generate_progression_with_ollama("prompt", 4) is None
+    router.close()
+
+    assert len(broken.requests) == len(stalled.requests) == 1
+    assert router.stats()['failed'] == 1
+    assert "Every Ollama endpoint failed; falling back to local generation" in caplog.text
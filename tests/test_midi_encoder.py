@@ -0,0 +1,101 @@
+import io
+import random
+import mido
+import numpy as np
+import pytest
+from midi_encoder import TrackEvents, MAX_DELTA, note_events, encode_track, encode_smf, variable_length
+
+
+def decode(data):
+    """Every channel event of every track, read back by mido, as (tick, status, data...) tuples."""
+    midi = mido.MidiFile(file=io.BytesIO(data))
+    tracks = []
+    for track in midi.tracks:
+        tick = 0
+        decoded = []
+        for message in track:
+            tick += message.time
+            if not message.is_meta:
+                decoded.append((tick,) + tuple(message.bytes()))
+        tracks.append(decoded)
+    return midi, tracks
+
+
+def expected(events):
+    # Program change and channel pressure carry one data byte, everything else two
+    return [(tick, status, data1) if (status & 0xE0) == 0xC0 else (tick, status, data1, data2)
+            for tick, status, data1, data2 in zip(*(np.asarray(array).tolist() for array in events))]
+
+
+def with_program(events, channel, program):
+    return TrackEvents(*(np.concatenate(([value], array))
+                         for value, array in zip((0, 0xC0 | channel, program, 0), events)))
+
+
+def random_chords(count, seed=0):
+    rng = random.Random(seed)
+    starts, pitches = [], []
+    for i in range(count):
+        for pitch in rng.sample(range(36, 84), 4):
+            starts.append(2 * i)
+            pitches.append(pitch)
+    return starts, pitches
+
+
+def test_single_track_round_trip():
+    starts, pitches = random_chords(200)
+    events = note_events(starts, 2, pitches, 100)
+    midi, tracks = decode(encode_smf([encode_track(events, name="Chords", tempo=97)]))
+    assert midi.type == 0
+    assert midi.ticks_per_beat == 960
+    assert tracks == [expected(events)]
+    assert round(mido.tempo2bpm(next(message.tempo for message in midi.tracks[0] if message.type == 'set_tempo'))) == 97
+
+
+def test_multi_track_round_trip_on_every_channel_with_program_changes():
+    track_events = []
+    for channel in range(16):
+        starts, pitches = random_chords(50, seed=channel)
+        events = note_events(starts, 1.5, pitches, 40 + channel * 5, channel=channel)
+        track_events.append(with_program(events, channel, (channel * 7) % 128))
+    data = encode_smf([encode_track(name="Tempo", tempo=120)] + [encode_track(events) for events in track_events])
+    midi, tracks = decode(data)
+    assert midi.type == 1
+    assert tracks[0] == []
+    assert tracks[1:] == [expected(events) for events in track_events]
+    assert tracks[5][0] == (0, 0xC4, 28)  # A one-byte program change ahead of the notes
+
+
+def test_running_status_drops_repeated_status_bytes():
+    events = note_events([0, 0, 1], 1, [60, 64, 67], 100)
+    track = encode_track(events)
+    body = track[8:]
+    assert body == bytes([0x00, 0x90, 60, 100, 0x00, 64, 100,  # Second note-on reuses the status
+                          0x87, 0x40, 0x80, 60, 0, 0x00, 64, 0,  # Note-offs first at the shared tick
+                          0x00, 0x90, 67, 100,
+                          0x87, 0x40, 0x80, 67, 0]) + b'\x00\xff\x2f\x00'
+    assert decode(encode_smf([track]))[1] == [expected(events)]
+
+
+def test_long_deltas_round_trip():
+    # Gaps of 2**7, 2**14 and 2**21 ticks and up: one- to four-byte delta times
+    starts = np.array([0, 128, 128 + 16384, 128 + 16384 + 2097152, MAX_DELTA // 2]) / 960
+    events = note_events(starts, 0.5, [60, 62, 64, 65, 67], 90)
+    track = encode_track(events, end_tick=MAX_DELTA // 2 + 10 ** 6)
+    midi, tracks = decode(encode_smf([track]))
+    assert tracks == [expected(events)]
+    assert sum(message.time for message in midi.tracks[0]) == MAX_DELTA // 2 + 10 ** 6
+    assert len(variable_length(MAX_DELTA)) == 4
+
+
+def test_out_of_order_or_oversized_deltas_are_rejected():
+    events = note_events([0], 1, [60])
+    with pytest.raises(ValueError):
+        encode_track(TrackEvents(*(array[::-1] for array in events)))
+    with pytest.raises(ValueError):
+        encode_track(events, end_tick=MAX_DELTA + 960 + 1)
+
+
+def test_note_events_dedupes_doubled_voices_and_releases_before_restriking():
+    events = note_events([0, 0, 1], 1, [60, 60, 60], 100)
+    assert expected(events) == [(0, 0x90, 60, 100), (960, 0x80, 60, 0), (960, 0x90, 60, 100), (1920, 0x80, 60, 0)]
@@ -0,0 +1,85 @@
+import threading
+import time
+from midi_sequencer import MidiSequencer, chord_events
+
+TOLERANCE = 0.03  # seconds of scheduling slack allowed on a loaded machine
+
+
+class StubPort:
+    """Loopback stand-in for a mido output: records every message with the time it was sent."""
+
+    def __init__(self):
+        self.sent = []
+        self.lock = threading.Lock()
+
+    def send(self, message):
+        with self.lock:
+            self.sent.append((time.perf_counter(), message))
+
+    def close(self):
+        pass
+
+    def notes(self):
+        with self.lock:
+            return [(at, message.type, message.note) for at, message in self.sent
+                    if message.type in ('note_on', 'note_off')]
+
+    def sent_at(self, kind, note):
+        return next(at for at, message_type, message_note in self.notes() if (message_type, message_note) == (kind, note))
+
+
+def test_stop_releases_held_notes():
+    port = StubPort()
+    sequencer = MidiSequencer(port, tempo=600, send_clock=False)
+    sequencer.play(chord_events([(60, 64)], beats_per_chord=4), 4)
+    time.sleep(0.1)  # Inside the chord, which lasts 0.4 s
+    sequencer.stop()
+
+    assert [(kind, note) for _, kind, note in port.notes()] == [
+        ('note_on', 60), ('note_on', 64), ('note_off', 60), ('note_off', 64)]
+    assert not sequencer.active_notes
+
+
+def test_new_pattern_swaps_in_at_the_next_bar():
+    port = StubPort()
+    sequencer = MidiSequencer(port, tempo=240, send_clock=False, beats_per_bar=2)
+    sequencer.play(chord_events([(60,)], beats_per_chord=4), 4)
+    time.sleep(0.1)
+    sequencer.play(chord_events([(70,)], beats_per_chord=2), 2)
+    time.sleep(0.7)
+    sequencer.stop()
+
+    bar = sequencer.beat_to_time(2)  # 0.5 s in at 240 bpm
+    notes = [(kind, note) for _, kind, note in port.notes()]
+    # The held note is released at the swap, then the new pattern starts on the same bar line
+    assert notes[:3] == [('note_on', 60), ('note_off', 60), ('note_on', 70)]
+    assert abs(port.sent_at('note_off', 60) - bar) < TOLERANCE
+    assert abs(port.sent_at('note_on', 70) - bar) < TOLERANCE
+
+
+def test_tempo_change_reanchors_at_the_next_bar():
+    port = StubPort()
+    sequencer = MidiSequencer(port, tempo=240, send_clock=False, beats_per_bar=2)
+    sequencer.play(chord_events([(60,), (62,), (64,), (65,)], beats_per_chord=1), 4)
+    started = sequencer.anchor_time
+    time.sleep(0.1)
+    sequencer.set_tempo(120)
+    time.sleep(1.1)
+    sequencer.stop()
+
+    assert sequencer.anchor_beat == 2
+    assert sequencer.tempo == 120
+    # Beats 0 and 1 at 0.25 s per beat, then beats 2 and 3 at 0.5 s per beat from the bar line
+    assert abs(port.sent_at('note_on', 62) - started - 0.25) < TOLERANCE
+    assert abs(port.sent_at('note_on', 64) - started - 0.5) < TOLERANCE
+    assert abs(port.sent_at('note_on', 65) - started - 1.0) < TOLERANCE
+
+
+def test_clock_runs_at_24_ppqn():
+    port = StubPort()
+    sequencer = MidiSequencer(port, tempo=600)
+    sequencer.play([], 4, loop=False)
+    sequencer.thread.join(timeout=2)
+    types = [message.type for _, message in port.sent]
+    assert types[0] == 'start' and types[-1] == 'stop'
+    assert types.count('clock') == 4 * 24
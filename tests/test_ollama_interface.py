@@ -0,0 +1,160 @@
+import json
+import threading
+import time
+import pytest
+import instrumentation
+from ollama_interface import OllamaAPI, ChordArrayStreamParser, Prefetcher, TAIL_CHUNKS
+
+
+class StubResponse:
+    """Streams ``pieces`` as Ollama's newline-delimited JSON chunks and counts how many were read."""
+
+    def __init__(self, pieces):
+        self.pieces = pieces
+        self.read = 0
+        self.closed = False
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.closed = True
+
+    def raise_for_status(self):
+        pass
+
+    def iter_lines(self):
+        for i, piece in enumerate(self.pieces):
+            self.read += 1
+            yield json.dumps({"response": piece, "done": i == len(self.pieces) - 1}).encode()
+
+
+class StubSession:
+    def __init__(self, pieces):
+        self.response = StubResponse(pieces)
+        self.requests = []
+
+    def post(self, url, json=None, **kwargs):
+        self.requests.append((json, kwargs))
+        return self.response
+
+
+def api_streaming(pieces):
+    api = OllamaAPI("http://stub")
+    api.http = StubSession(pieces)
+    return api
+
+
+def test_parser_yields_items_once_their_closing_quote_arrives():
+    parser = ChordArrayStreamParser()
+    assert parser.feed('{"cho') == []
+    assert parser.feed('rds": ["Am7", "D') == ["Am7"]
+    assert parser.feed('7\\"", "G') == ['D7"']
+    assert parser.feed('"]}') == ["G"]
+
+
+def test_generate_chords_streams_and_hangs_up_after_count_items():
+    pieces = ['{"chords": [', '"C", ', '"Am"', ', "F", "G"', ']', '}'] + ['\n'] * 50
+    api = api_streaming(pieces)
+    assert api.generate_chords("prompt", 4) == ["C", "Am", "F", "G"]
+
+    body, kwargs = api.http.requests[0]
+    assert body["stream"] is True and kwargs["stream"] is True
+    assert api.http.response.read == 4 + TAIL_CHUNKS + 1
+    assert api.http.response.closed
+
+
+def test_generate_chords_drains_a_reply_that_ends_promptly():
+    pieces = ['{"chords": [', '"C", ', '"Am"', ', "F", "G"', ']', '}']
+    api = api_streaming(pieces)
+    assert api.generate_chords("prompt", 4) == ["C", "Am", "F", "G"]
+    assert api.http.response.read == len(pieces)
+
+
+def test_generate_chords_falls_back_to_the_whole_reply():
+    api = api_streaming(['{"chords": ["C", null', ', "G"]}'])
+    assert api.generate_chords("prompt", 3) == ["C", None, "G"]
+
+
+def test_generate_chords_stops_when_cancelled():
+    cancel = threading.Event()
+    cancel.set()
+    api = api_streaming(['{"chords": ["C", "F", "G", "C"]}'])
+    assert api.generate_chords("prompt", 4, cancel=cancel) is None
+    assert api.http.response.read == 1
+
+
+def wait_for(condition, timeout=2.0):
+    deadline = time.perf_counter() + timeout
+    while not condition() and time.perf_counter() < deadline:
+        time.sleep(0.01)
+    return condition()
+
+
+def test_requests_reuse_one_keep_alive_connection(ollama_server):
+    server = ollama_server()
+    api = OllamaAPI(server.url)
+    for _ in range(3):
+        assert api.generate_chords("prompt", 4) == ["C", "F", "G", "C"]
+    assert api.generate_progression_with_ollama("prompt", chord_limit=4) == "C-F-G-C"
+    assert server.connections == 1
+
+
+def test_slow_server_times_out(ollama_server):
+    server = ollama_server(delay=1.0)
+    api = OllamaAPI(server.url, timeout=(1.0, 0.2))
+    start = time.perf_counter()
+    assert api.generate_chords("prompt", 4) is None
+    assert time.perf_counter() - start < 0.8
+
+
+def test_structured_reply_hangs_up_once_count_chords_arrive(ollama_server):
+    server = ollama_server(chunk_delay=0.01, padding=500)  # Five seconds of whitespace after the answer
+    api = OllamaAPI(server.url)
+    start = time.perf_counter()
+    assert api.generate_chords("prompt", 4) == ["C", "F", "G", "C"]
+    assert time.perf_counter() - start < 1.0
+    assert server.hung_up.wait(2.0)
+
+
+def test_prefetcher_keeps_depth_requests_ahead(ollama_server):
+    server = ollama_server()
+    api = OllamaAPI(server.url)
+    prefetcher = Prefetcher(lambda prompt, cancel=None: api.generate_chords(prompt, 4, cancel), depth=2)
+    prefetcher.prime("settings", "prompt")
+    assert wait_for(lambda: len(server.requests) == 2)
+
+    assert prefetcher.get("settings", "prompt") == ["C", "F", "G", "C"]
+    assert wait_for(lambda: len(server.requests) == 3)
+    assert len(prefetcher.futures) == 2
+    prefetcher.close()
+
+
+def test_new_settings_cancel_a_stale_fetch(ollama_server):
+    stale = ollama_server(chords=["Am", "Dm", "E", "Am"], chunk_delay=0.5)
+    fresh = ollama_server()
+    apis = {server.url: OllamaAPI(server.url) for server in (stale, fresh)}
+    prefetcher = Prefetcher(lambda url, cancel=None: apis[url].generate_chords("prompt", 4, cancel), depth=1)
+    prefetcher.prime("old settings", stale.url)
+    assert wait_for(lambda: stale.requests)
+
+    # One worker: without the cancel this waits out the two-second stale reply
+    start = time.perf_counter()
+    assert prefetcher.get("new settings", fresh.url) == ["C", "F", "G", "C"]
+    assert time.perf_counter() - start < 1.2
+    assert stale.hung_up.wait(3.0)
+    prefetcher.close()
+
+
+def test_both_request_paths_are_timed_as_ollama_requests(ollama_server):
+    server = ollama_server()
+    api = OllamaAPI(server.url)
+    instrumentation.reset()
+    instrumentation.enable()
+    try:
+        api.generate_chords("prompt", 4)
+        api.generate_progression_with_ollama("prompt", chord_limit=4)
+        assert instrumentation.summary()["ollama.request"]["count"] == 2
+    finally:
+        instrumentation.enable(False)
+        instrumentation.reset()
@@ -0,0 +1,186 @@
+import asyncio
+import base64
+import http.client
+import json
+import os
+import socket
+import struct
+import threading
+import pytest
+import server
+from chord_player import ChordProgressionPlayer
+from ollama_interface import OllamaAPI
+from server import HOST, TEXT, CLOSE, ChordService
+
+
+@pytest.fixture
+def service(tmp_path, monkeypatch, ollama_server):
+    monkeypatch.chdir(tmp_path)  # The player saves its corpus in the working directory
+    player = ChordProgressionPlayer(cache_path=":memory:", prefetch=False)
+    player.ollama_api.close()
+    player.ollama_api = OllamaAPI(ollama_server(chords=["Am", "F", "C", "G"]).url)
+    service = ChordService(player, batch_window=0.05)
+    loop = asyncio.new_event_loop()
+    thread = threading.Thread(target=loop.run_forever, daemon=True)
+    thread.start()
+
+    async def start():
+        listener = await asyncio.start_server(service.handle_connection, HOST, 0)
+        return listener, asyncio.create_task(service.render_loop())
+    listener, render_task = asyncio.run_coroutine_threadsafe(start(), loop).result()
+    service.port = listener.sockets[0].getsockname()[1]
+    yield service
+
+    async def stop():
+        render_task.cancel()
+        listener.close()
+        await listener.wait_closed()
+    asyncio.run_coroutine_threadsafe(stop(), loop).result()
+    loop.call_soon_threadsafe(loop.stop)
+    thread.join()
+    loop.close()
+    player.close()
+
+
+def request(service, method, path, body=None):
+    connection = http.client.HTTPConnection(HOST, service.port, timeout=5)
+    connection.request(method, path, body=None if body is None else json.dumps(body))
+    response = connection.getresponse()
+    payload = response.read()
+    connection.close()
+    if response.getheader('Content-Type') == 'application/json':
+        payload = json.loads(payload)
+    return response.status, payload
+
+
+class WebSocketClient:
+    def __init__(self, port, query=''):
+        self.socket = socket.create_connection((HOST, port), timeout=5)
+        key = base64.b64encode(os.urandom(16)).decode()
+        self.socket.sendall(f"GET /ws{query} HTTP/1.1\r\nHost: {HOST}\r\nUpgrade: websocket\r\n"
+                            f"Connection: Upgrade\r\nSec-WebSocket-Key: {key}\r\n\r\n".encode())
+        self.file = self.socket.makefile('rb')
+        assert b' 101 ' in self.file.readline()
+        while self.file.readline() not in (b'\r\n', b''):
+            pass
+
+    def send_frame(self, payload, opcode=TEXT, fin=True):
+        # Masked, as a browser sends them
+        mask = os.urandom(4)
+        masked = bytes(byte ^ mask[i % 4] for i, byte in enumerate(payload))
+        length = len(payload)
+        if length < 126:
+            header = struct.pack('>BB', fin << 7 | opcode, 0x80 | length)
+        else:
+            header = struct.pack('>BBH', fin << 7 | opcode, 0x80 | 126, length)
+        self.socket.sendall(header + mask + masked)
+
+    def send_json(self, message):
+        self.send_frame(json.dumps(message).encode())
+
+    def receive(self):
+        first, second = self.file.read(2)
+        length = second & 0x7F
+        if length == 126:
+            length = struct.unpack('>H', self.file.read(2))[0]
+        elif length == 127:
+            length = struct.unpack('>Q', self.file.read(8))[0]
+        return first & 0x0F, self.file.read(length)
+
+    def receive_json(self, kind):
+        while True:
+            opcode, payload = self.receive()
+            assert opcode == TEXT
+            message = json.loads(payload)
+            if message['type'] == kind:
+                return message
+
+    def close(self):
+        self.file.close()
+        self.socket.close()
+
+
+def test_sessions_are_created_and_updated(service):
+    status, session = request(service, 'POST', '/sessions', {"key": "Am", "tempo": 90})
+    assert status == 200
+    assert (session['key'], session['tempo'], session['progression']) == ('Am', 90, [])
+    path = f"/sessions/{session['session']}"
+
+    status, error = request(service, 'POST', path + '/settings', {"tempo": 300, "key": "G"})
+    assert status == 400 and 'Tempo' in error['error']
+    assert request(service, 'GET', path)[1]['tempo'] == 90
+
+    status, generated = request(service, 'POST', path + '/generate')
+    assert status == 200 and generated['progression'] == ["Am", "F", "C", "G"]
+    status, updated = request(service, 'POST', path + '/settings', {"key": "Bm", "length": 8})
+    assert status == 200
+    assert (updated['key'], updated['length'], updated['progression']) == ('Bm', 8, ["Bm", "G", "D", "A"])
+    assert request(service, 'GET', '/sessions/missing')[0] == 404
+
+
+def test_render_returns_midi_and_caches_it(service):
+    body = {"progression": ["I", "vi", "IV", "V"], "key": "D", "tempo": 120}
+    status, midi = request(service, 'POST', '/render', body)
+    assert status == 200 and midi.startswith(b'MThd')
+    assert request(service, 'POST', '/render', body)[1] == midi
+    assert request(service, 'POST', '/render', {"progression": []})[0] == 400
+
+    stats = request(service, 'GET', '/stats')[1]
+    assert (stats['renders'], stats['cache_hit_rate'], stats['cache_entries']) == (2, 0.5, 1)
+
+
+def test_concurrent_generates_render_in_one_batch(service):
+    clients = 6
+    together = threading.Barrier(clients)
+    results = [None] * clients
+
+    def client(i):
+        session = request(service, 'POST', '/sessions', {"tempo": 60 + i})[1]
+        request(service, 'POST', f"/sessions/{session['session']}/generate")
+        together.wait()
+        results[i] = request(service, 'GET', f"/sessions/{session['session']}/midi")
+    threads = [threading.Thread(target=client, args=(i,)) for i in range(clients)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert all(status == 200 and midi.startswith(b'MThd') for status, midi in results)
+    assert len(set(midi for _, midi in results)) == clients  # One tempo each
+    stats = request(service, 'GET', '/stats')[1]
+    assert stats['generated'] == clients
+    assert stats['largest_batch'] > 1 and stats['batches'] < clients
+
+
+def test_malformed_content_length_is_a_bad_request(service):
+    with socket.create_connection((HOST, service.port), timeout=5) as connection:
+        connection.sendall(b"POST /sessions HTTP/1.1\r\nHost: localhost\r\nContent-Length: lots\r\n\r\n{}")
+        assert connection.recv(1024).startswith(b"HTTP/1.1 400 Bad Request")
+
+
+def test_websocket_delivers_session_events(service):
+    first = WebSocketClient(service.port)
+    session = first.receive_json('settings')
+    second = WebSocketClient(service.port, f"?session={session['session']}")
+    assert second.receive_json('settings')['session'] == session['session']
+
+    first.send_json({"type": "settings", "tempo": 240})
+    assert second.receive_json('settings')['tempo'] == 240
+    first.send_json({"type": "generate"})
+    assert second.receive_json('progression')['progression'] == ["Am", "F", "C", "G"]
+    first.send_json({"type": "play"})
+    assert [second.receive_json('chord')['chord'] for _ in range(3)] == ["Am", "F", "C"]
+    first.send_json({"type": "bogus"})
+    assert 'bogus' in first.receive_json('error')['error']
+    first.close()
+    second.close()
+
+
+def test_websocket_caps_fragmented_messages(service, monkeypatch):
+    monkeypatch.setattr(server, 'MAX_BODY', 1000)
+    client = WebSocketClient(service.port)
+    client.receive_json('settings')
+    client.send_frame(b'[' + b' ' * 599, fin=False)
+    client.send_frame(b' ' * 600, opcode=0, fin=False)  # Each frame is under the cap, the message is not
+    assert client.receive()[0] == CLOSE
+    client.close()
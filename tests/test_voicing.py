@@ -0,0 +1,57 @@
+import json
+import os
+import random
+import pytest
+from chord_resolver import resolve_chord_symbol, resolve_roman
+from voicing import optimal_voice_lead, voice_distance, voice_lead
+
+# Seeded progressions (inversions, slash chords, sevenths and extended chords)
+# voiced by the music21 apply_voice_leading this engine replaced.
+with open(os.path.join(os.path.dirname(__file__), 'data', 'voice_lead_golden.json'), encoding='utf-8') as f:
+    GOLDEN = json.load(f)
+
+ROMAN_FIGURES = ['I', 'ii', 'iii', 'IV', 'V', 'vi', 'vii°', 'i', 'iv', 'VI', 'III', 'VII']
+CHORD_SYMBOLS = ['C', 'Cmaj7', 'Dm7', 'G7', 'Am', 'F#m7', 'Bdim', 'Gsus4', 'D9', 'Aadd9', 'E7', 'G13']
+
+
+def path_cost(voicings, loop=False):
+    voicings = [tuple(sorted(voicing)) for voicing in voicings]
+    if loop:
+        voicings.append(voicings[0])
+    return sum(voice_distance(previous, current) for previous, current in zip(voicings, voicings[1:]))
+
+
+def random_chords(seed, length=16):
+    rng = random.Random(seed)
+    key = rng.choice(['C', 'G', 'F', 'a', 'e'])
+    chords = []
+    for _ in range(length):
+        if rng.random() < 0.5:
+            chords.append(resolve_roman(rng.choice(ROMAN_FIGURES), key).midi)
+        else:
+            chords.append(resolve_chord_symbol(rng.choice(CHORD_SYMBOLS)).midi)
+    return chords
+
+
+@pytest.mark.parametrize('case', GOLDEN, ids=[' '.join(case['figures']) for case in GOLDEN])
+def test_voice_lead_matches_golden_voicings(case):
+    assert [list(voicing) for voicing in voice_lead(case['chords'])] == case['voicings']
+
+
+def test_voice_lead_in_pieces_matches_one_pass():
+    chords = [chord for case in GOLDEN for chord in case['chords']]
+    whole = voice_lead(chords)
+    assert voice_lead(chords[:10]) + voice_lead(chords[10:], previous=whole[9]) == whole
+
+
+@pytest.mark.parametrize('loop', [False, True])
+@pytest.mark.parametrize('seed', range(20))
+def test_optimal_never_costs_more_than_greedy(seed, loop):
+    chords = random_chords(seed)
+    assert path_cost(optimal_voice_lead(chords, loop=loop), loop) <= path_cost(voice_lead(chords), loop)
+
+
+def test_optimal_never_costs_more_than_greedy_on_golden_progressions():
+    for case in GOLDEN:
+        chords = case['chords']
+        assert path_cost(optimal_voice_lead(chords)) <= path_cost(voice_lead(chords))
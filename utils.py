@@ -12,3 +12,10 @@ ROOT_PATTERN = re.compile(r'([A-G][b#]?)')
 QUALITY_PATTERN = re.compile(r'(maj|min|m|M|\+|aug|dim)?')
 EXTENSIONS_PATTERN = re.compile(r'((?:maj|add|sus|[0-9])*[0-9]+)*')
 BASS_PATTERN = re.compile(r'(?:/([A-G][b#]?))?')
+
+# Roman numerals match as a prefix; chord symbols must consume the whole string
+CHORD_SYMBOL_PATTERN = f"{ROOT_PATTERN.pattern}{QUALITY_PATTERN.pattern}{EXTENSIONS_PATTERN.pattern}{BASS_PATTERN.pattern}$"
+TOKEN_PATTERN = re.compile(f"(?P<roman>{ROMAN_PATTERN.pattern})|{CHORD_SYMBOL_PATTERN}")
+
+# The same grammar as one anchored regex string, for JSON schema "pattern" constraints
+CHORD_TOKEN_REGEX = f"^(?:{ROMAN_PATTERN.pattern[1:]}|{CHORD_SYMBOL_PATTERN[:-1]})$"
@@ -0,0 +1,173 @@
+from functools import lru_cache
+
+VOICES = 4
+REFERENCE_PITCH = 60  # Middle C (C4) is MIDI note 60
+
+
+def pad_voices(notes, voices=VOICES):
+    notes = list(notes)
+    while len(notes) < voices:
+        notes.append(notes[-1] - 12)
+    return tuple(notes[:voices])
+
+
+def normalize_octave(notes, reference_pitch=REFERENCE_PITCH):
+    normalized = []
+    for note in notes:
+        if note > reference_pitch + 12:
+            note -= 12 * ((note - reference_pitch - 1) // 12)
+        elif note < reference_pitch - 12:
+            note += 12 * ((reference_pitch - 1 - note) // 12)
+        normalized.append(note)
+    return tuple(normalized)
+
+
+@lru_cache(maxsize=None)
+def inversion_table(notes):
+    # Every rotation of a padded chord, raised an octave per wrapped voice,
+    # paired with its octave-normalized form. Keyed on the padded MIDI tuple
+    # since the normalization window makes the result octave dependent.
+    table = []
+    for i in range(len(notes)):
+        inversion = notes[i:] + tuple(note + 12 for note in notes[:i])
+        table.append((inversion, normalize_octave(inversion)))
+    return tuple(table)
+
+
+def movement(previous, current):
+    total = 0
+    for prev, curr in zip(previous, current):
+        distance = abs(prev - curr)
+        total += min(distance, 12 - distance)
+    return total
+
+
+def find_best_inversion(previous, notes):
+    best = None
+    best_movement = None
+    for inversion, normalized in inversion_table(notes):
+        cost = movement(previous, inversion)
+        if best_movement is None or cost < best_movement:
+            best, best_movement = normalized, cost
+    return best
+
+
+def assign_voices(previous, notes):
+    available = list(notes)
+    assigned = []
+    for prev in previous:
+        closest = min(available, key=lambda note: abs(note - prev))
+        assigned.append(closest)
+        available.remove(closest)
+    return tuple(assigned)
+
+
+def voice_lead(chords, previous=None):
+    """Voice-lead a sequence of MIDI note lists; returns one 4-voice tuple per chord.
+
+    ``previous`` seeds the first chord with an existing voicing, so long
+    progressions can be voiced in pieces with identical results.
+    """
+    voiced = []
+    for notes in chords:
+        notes = pad_voices(notes)
+        if previous is not None:
+            notes = assign_voices(previous, find_best_inversion(previous, notes))
+        else:
+            notes = normalize_octave(notes)
+        voiced.append(notes)
+        previous = notes
+    return voiced
+
+
+DEFAULT_BEAM_WIDTH = 16
+
+
+def close_voicings(notes, lowest, highest):
+    pitch_classes = [note % 12 for note in notes]
+    for i in range(len(pitch_classes)):
+        rotation = pitch_classes[i:] + pitch_classes[:i]
+        intervals = [0]
+        for previous_class, pitch_class in zip(rotation, rotation[1:]):
+            intervals.append(intervals[-1] + ((pitch_class - previous_class - 1) % 12) + 1)
+        bass = lowest + (rotation[0] - lowest) % 12
+        while bass + intervals[-1] <= highest:
+            yield tuple(bass + interval for interval in intervals)
+            bass += 12
+
+
+def candidate_voicings(notes, lowest=REFERENCE_PITCH - 12, highest=REFERENCE_PITCH + 12):
+    # The greedy inversions plus every close-position inversion inside the
+    # window, so the optimal path can never cost more than the greedy one.
+    notes = pad_voices(notes)
+    candidates = []
+    voicings = [normalized for _, normalized in inversion_table(notes)]
+    voicings.extend(close_voicings(notes, lowest, highest))
+    for voicing in voicings:
+        voicing = tuple(sorted(voicing))
+        if voicing not in candidates:
+            candidates.append(voicing)
+    return candidates
+
+
+def voice_distance(previous, current):
+    # Both voicings are sorted, which is the cheapest voice assignment.
+    return sum(abs(prev - curr) for prev, curr in zip(previous, current))
+
+
+def _viterbi(layers, start_costs, beam_width, closing=None):
+    beam = sorted(zip(start_costs, range(len(layers[0]))))[:beam_width]
+    back_pointers = [dict.fromkeys((index for _, index in beam), None)]
+
+    for t in range(1, len(layers)):
+        scores = []
+        for j, voicing in enumerate(layers[t]):
+            best_cost, best_index = None, None
+            for cost, i in beam:
+                cost += voice_distance(layers[t - 1][i], voicing)
+                if best_cost is None or cost < best_cost:
+                    best_cost, best_index = cost, i
+            scores.append((best_cost, j, best_index))
+        scores.sort()
+        beam = [(cost, j) for cost, j, _ in scores[:beam_width]]
+        back_pointers.append({j: i for _, j, i in scores[:beam_width]})
+
+    if closing is not None:
+        beam = [(cost + voice_distance(layers[-1][j], closing), j) for cost, j in beam]
+
+    total, j = min(beam)
+    path = []
+    for t in range(len(layers) - 1, -1, -1):
+        path.append(layers[t][j])
+        j = back_pointers[t][j]
+    path.reverse()
+    return total, path
+
+
+def optimal_voice_lead(chords, loop=False, previous=None, beam_width=DEFAULT_BEAM_WIDTH,
+                       lowest=REFERENCE_PITCH - 12, highest=REFERENCE_PITCH + 12):
+    """Voice-lead MIDI note lists minimizing total movement over the whole sequence.
+
+    Each chord may take any voicing from ``candidate_voicings`` within
+    ``lowest``..``highest``. Only the ``beam_width`` cheapest partial paths
+    survive each step, so cost stays linear in the number of chords. With
+    ``loop`` the move from the last chord back to the first is included.
+    """
+    layers = [candidate_voicings(notes, lowest, highest) for notes in chords]
+    if not layers:
+        return []
+
+    def start_costs(layer):
+        if previous is None:
+            return [0] * len(layer)
+        return [voice_distance(tuple(sorted(pad_voices(previous))), voicing) for voicing in layer]
+
+    if not loop:
+        return _viterbi(layers, start_costs(layers[0]), beam_width)[1]
+
+    best = None
+    for start, cost in zip(layers[0], start_costs(layers[0])):
+        total, path = _viterbi([[start]] + layers[1:], [cost], beam_width, closing=start)
+        if best is None or total < best[0]:
+            best = (total, path)
+    return best[1]